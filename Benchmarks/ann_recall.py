@@ -0,0 +1,76 @@
+"""
+Recall and latency of the IVF title index against brute-force search.
+
+Usage:
+    python -m Benchmarks.ann_recall --n-jobs 100000 --k 50
+    python -m Benchmarks.ann_recall --db Data/embeddings.db
+"""
+import argparse
+import time
+import numpy as np
+
+from Modules import utils
+from Modules.ann_index import IVFIndex
+from Modules.database import EmbeddingDB
+
+
+def synthetic_embeddings(n: int, dim: int = 384, n_clusters: int = 200, seed: int = 0) -> np.ndarray:
+    """
+    Normalized vectors drawn around random cluster centers, similar to MiniLM title embeddings.
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((n_clusters, dim)).astype(np.float32)
+    vectors = centers[rng.integers(n_clusters, size=n)] + 2.0 * rng.standard_normal((n, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def run(vectors: np.ndarray, k: int, n_queries: int, n_probes: list[int], seed: int = 0) -> list[dict]:
+    rng = np.random.default_rng(seed)
+    ids = np.arange(len(vectors))
+    queries = vectors[rng.choice(len(vectors), n_queries, replace=False)]
+
+    index = IVFIndex(vectors.shape[1], n_lists=max(1, int(np.sqrt(len(vectors)))))
+    index.train(vectors, seed=seed)
+    index.add(ids, vectors)
+
+    # Exact neighbours and brute-force latency
+    start = time.perf_counter()
+    exact = [set(ids[utils.top_k(vectors @ query, k)]) for query in queries]
+    brute_latency = (time.perf_counter() - start) / n_queries
+
+    results = [{'method': 'brute_force', 'n_probe': None, 'recall': 1.0, 'latency_ms': 1e3 * brute_latency}]
+    for n_probe in n_probes:
+        start = time.perf_counter()
+        found = [index.search(query, k, n_probe=n_probe)[0] for query in queries]
+        latency = (time.perf_counter() - start) / n_queries
+
+        recall = np.mean([len(expected.intersection(f.tolist())) / k for expected, f in zip(exact, found)])
+        results.append({'method': 'ivf', 'n_probe': n_probe, 'recall': float(recall), 'latency_ms': 1e3 * latency})
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--db', help='Use the title embeddings stored in this database')
+    parser.add_argument('--n-jobs', type=int, default=100000, help='Number of synthetic embeddings')
+    parser.add_argument('--k', type=int, default=50)
+    parser.add_argument('--n-queries', type=int, default=200)
+    parser.add_argument('--n-probes', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32])
+    args = parser.parse_args()
+
+    if args.db:
+        vectors = np.stack([
+            np.asarray(embeddings['title'], dtype=np.float32).reshape(-1)
+            for _, embeddings in EmbeddingDB(args.db).iter_job_embeddings(['title'])
+        ])
+    else:
+        vectors = synthetic_embeddings(args.n_jobs)
+
+    print(f"{'method':<12}{'n_probe':>8}{'recall@' + str(args.k):>12}{'latency ms':>12}")
+    for row in run(vectors, args.k, min(args.n_queries, len(vectors)), args.n_probes):
+        print(f"{row['method']:<12}{str(row['n_probe'] or '-'):>8}{row['recall']:>12.3f}{row['latency_ms']:>12.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""
+Rows/sec of EmbeddingDB.store_job_embeddings_batch against per-row store_job_embeddings.
+
+Usage:
+    python -m Benchmarks.bulk_write --n-jobs 5000 --chunk-size 1000
+"""
+import argparse
+import os
+import tempfile
+from types import SimpleNamespace
+
+import numpy as np
+
+from Benchmarks.common import measure
+from Modules.database import EmbeddingDB
+
+
+def synthetic_job_embeddings(n: int, title_dim: int = 384, content_dim: int = 1024, seed: int = 0):
+    """
+    Yield (job_id, embeddings) pairs shaped like job_embedder output.
+    """
+    rng = np.random.default_rng(seed)
+    for job_id in range(n):
+        work_type = np.zeros((1, 6), dtype=np.int32)
+        work_type[0, rng.integers(6)] = 1
+        yield job_id, SimpleNamespace(
+            title=rng.standard_normal((1, title_dim)).astype(np.float32),
+            content=rng.random((1, content_dim)),
+            work_type=work_type,
+        )
+
+
+def run(n_jobs: int, chunk_size: int, content_dim: int) -> dict:
+    rows = list(synthetic_job_embeddings(n_jobs, content_dim=content_dim))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        per_row_db = EmbeddingDB(os.path.join(tmp, 'per_row.db'))
+        per_row_time, _ = measure(lambda: [per_row_db.store_job_embeddings(job_id, e) for job_id, e in rows])
+
+        batch_db = EmbeddingDB(os.path.join(tmp, 'batch.db'))
+        batch_time, written = measure(batch_db.store_job_embeddings_batch, iter(rows), chunk_size=chunk_size)
+
+    return {
+        'n_jobs': n_jobs,
+        'chunk_size': chunk_size,
+        'rows_written': written,
+        'per_row_rows_per_sec': n_jobs / per_row_time,
+        'batch_rows_per_sec': n_jobs / batch_time,
+        'speedup': per_row_time / batch_time,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--n-jobs', type=int, default=5000)
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    parser.add_argument('--content-dim', type=int, default=1024)
+    args = parser.parse_args()
+
+    result = run(args.n_jobs, args.chunk_size, args.content_dim)
+    print(f"per-row:  {result['per_row_rows_per_sec']:10.1f} rows/sec")
+    print(f"batch:    {result['batch_rows_per_sec']:10.1f} rows/sec")
+    print(f"speedup:  {result['speedup']:10.2f}x")
+
+
+if __name__ == '__main__':
+    main()
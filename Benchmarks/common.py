@@ -0,0 +1,95 @@
+import time
+import random
+
+import numpy as np
+
+from Models.models import job, user
+from Modules.model_handlers import model_loader
+
+WORK_TYPES = ['CONTRACT', 'FULL_TIME', 'INTERNSHIP', 'PART_TIME', 'TEMPORARY', 'VOLUNTEER']
+
+loader = model_loader()
+_vocabulary = None
+
+
+def vocabulary() -> list[str]:
+    """
+    Words of the bundled TF-IDF vectorizer, used to generate realistic synthetic text.
+    """
+    global _vocabulary
+    if _vocabulary is None:
+        tfidf = loader.load_vectorizer('jobs_tfidf.pkl', model_type='sklearn')
+        _vocabulary = sorted(tfidf.vocabulary_.keys())
+    return _vocabulary
+
+
+def synthetic_text(rng: random.Random, n_words: int) -> str:
+    return ' '.join(rng.choices(vocabulary(), k=n_words))
+
+
+def synthetic_jobs(n: int, seed: int = 0, content_words: int = 200) -> list[job]:
+    """
+    Generate `n` synthetic job postings.
+    """
+    rng = random.Random(seed)
+    return [
+        job(job_id=i,
+            title=synthetic_text(rng, rng.randint(2, 6)),
+            content=synthetic_text(rng, content_words),
+            work_type=rng.choice(WORK_TYPES))
+        for i in range(n)
+    ]
+
+
+def synthetic_users(n: int, seed: int = 0, about_words: int = 120) -> list[user]:
+    """
+    Generate `n` synthetic user profiles.
+    """
+    rng = random.Random(seed)
+    return [
+        user(user_id=i,
+             title=synthetic_text(rng, rng.randint(2, 5)),
+             about=synthetic_text(rng, about_words),
+             preferred_work_types=rng.sample(WORK_TYPES, rng.randint(1, 3)),
+             experience_level=None,
+             expected_salary=None,
+             skills=rng.sample(vocabulary(), 5))
+        for i in range(n)
+    ]
+
+
+def measure(func, *args, **kwargs) -> tuple[float, object]:
+    """
+    Run `func` once and return the elapsed wall time in seconds with its result.
+    """
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def timings(func, repeats: int, *args, **kwargs) -> list[float]:
+    """
+    Run `func` `repeats` times and return every elapsed wall time in seconds.
+    """
+    samples = []
+    for _ in range(repeats):
+        elapsed, _ = measure(func, *args, **kwargs)
+        samples.append(elapsed)
+    return samples
+
+
+def percentiles(samples: list[float]) -> dict:
+    """
+    Latency summary in milliseconds, suitable for comparing runs across commits.
+    """
+    samples_ms = np.asarray(samples, dtype=np.float64) * 1000
+    p50, p95, p99 = np.percentile(samples_ms, [50, 95, 99])
+    return {
+        'n': len(samples_ms),
+        'mean_ms': float(samples_ms.mean()),
+        'min_ms': float(samples_ms.min()),
+        'p50_ms': float(p50),
+        'p95_ms': float(p95),
+        'p99_ms': float(p99),
+        'max_ms': float(samples_ms.max()),
+    }
@@ -0,0 +1,47 @@
+"""
+Throughput of ModelEmbedder.embed_batch against embedding one object at a time.
+
+Usage:
+    python -m Benchmarks.embed_batch --n-jobs 2000 --batch-size 64
+"""
+import argparse
+
+from Benchmarks.common import synthetic_jobs, measure
+from Modules.preprocessor import job_embedder
+
+
+def run(n_jobs: int, batch_size: int) -> dict:
+    embedder = job_embedder()
+    jobs = synthetic_jobs(n_jobs)
+
+    # Warm up both code paths so model initialization is not measured
+    embedder.embed_batch([j.model_copy() for j in jobs[:batch_size]], batch_size=batch_size)
+
+    loop_time, _ = measure(lambda objs: [embedder.embed(obj) for obj in objs],
+                           [j.model_copy() for j in jobs])
+    batch_time, _ = measure(embedder.embed_batch,
+                            [j.model_copy() for j in jobs], batch_size=batch_size)
+
+    return {
+        'n_jobs': n_jobs,
+        'batch_size': batch_size,
+        'loop_jobs_per_sec': n_jobs / loop_time,
+        'batch_jobs_per_sec': n_jobs / batch_time,
+        'speedup': loop_time / batch_time,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--n-jobs', type=int, default=2000)
+    parser.add_argument('--batch-size', type=int, default=64)
+    args = parser.parse_args()
+
+    result = run(args.n_jobs, args.batch_size)
+    print(f"per-object loop: {result['loop_jobs_per_sec']:10.1f} jobs/sec")
+    print(f"embed_batch:     {result['batch_jobs_per_sec']:10.1f} jobs/sec")
+    print(f"speedup:         {result['speedup']:10.2f}x")
+
+
+if __name__ == '__main__':
+    main()
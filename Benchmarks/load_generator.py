@@ -0,0 +1,135 @@
+"""
+Closed-loop HTTP load generator for the recommendation service.
+
+Each of `concurrency` keep-alive connections sends requests back to back for
+`duration` seconds; latency percentiles, QPS and status counts are reported.
+
+Usage:
+    python -m Modules.service --db Data/embeddings.db --port 8080
+    python -m Benchmarks.load_generator --port 8080 --scenario recommend_job --jobs 1000
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import time
+from collections import Counter
+
+from Benchmarks.common import synthetic_jobs, synthetic_users, percentiles
+
+
+def request_factory(scenario: str, n_jobs: int, n_users: int, n_candidates: int, seed: int):
+    """
+    Function returning the (path, body) of the next request of a scenario.
+    """
+    rng = random.Random(seed)
+
+    # New objects get ids after the stored ones, generated one at a time
+    ids = itertools.count(seed * 1_000_000)
+
+    if scenario == 'store_job':
+        def next_job():
+            job_id = next(ids)
+            return '/jobs', synthetic_jobs(1, job_id)[0].model_copy(update={'job_id': n_jobs + job_id}).model_dump()
+        return next_job
+
+    if scenario == 'store_user':
+        def next_user():
+            user_id = next(ids)
+            return '/users', synthetic_users(1, user_id)[0].model_copy(update={'user_id': n_users + user_id}).model_dump()
+        return next_user
+
+    def candidates():
+        return rng.sample(range(n_jobs), min(n_candidates, n_jobs))
+
+    if scenario == 'recommend_job':
+        return lambda: ('/recommend/job', {'job_id': rng.randrange(n_jobs), 'jobs_ids': candidates(), 'top_k': 10})
+
+    if scenario == 'recommend_user':
+        return lambda: ('/recommend/user', {'user_id': rng.randrange(n_users), 'jobs_ids': candidates(), 'top_k': 10})
+
+    raise ValueError(f"Unknown scenario: {scenario}")
+
+
+async def send(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, host: str, path: str, body: dict) -> int:
+    payload = json.dumps(body).encode()
+    writer.write(
+        f'POST {path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n'
+        f'Content-Length: {len(payload)}\r\n\r\n'.encode() + payload
+    )
+    await writer.drain()
+
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while (line := await reader.readline()) not in (b'\r\n', b''):
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.strip().lower() == 'content-length':
+            length = int(value)
+    await reader.readexactly(length)
+    return status
+
+
+async def client(host: str, port: int, next_request, deadline: float, latencies: list, statuses: Counter):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while time.perf_counter() < deadline:
+            path, body = next_request()
+            start = time.perf_counter()
+            status = await send(reader, writer, host, path, body)
+            latencies.append(time.perf_counter() - start)
+            statuses[status] += 1
+    finally:
+        writer.close()
+
+
+async def run(host: str, port: int, scenario: str, concurrency: int, duration: float,
+              n_jobs: int, n_users: int, n_candidates: int, seed: int) -> dict:
+    next_request = request_factory(scenario, n_jobs, n_users, n_candidates, seed)
+    latencies, statuses = [], Counter()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(host, port, next_request, start + duration, latencies, statuses)
+                           for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    return {
+        'scenario': scenario,
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'qps': len(latencies) / elapsed,
+        'latency': percentiles(latencies) if latencies else None,
+        'statuses': {str(status): count for status, count in sorted(statuses.items())},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--scenario', choices=['store_job', 'store_user', 'recommend_job', 'recommend_user'],
+                        default='recommend_job')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds of load')
+    parser.add_argument('--jobs', type=int, default=1000, help='Job ids 0..N-1 stored in the service')
+    parser.add_argument('--users', type=int, default=100, help='User ids 0..N-1 stored in the service')
+    parser.add_argument('--candidates', type=int, default=500, help='Candidate jobs per recommendation')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='JSON results file')
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args.host, args.port, args.scenario, args.concurrency, args.duration,
+                             args.jobs, args.users, args.candidates, args.seed))
+
+    latency = result['latency'] or {}
+    print(f"{result['requests']} requests, {result['qps']:.1f} QPS, "
+          f"p50 {latency.get('p50_ms', float('nan')):.2f} ms, p99 {latency.get('p99_ms', float('nan')):.2f} ms, "
+          f"statuses {result['statuses']}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
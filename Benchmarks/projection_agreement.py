@@ -0,0 +1,114 @@
+"""
+Ranking agreement and storage size of SVD-projected content embeddings against raw TF-IDF.
+
+Each configuration fits a projection of the stored content embeddings, rebuilds
+a copy of the database with it, then compares the top-k of every query, for the
+content feature and for the weighted job_recommend ranking, with the raw database.
+
+Usage:
+    python -m Benchmarks.projection_agreement --n-jobs 2000 --components 64 128 256
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+
+import numpy as np
+
+from Benchmarks.common import synthetic_jobs, timings, percentiles
+from Benchmarks.quantization_accuracy import overlap, column_bytes
+from Models.models import weights
+from Modules import utils
+from Modules.database import EmbeddingDB
+from Modules.model_handlers import registry
+from Modules.preprocessor import job_embedder
+from Modules.projection import stored_content, fit_projection, rebuild
+from Modules.recommender import job_recommender
+
+
+def evaluate(db: EmbeddingDB, reference: EmbeddingDB, job_ids: list[int], queries: list[int], k: int) -> dict:
+    recommender, full = job_recommender(db), job_recommender(reference)
+    recommender_weights = weights()
+
+    options = db.get_jobs_column_embeddings(job_ids, 'content')
+    reference_options = reference.get_jobs_column_embeddings(job_ids, 'content')
+    overlaps = [
+        overlap(utils.top_k(utils.similarity(reference.get_job_embeddings(query)['content'], reference_options), k),
+                utils.top_k(utils.similarity(db.get_job_embeddings(query)['content'], options), k))
+        for query in queries
+    ]
+    ranking = [
+        overlap(full.job_recommend(query, job_ids, recommender_weights, top_k=k)[0],
+                recommender.job_recommend(query, job_ids, recommender_weights, top_k=k)[0])
+        for query in queries
+    ]
+
+    return {
+        'content_overlap_at_k': float(np.mean(overlaps)),
+        'ranking_overlap_at_k': float(np.mean(ranking)),
+        'content_bytes_per_row': column_bytes(db, 'content'),
+        'latency': percentiles(timings(recommender.job_recommend, 5, queries[0], job_ids, recommender_weights, top_k=k)),
+    }
+
+
+def run(n_jobs: int, n_queries: int, k: int, components: list[int], sparse: bool,
+        title_vectorizer: str, seed: int) -> dict:
+    vectorizers = {'title': registry.get('content_vectorizer')} if title_vectorizer == 'tfidf' else dict()
+    jobs = job_embedder(vectorizers=vectorizers, sparse=sparse).embed_batch(synthetic_jobs(n_jobs, seed))
+    job_ids = [j.job_id for j in jobs]
+    queries = random.Random(seed).sample(job_ids, min(n_queries, n_jobs))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        reference_path = os.path.join(tmp, 'raw.db')
+        reference = EmbeddingDB(reference_path)
+        reference.store_job_embeddings_batch((j.job_id, j) for j in jobs)
+        vectors = stored_content(reference)
+
+        results = {'raw': evaluate(reference, reference, job_ids, queries, k)}
+        for n_components in components:
+            projection = fit_projection(vectors, n_components, seed)
+
+            path = os.path.join(tmp, f'svd{n_components}.db')
+            shutil.copy(reference_path, path)
+            db = EmbeddingDB(path)
+            rebuild(db, projection)
+
+            results[f'svd={projection.n_components}'] = {
+                **evaluate(db, reference, job_ids, queries, k),
+                'explained_variance': float(projection.explained_variance_ratio_.sum()),
+            }
+
+    return {'n_jobs': n_jobs, 'n_queries': len(queries), 'k': k, 'sparse': sparse, 'configurations': results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--n-jobs', type=int, default=2000)
+    parser.add_argument('--n-queries', type=int, default=50)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--components', type=int, nargs='+', default=[64, 128, 256])
+    parser.add_argument('--dense', dest='sparse', action='store_false',
+                        help='Store raw TF-IDF embeddings dense instead of sparse')
+    parser.add_argument('--title-vectorizer', choices=['minilm', 'tfidf'], default='minilm',
+                        help='Use TF-IDF for titles where the MiniLM weights are unavailable')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='JSON results file')
+    args = parser.parse_args()
+
+    result = run(args.n_jobs, args.n_queries, args.k, args.components, args.sparse, args.title_vectorizer, args.seed)
+
+    print(f"{'configuration':<14} {'content@k':>10} {'ranking@k':>10} {'variance':>9} {'content B':>10} {'p50 ms':>8}")
+    for name, metrics in result['configurations'].items():
+        print(f"{name:<14} {metrics['content_overlap_at_k']:10.3f} {metrics['ranking_overlap_at_k']:10.3f} "
+              f"{metrics.get('explained_variance', 1.0):9.3f} {metrics['content_bytes_per_row']:10.0f} "
+              f"{metrics['latency']['p50_ms']:8.2f}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
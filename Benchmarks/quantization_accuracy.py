@@ -0,0 +1,126 @@
+"""
+Ranking overlap and storage size of float16 / int8 jobs columns against full precision.
+
+Each configuration stores the same embedded jobs with some columns quantized,
+then compares the top-k of every query, per feature and for the weighted
+job_recommend ranking, with the full precision database.
+
+Usage:
+    python -m Benchmarks.quantization_accuracy --n-jobs 500 --k 10
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+
+import numpy as np
+
+from Benchmarks.common import synthetic_jobs, timings, percentiles
+from Models.models import weights
+from Modules import utils
+from Modules.database import EmbeddingDB
+from Modules.model_handlers import registry
+from Modules.preprocessor import job_embedder
+from Modules.recommender import job_recommender
+
+FEATURES = ['title', 'content']
+MODES = ['float16', 'int8']
+
+
+def configurations() -> dict[str, dict[str, str]]:
+    configs = {f'{feature}={mode}': {feature: mode} for feature in FEATURES for mode in MODES}
+    configs.update({f'all={mode}': {feature: mode for feature in FEATURES} for mode in MODES})
+    return configs
+
+
+def overlap(expected: np.ndarray, actual: np.ndarray) -> float:
+    return len(set(expected.tolist()) & set(actual.tolist())) / max(len(expected), 1)
+
+
+def column_bytes(db: EmbeddingDB, column: str) -> float:
+    with db._connection() as conn:
+        return conn.execute(f'SELECT AVG(LENGTH({column})) FROM jobs').fetchone()[0]
+
+
+def evaluate(db: EmbeddingDB, reference: EmbeddingDB, job_ids: list[int], queries: list[int], k: int) -> dict:
+    recommender, full = job_recommender(db), job_recommender(reference)
+    recommender_weights = weights()
+    result = dict()
+
+    for feature in FEATURES:
+        options = db.get_jobs_column_embeddings(job_ids, feature)
+        reference_options = reference.get_jobs_column_embeddings(job_ids, feature)
+        overlaps, errors = [], []
+
+        for query in queries:
+            base = reference.get_job_embeddings(query)[feature]
+            expected = utils.similarity(base, reference_options)
+            actual = utils.similarity(base, options)
+            overlaps.append(overlap(utils.top_k(expected, k), utils.top_k(actual, k)))
+            errors.append(np.abs(expected - actual).max())
+
+        result[feature] = {
+            'overlap_at_k': float(np.mean(overlaps)),
+            'max_abs_score_error': float(np.max(errors)),
+            'bytes_per_row': column_bytes(db, feature),
+        }
+
+    overlaps = [
+        overlap(full.job_recommend(query, job_ids, recommender_weights, top_k=k)[0],
+                recommender.job_recommend(query, job_ids, recommender_weights, top_k=k)[0])
+        for query in queries
+    ]
+    result['job_recommend'] = {
+        'overlap_at_k': float(np.mean(overlaps)),
+        'latency': percentiles(timings(recommender.job_recommend, 5, queries[0], job_ids, recommender_weights, top_k=k)),
+    }
+    return result
+
+
+def run(n_jobs: int, n_queries: int, k: int, title_vectorizer: str, seed: int) -> dict:
+    vectorizers = {'title': registry.get('content_vectorizer')} if title_vectorizer == 'tfidf' else dict()
+    jobs = job_embedder(vectorizers=vectorizers).embed_batch(synthetic_jobs(n_jobs, seed))
+    job_ids = [j.job_id for j in jobs]
+    queries = random.Random(seed).sample(job_ids, min(n_queries, n_jobs))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        reference = EmbeddingDB(os.path.join(tmp, 'full.db'))
+        reference.store_job_embeddings_batch((j.job_id, j) for j in jobs)
+
+        results = {'full': evaluate(reference, reference, job_ids, queries, k)}
+        for name, quantize in configurations().items():
+            db = EmbeddingDB(os.path.join(tmp, f'{name}.db'), quantize=quantize)
+            db.store_job_embeddings_batch((j.job_id, j) for j in jobs)
+            results[name] = evaluate(db, reference, job_ids, queries, k)
+
+    return {'n_jobs': n_jobs, 'n_queries': len(queries), 'k': k, 'configurations': results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--n-jobs', type=int, default=500)
+    parser.add_argument('--n-queries', type=int, default=50)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--title-vectorizer', choices=['minilm', 'tfidf'], default='minilm',
+                        help='Use TF-IDF for titles where the MiniLM weights are unavailable')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='JSON results file')
+    args = parser.parse_args()
+
+    result = run(args.n_jobs, args.n_queries, args.k, args.title_vectorizer, args.seed)
+
+    print(f"{'configuration':<16} {'title@k':>8} {'content@k':>10} {'ranking@k':>10} "
+          f"{'title B':>9} {'content B':>10} {'p50 ms':>8}")
+    for name, metrics in result['configurations'].items():
+        print(f"{name:<16} {metrics['title']['overlap_at_k']:8.3f} {metrics['content']['overlap_at_k']:10.3f} "
+              f"{metrics['job_recommend']['overlap_at_k']:10.3f} {metrics['title']['bytes_per_row']:9.0f} "
+              f"{metrics['content']['bytes_per_row']:10.0f} {metrics['job_recommend']['latency']['p50_ms']:8.2f}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+Latency and agreement of the quantized MiniLM title encoder against the fp32 SentenceTransformer.
+
+Usage:
+    python -m Benchmarks.quantized_title_encoder --n-titles 512 --threads 4
+"""
+import argparse
+import json
+import random
+
+import numpy as np
+
+from Benchmarks.common import synthetic_text, measure, percentiles
+from Modules.model_handlers import model_loader, vectorizers_path, embed
+
+loader = model_loader()
+
+
+def synthetic_titles(n: int, seed: int = 0) -> list[str]:
+    rng = random.Random(seed)
+    return [synthetic_text(rng, rng.randint(2, 8)) for _ in range(n)]
+
+
+def latency(model, titles: list[str], batch_size: int) -> dict:
+    # Warm up so lazy initialization is not measured
+    embed(model, titles[:batch_size], batch_size=batch_size)
+
+    single = [measure(embed, model, [title])[0] for title in titles]
+    batched = [measure(embed, model, titles[start:start + batch_size], batch_size=batch_size)[0]
+               for start in range(0, len(titles), batch_size)]
+
+    return {
+        'single': percentiles(single),
+        'batched': {**percentiles(batched), 'batch_size': batch_size, 'titles_per_sec': len(titles) / sum(batched)},
+    }
+
+
+def run(path: str, n_titles: int, batch_size: int, threads: int, min_cosine: float, seed: int) -> dict:
+    titles = synthetic_titles(n_titles, seed)
+
+    quantized = loader.load_quantized_sentence_transformer(path, num_threads=threads, min_cosine=min_cosine)
+    fp32 = loader.load_sentence_transformer(path)
+
+    expected = embed(fp32, titles, batch_size=batch_size)
+    actual = embed(quantized, titles, batch_size=batch_size)
+    cosine = np.sum(expected * actual, axis=1) / (np.linalg.norm(expected, axis=1) * np.linalg.norm(actual, axis=1))
+
+    fp32_latency = latency(fp32, titles, batch_size)
+    quantized_latency = latency(quantized, titles, batch_size)
+
+    return {
+        'n_titles': n_titles,
+        'threads': threads,
+        'cosine': {'min': float(cosine.min()), 'mean': float(cosine.mean()), 'tolerance': min_cosine,
+                   'calibration_min': quantized.cosine},
+        'fp32': fp32_latency,
+        'quantized': quantized_latency,
+        'single_p50_speedup': fp32_latency['single']['p50_ms'] / quantized_latency['single']['p50_ms'],
+        'batched_speedup': quantized_latency['batched']['titles_per_sec'] / fp32_latency['batched']['titles_per_sec'],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--model-path', default=vectorizers_path + 'MiniLM')
+    parser.add_argument('--n-titles', type=int, default=512)
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--threads', type=int, default=None, help='Intra-op threads (torch default when omitted)')
+    parser.add_argument('--min-cosine', type=float, default=0.99)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='JSON results file')
+    args = parser.parse_args()
+
+    result = run(args.model_path, args.n_titles, args.batch_size, args.threads, args.min_cosine, args.seed)
+    print(f"cosine to fp32:   min {result['cosine']['min']:.4f}, mean {result['cosine']['mean']:.4f}")
+    for name in ('fp32', 'quantized'):
+        print(f"{name:<9} single p50 {result[name]['single']['p50_ms']:7.2f} ms, "
+              f"p99 {result[name]['single']['p99_ms']:7.2f} ms, "
+              f"batched {result[name]['batched']['titles_per_sec']:8.1f} titles/sec")
+    print(f"speedup:  single {result['single_p50_speedup']:.2f}x, batched {result['batched_speedup']:.2f}x")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""
+Ranking latency of the sharded job store from 1 to N shards and workers, against one database.
+
+The same jobs are stored once unsharded and once per shard count; every
+configuration ranks the same candidates for the same users and reports
+p50/p95/p99 latency, speedup over the unsharded path and whether the rankings agree.
+
+Usage:
+    python -m Benchmarks.sharding_scaling --n-jobs 20000 --shards 1 2 4 8
+    python -m Benchmarks.sharding_scaling --executor thread --shards 2 4
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+
+from Benchmarks.common import synthetic_jobs, synthetic_users, timings, percentiles
+from Benchmarks.suite import populate
+from Models.models import weights
+from Modules.database import EmbeddingDB
+from Modules.model_handlers import registry
+from Modules.preprocessor import job_embedder, user_embedder
+from Modules.recommender import job_recommender
+from Modules.sharding import ShardedJobStore, sharded_job_recommender
+
+
+def latency(recommender, user_ids: list[int], candidates: list[int], top_k: int, repeats: int) -> dict:
+    recommender_weights = weights()
+    samples = [
+        sample
+        for user_id in user_ids
+        for sample in timings(recommender.user_job_recommend, repeats, user_id, candidates, recommender_weights,
+                              top_k=top_k)
+    ]
+    return percentiles(samples)
+
+
+def agreement(reference, recommender, user_ids: list[int], candidates: list[int], top_k: int) -> bool:
+    recommender_weights = weights()
+    return all(
+        np.array_equal(reference.user_job_recommend(user_id, candidates, recommender_weights, top_k=top_k)[0],
+                       recommender.user_job_recommend(user_id, candidates, recommender_weights, top_k=top_k)[0])
+        for user_id in user_ids
+    )
+
+
+def run(args) -> dict:
+    vectorizers = {'title': registry.get('content_vectorizer')} if args.title_vectorizer == 'tfidf' else dict()
+    pool = job_embedder(vectorizers=dict(vectorizers), sparse=args.sparse).embed_batch(
+        synthetic_jobs(args.pool_size, args.seed))
+    users = user_embedder(vectorizers=dict(vectorizers), sparse=args.sparse).embed_batch(
+        synthetic_users(args.n_users, args.seed))
+
+    rng = random.Random(args.seed)
+    candidates = rng.sample(range(args.n_jobs), min(args.candidates, args.n_jobs))
+    user_ids = [u.user_id for u in users]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = EmbeddingDB(os.path.join(tmp, 'single.db'), pooled=True)
+        populate(db, pool, args.n_jobs, users)
+        reference = job_recommender(db)
+
+        baseline = latency(reference, user_ids, candidates, args.top_k, args.repeats)
+        results = {'unsharded': baseline}
+
+        for n_shards in args.shards:
+            store = ShardedJobStore.in_directory(os.path.join(tmp, f'shards-{n_shards}'), n_shards)
+            store.store_job_embeddings_batch((job_id, pool[job_id % len(pool)]) for job_id in range(args.n_jobs))
+
+            # The default executor of the recommender is used when None
+            executors = {'process': ProcessPoolExecutor, 'thread': ThreadPoolExecutor}
+            executor = executors[args.executor](n_shards) if args.executor in executors else None
+            recommender = sharded_job_recommender(db, store, executor=executor)
+            try:
+                result = latency(recommender, user_ids, candidates, args.top_k, args.repeats)
+                results[f'shards={n_shards}'] = {
+                    **result,
+                    'speedup_p50': baseline['p50_ms'] / result['p50_ms'],
+                    'rankings_agree': agreement(reference, recommender, user_ids, candidates, args.top_k),
+                }
+            finally:
+                recommender.close()
+                if executor is not None:
+                    executor.shutdown()
+                store.close()
+
+    return {'n_jobs': args.n_jobs, 'candidates': len(candidates), 'executor': args.executor,
+            'cpus': os.cpu_count(), 'configurations': results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--n-jobs', type=int, default=20000, help='Jobs stored')
+    parser.add_argument('--candidates', type=int, default=20000, help='Candidate jobs per request')
+    parser.add_argument('--shards', type=int, nargs='+', default=[1, 2, 4, 8],
+                        help='Shard counts, each ranked with one worker per shard')
+    parser.add_argument('--executor', choices=['default', 'thread', 'process'], default='default')
+    parser.add_argument('--top-k', type=int, default=10)
+    parser.add_argument('--repeats', type=int, default=5, help='Timed runs per user')
+    parser.add_argument('--pool-size', type=int, default=2000, help='Distinct embedded jobs stored')
+    parser.add_argument('--n-users', type=int, default=5)
+    parser.add_argument('--dense', dest='sparse', action='store_false',
+                        help='Store TF-IDF embeddings dense instead of sparse')
+    parser.add_argument('--title-vectorizer', choices=['minilm', 'tfidf'], default='minilm',
+                        help='Use TF-IDF for titles where the MiniLM weights are unavailable')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='JSON results file')
+    args = parser.parse_args()
+
+    result = run(args)
+
+    print(f"{'configuration':<12} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'speedup':>8} {'agree':>6}")
+    for name, metrics in result['configurations'].items():
+        print(f"{name:<12} {metrics['p50_ms']:8.2f} {metrics['p95_ms']:8.2f} {metrics['p99_ms']:8.2f} "
+              f"{metrics.get('speedup_p50', 1.0):8.2f} {str(metrics.get('rankings_agree', True)):>6}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
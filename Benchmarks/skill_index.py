@@ -0,0 +1,122 @@
+"""
+Skill candidate generation and skill scoring with the inverted index, against a scan of every job's terms.
+
+Every user's skills are matched against all stored jobs twice: through the
+posting lists of a SkillIndex, and by testing the terms of every job read
+from the skill_terms column. Reports p50/p95/p99 latency of both paths, the
+index build time and size, and whether the results agree.
+
+Usage:
+    python -m Benchmarks.skill_index --n-jobs 20000 --n-users 20
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+
+import numpy as np
+
+from Benchmarks.common import synthetic_jobs, synthetic_users, vocabulary, measure, timings, percentiles
+from Benchmarks.suite import populate
+from Modules import skills
+from Modules.database import EmbeddingDB
+from Modules.model_handlers import registry
+from Modules.preprocessor import job_embedder, user_embedder
+from Modules.skill_index import SkillIndex
+
+
+def scan_candidates(forward: dict, terms: np.ndarray) -> np.ndarray:
+    matched = [job_id for job_id, job_terms in forward.items() if skills.contains(job_terms, terms).any()]
+    return np.array(sorted(matched), dtype=skills.ID_DTYPE)
+
+
+def scan_scores(forward: dict, job_ids: np.ndarray, terms: np.ndarray) -> np.ndarray:
+    return np.array([skills.contains(forward[job_id], terms).sum() / max(len(terms), 1) for job_id in job_ids],
+                    dtype=np.float32)
+
+
+def run(args) -> dict:
+    # Known skills of one or two words, listed by jobs and users and also found in the job texts
+    rng = random.Random(args.seed)
+    words = vocabulary()
+    known = list(dict.fromkeys(' '.join(rng.sample(words, rng.randint(1, 2))) for _ in range(args.n_skills)))
+
+    raw = synthetic_jobs(args.pool_size, args.seed)
+    for job in raw:
+        job.skills = rng.sample(known, rng.randint(0, 8))
+    raw_users = synthetic_users(args.n_users, args.seed)
+    for user in raw_users:
+        user.skills = rng.sample(known, 5)
+
+    vectorizers = {'title': registry.get('content_vectorizer')} if args.title_vectorizer == 'tfidf' else dict()
+    pool = job_embedder(vectorizers=dict(vectorizers), skill_vocabulary=skills.skill_vocabulary(known)).embed_batch(raw)
+    users = user_embedder(vectorizers=dict(vectorizers)).embed_batch(raw_users)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = EmbeddingDB(os.path.join(tmp, 'embeddings.db'))
+        populate(db, pool, args.n_jobs, users)
+
+        build_s, index = measure(SkillIndex, db)
+        forward = {job_id: terms for job_id, terms in db.iter_job_skill_terms()}
+        user_terms = [skills.term_ids(user_skills) for user_skills in db.get_users_skills([u.user_id for u in users])]
+
+    job_ids = np.array(sorted(forward), dtype=skills.ID_DTYPE)
+    options = index.skill_sets(job_ids)
+    agree = all(
+        np.array_equal(index.candidates(terms), scan_candidates(forward, terms))
+        and np.allclose(skills.scores([terms], options)[0], scan_scores(forward, job_ids, terms))
+        for terms in user_terms
+    )
+
+    def latency(func, *func_args) -> dict:
+        return percentiles([sample for terms in user_terms
+                            for sample in timings(func, args.repeats, *func_args, terms)])
+
+    return {
+        'n_jobs': args.n_jobs,
+        'n_users': args.n_users,
+        'postings': len(index),
+        'build_s': build_s,
+        'agree': agree,
+        'candidates': {
+            'index': latency(index.candidates),
+            'scan': latency(scan_candidates, forward),
+        },
+        'scores': {
+            'index': latency(lambda terms: skills.scores([terms], options)),
+            'scan': latency(scan_scores, forward, job_ids),
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--n-jobs', type=int, default=20000, help='Jobs stored')
+    parser.add_argument('--n-users', type=int, default=20, help='Users whose skills are matched')
+    parser.add_argument('--pool-size', type=int, default=2000, help='Distinct embedded jobs stored')
+    parser.add_argument('--n-skills', type=int, default=500, help='Known skills listed by jobs and users')
+    parser.add_argument('--repeats', type=int, default=3, help='Timed runs per user')
+    parser.add_argument('--title-vectorizer', choices=['minilm', 'tfidf'], default='minilm',
+                        help='Use TF-IDF for titles where the MiniLM weights are unavailable')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='JSON results file')
+    args = parser.parse_args()
+
+    result = run(args)
+
+    print(f"{result['n_jobs']} jobs, {result['postings']} postings, built in {result['build_s']:.2f} s, "
+          f"agree: {result['agree']}")
+    print(f"{'operation':<12} {'path':<6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for operation in ('candidates', 'scores'):
+        for path, summary in result[operation].items():
+            print(f"{operation:<12} {path:<6} {summary['p50_ms']:9.2f} {summary['p95_ms']:9.2f} "
+                  f"{summary['p99_ms']:9.2f}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+"""
+Cold start and memory of recommender workers loading jobs from SQLite or from a mapped snapshot.
+
+The same database is exported once as a columnar snapshot. For every mode,
+`--workers` fresh interpreters start together, load the jobs (a JobIndex
+decoded from SQLite, or a SnapshotIndex mapping the snapshot), rank every job
+for one user and report the time to that first ranking. Memory is read while
+all workers of a mode are alive: private memory grows with every worker,
+pages shared through the page cache are only counted once by PSS.
+
+Usage:
+    python -m Benchmarks.snapshot_startup --n-jobs 20000 --workers 4
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from Benchmarks.common import synthetic_jobs, synthetic_users
+from Benchmarks.suite import populate
+from Modules.consts import workspace_dir
+from Modules.database import EmbeddingDB
+from Modules.model_handlers import registry
+from Modules.preprocessor import job_embedder, user_embedder
+from Modules.snapshot import export_snapshot
+
+LOADERS = {
+    'sqlite': '''
+from Modules.job_index import JobIndex
+index = JobIndex(db)
+''',
+    'snapshot': '''
+from Modules.snapshot import SnapshotIndex
+index = SnapshotIndex({root!r})
+''',
+}
+
+# Loads, ranks once, then waits for the parent before reading its memory
+WORKER = '''
+import json, sys, time
+start = time.perf_counter()
+from Models.models import weights
+from Modules.database import EmbeddingDB
+from Modules.recommender import job_recommender
+db = EmbeddingDB({db_path!r})
+{loader}
+loaded = time.perf_counter() - start
+recommender = job_recommender(db, index=index)
+recommender.user_job_recommend({user_id}, list(range({n_jobs})), weights(), top_k=10)
+print(json.dumps({{'load_s': loaded, 'first_ranking_s': time.perf_counter() - start}}), flush=True)
+
+sys.stdin.readline()
+memory = dict()
+with open('/proc/self/smaps_rollup') as smaps:
+    for line in smaps:
+        key, _, value = line.partition(':')
+        if key in ('Rss', 'Pss', 'Private_Clean', 'Private_Dirty', 'Shared_Clean'):
+            memory[key] = int(value.split()[0]) / 1024
+print(json.dumps(memory), flush=True)
+'''
+
+
+def run_mode(code: str, n_workers: int) -> dict:
+    workers = [
+        subprocess.Popen([sys.executable, '-c', code], cwd=workspace_dir, text=True,
+                         stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        for _ in range(n_workers)
+    ]
+    try:
+        startup = [json.loads(worker.stdout.readline()) for worker in workers]
+        for worker in workers:
+            worker.stdin.write('\n')
+            worker.stdin.flush()
+        memory = [json.loads(worker.stdout.readline()) for worker in workers]
+    finally:
+        for worker in workers:
+            worker.wait()
+
+    def mean(samples, key):
+        return sum(sample[key] for sample in samples) / len(samples)
+
+    return {
+        'load_s': mean(startup, 'load_s'),
+        'first_ranking_s': mean(startup, 'first_ranking_s'),
+        'rss_mb': mean(memory, 'Rss'),
+        'pss_mb': mean(memory, 'Pss'),
+        'private_mb': mean(memory, 'Private_Clean') + mean(memory, 'Private_Dirty'),
+    }
+
+
+def run(args) -> dict:
+    vectorizers = {'title': registry.get('content_vectorizer')} if args.title_vectorizer == 'tfidf' else dict()
+    pool = job_embedder(vectorizers=dict(vectorizers), sparse=args.sparse).embed_batch(
+        synthetic_jobs(args.pool_size, args.seed))
+    users = user_embedder(vectorizers=dict(vectorizers), sparse=args.sparse).embed_batch(
+        synthetic_users(1, args.seed))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'embeddings.db')
+        populate(EmbeddingDB(db_path), pool, args.n_jobs, users)
+        root = os.path.join(tmp, 'snapshots')
+        export_snapshot(EmbeddingDB(db_path), root)
+
+        results = dict()
+        for mode in args.modes:
+            code = WORKER.format(db_path=db_path, loader=LOADERS[mode].format(root=root),
+                                 user_id=users[0].user_id, n_jobs=args.n_jobs)
+            results[mode] = run_mode(code, args.workers)
+
+    return {'n_jobs': args.n_jobs, 'workers': args.workers, 'modes': results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--n-jobs', type=int, default=20000, help='Jobs stored')
+    parser.add_argument('--workers', type=int, default=4, help='Worker processes started together')
+    parser.add_argument('--modes', nargs='+', choices=list(LOADERS), default=list(LOADERS))
+    parser.add_argument('--pool-size', type=int, default=2000, help='Distinct embedded jobs stored')
+    parser.add_argument('--dense', dest='sparse', action='store_false',
+                        help='Store TF-IDF embeddings dense instead of sparse')
+    parser.add_argument('--title-vectorizer', choices=['minilm', 'tfidf'], default='minilm',
+                        help='Use TF-IDF for titles where the MiniLM weights are unavailable')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='JSON results file')
+    args = parser.parse_args()
+
+    result = run(args)
+
+    print(f"{'mode':<10} {'load s':>8} {'first s':>8} {'RSS MB':>8} {'PSS MB':>8} {'private MB':>11}")
+    for mode, metrics in result['modes'].items():
+        print(f"{mode:<10} {metrics['load_s']:8.2f} {metrics['first_ranking_s']:8.2f} {metrics['rss_mb']:8.1f} "
+              f"{metrics['pss_mb']:8.1f} {metrics['private_mb']:11.1f}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
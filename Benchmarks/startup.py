@@ -0,0 +1,72 @@
+"""
+Startup time and resident memory of importing the package and creating the embedders.
+Each scenario runs in a fresh interpreter.
+
+Usage:
+    python -m Benchmarks.startup
+"""
+import argparse
+import json
+import subprocess
+import sys
+
+from Modules.consts import workspace_dir
+
+SCENARIOS = {
+    'import': '''
+import Modules.preprocessor, Modules.recommender
+''',
+    'first_embed': '''
+import Modules.preprocessor, Modules.recommender
+from Benchmarks.common import synthetic_jobs
+Modules.preprocessor.job_embedder().embed(synthetic_jobs(1)[0])
+''',
+    'both_embedders': '''
+import Modules.preprocessor, Modules.recommender
+from Benchmarks.common import synthetic_jobs, synthetic_users
+Modules.preprocessor.job_embedder().embed(synthetic_jobs(1)[0])
+Modules.preprocessor.user_embedder().embed(synthetic_users(1)[0])
+''',
+}
+
+# Wraps a scenario to report its wall time and resident memory as JSON
+TEMPLATE = '''
+import json, resource, time
+start = time.perf_counter()
+{code}
+elapsed = time.perf_counter() - start
+
+rss_mb = None
+try:
+    with open('/proc/self/status') as status:
+        rss_mb = next(int(line.split()[1]) for line in status if line.startswith('VmRSS')) / 1024
+except OSError:
+    pass
+peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+print(json.dumps({{'seconds': elapsed, 'rss_mb': rss_mb, 'peak_rss_mb': peak_mb}}))
+'''
+
+
+def run(scenario: str) -> dict:
+    output = subprocess.run(
+        [sys.executable, '-c', TEMPLATE.format(code=SCENARIOS[scenario])],
+        cwd=workspace_dir, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scenarios', nargs='+', choices=list(SCENARIOS), default=list(SCENARIOS))
+    args = parser.parse_args()
+
+    print(f"{'scenario':<16}{'seconds':>10}{'rss MB':>10}{'peak MB':>10}")
+    for scenario in args.scenarios:
+        result = run(scenario)
+        rss = f"{result['rss_mb']:.1f}" if result['rss_mb'] is not None else '-'
+        print(f"{scenario:<16}{result['seconds']:>10.2f}{rss:>10}{result['peak_rss_mb']:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,193 @@
+"""
+End-to-end benchmark suite: text cleaning, embedding, storage and ranking latency.
+
+Every scenario runs offline on synthetic jobs and users embedded with the
+bundled models, and reports p50/p95/p99 latencies as JSON so runs can be
+compared across commits.
+
+Usage:
+    python -m Benchmarks.suite --output results.json
+    python -m Benchmarks.suite --sizes 1000 10000 --scenarios clean recommend
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from Benchmarks.common import synthetic_jobs, synthetic_users, percentiles, timings, measure
+from Models.models import weights
+from Modules.database import EmbeddingDB
+from Modules.model_handlers import registry
+from Modules.preprocessor import text_preprocessor, job_embedder, user_embedder
+from Modules.recommender import job_recommender
+
+SCENARIOS = ['clean', 'embed_batch', 'db_write', 'db_read', 'recommend']
+
+
+def bench_clean(n_texts: int, seed: int) -> dict:
+    preprocessor = text_preprocessor()
+    texts = [j.content for j in synthetic_jobs(n_texts, seed)]
+
+    samples = [measure(preprocessor.clean, text)[0] for text in texts]
+    return {**percentiles(samples), 'texts_per_sec': n_texts / sum(samples)}
+
+
+def bench_embed_batch(embedder: job_embedder, n_jobs: int, batch_size: int, seed: int) -> dict:
+    jobs = synthetic_jobs(n_jobs, seed)
+
+    # Warm up so model initialization is not measured
+    embedder.embed_batch([j.model_copy() for j in jobs[:batch_size]], batch_size=batch_size)
+
+    samples = []
+    for start in range(0, n_jobs, batch_size):
+        batch = [j.model_copy() for j in jobs[start:start + batch_size]]
+        samples.append(measure(embedder.embed_batch, batch, batch_size=batch_size)[0])
+
+    return {**percentiles(samples), 'batch_size': batch_size, 'jobs_per_sec': n_jobs / sum(samples)}
+
+
+def bench_db_write(pool: list, n_rows: int, chunk_size: int, tmp: str) -> dict:
+    db = EmbeddingDB(os.path.join(tmp, 'write.db'))
+    single = [measure(db.store_job_embeddings, job_id, pool[job_id % len(pool)])[0] for job_id in range(n_rows)]
+
+    rows = [(job_id, pool[job_id % len(pool)]) for job_id in range(n_rows, 2 * n_rows)]
+    batch = [measure(db.store_job_embeddings_batch, chunk, chunk_size=chunk_size)[0]
+             for chunk in (rows[start:start + chunk_size] for start in range(0, n_rows, chunk_size))]
+
+    return {
+        'store_job_embeddings': {**percentiles(single), 'rows_per_sec': n_rows / sum(single)},
+        'store_job_embeddings_batch': {**percentiles(batch), 'chunk_size': chunk_size,
+                                       'rows_per_sec': n_rows / sum(batch)},
+    }
+
+
+def bench_db_read(db: EmbeddingDB, n_stored: int, n_ids: int, repeats: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    results = dict()
+    for column in sorted(db.job_columns):
+        ids = rng.sample(range(n_stored), min(n_ids, n_stored))
+        results[column] = percentiles(timings(db.get_jobs_column_embeddings, repeats, ids, column))
+    return {'n_ids': n_ids, 'columns': results}
+
+
+def bench_recommend(db: EmbeddingDB, n_stored: int, n_users: int, sizes: list[int],
+                    repeats: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    recommender = job_recommender(db)
+    recommender_weights = weights()
+    results = dict()
+
+    for size in sizes:
+        candidates = rng.sample(range(n_stored), size)
+        base_job_id = candidates[0]
+        user_id = rng.randrange(n_users)
+
+        results[str(size)] = {
+            'job_recommend': percentiles(timings(recommender.job_recommend, repeats,
+                                                 base_job_id, candidates, recommender_weights, top_k=10)),
+            'user_job_recommend': percentiles(timings(recommender.user_job_recommend, repeats,
+                                                      user_id, candidates, recommender_weights, top_k=10)),
+        }
+    return results
+
+
+def populate(db: EmbeddingDB, pool: list, n_jobs: int, users: list):
+    """
+    Store `n_jobs` jobs cycling through the embedded pool, plus the embedded users.
+    """
+    db.store_job_embeddings_batch((job_id, pool[job_id % len(pool)]) for job_id in range(n_jobs))
+    db.store_user_embeddings_batch((u.user_id, u) for u in users)
+
+
+def metadata(args) -> dict:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        'commit': commit,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'args': vars(args),
+    }
+
+
+def run(args) -> dict:
+    vectorizers = {'title': registry.get('content_vectorizer')} if args.title_vectorizer == 'tfidf' else dict()
+    jobs_embedder = job_embedder(vectorizers=dict(vectorizers), sparse=args.sparse)
+    users_embedder = user_embedder(vectorizers=dict(vectorizers), sparse=args.sparse)
+    results = dict()
+
+    if 'clean' in args.scenarios:
+        results['clean'] = bench_clean(args.n_texts, args.seed)
+
+    if 'embed_batch' in args.scenarios:
+        results['embed_batch'] = bench_embed_batch(jobs_embedder, args.n_texts, args.batch_size, args.seed)
+
+    storage = {'db_write', 'db_read', 'recommend'} & set(args.scenarios)
+    if storage:
+        # Real embeddings of a pool of jobs, reused cyclically to fill large tables
+        pool = jobs_embedder.embed_batch(synthetic_jobs(args.pool_size, args.seed), args.batch_size)
+        users = users_embedder.embed_batch(synthetic_users(args.n_users, args.seed), args.batch_size)
+        n_stored = max(args.sizes) + 1
+
+        with tempfile.TemporaryDirectory() as tmp:
+            if 'db_write' in storage:
+                results['db_write'] = bench_db_write(pool, args.n_rows, args.chunk_size, tmp)
+
+            db = EmbeddingDB(os.path.join(tmp, 'read.db'))
+            populate(db, pool, n_stored, users)
+
+            if 'db_read' in storage:
+                results['db_read'] = bench_db_read(db, n_stored, args.n_read_ids, args.repeats, args.seed)
+
+            if 'recommend' in storage:
+                results['recommend'] = bench_recommend(db, n_stored, args.n_users, args.sizes,
+                                                       args.repeats, args.seed)
+
+    return {'meta': metadata(args), 'results': results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument('--sizes', nargs='+', type=int, default=[1000, 10000, 100000],
+                        help='Candidate set sizes of the recommend scenario')
+    parser.add_argument('--repeats', type=int, default=20, help='Timed runs per read / recommend measurement')
+    parser.add_argument('--n-texts', type=int, default=2000, help='Texts cleaned and jobs embedded')
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--pool-size', type=int, default=2000, help='Distinct embedded jobs stored')
+    parser.add_argument('--n-users', type=int, default=100)
+    parser.add_argument('--n-rows', type=int, default=5000, help='Rows written by the db_write scenario')
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    parser.add_argument('--n-read-ids', type=int, default=1000, help='Ids per bulk read')
+    parser.add_argument('--dense', dest='sparse', action='store_false',
+                        help='Store TF-IDF embeddings dense (large candidate sets need a lot of memory)')
+    parser.add_argument('--title-vectorizer', choices=['minilm', 'tfidf'], default='minilm',
+                        help='Use TF-IDF for titles where the MiniLM weights are unavailable')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='JSON results file (stdout when omitted)')
+    args = parser.parse_args()
+
+    report = json.dumps(run(args), indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(report + '\n')
+        print(f"Results written to {args.output}", file=sys.stderr)
+    else:
+        print(report)
+
+
+if __name__ == '__main__':
+    main()
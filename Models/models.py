@@ -1,4 +1,6 @@
-from pydantic import BaseModel
+from datetime import datetime
+
+from pydantic import BaseModel, ConfigDict, Field
 
 
 class user(BaseModel):
@@ -35,11 +37,22 @@ class job(BaseModel):
         content (str): Full job description including requirements and responsibilities
         work_type (str | None): Type of work arrangement
             Valid values: ["FULL_TIME", "PART_TIME", "CONTRACT", "INTERNSHIP", "REMOTE"]
+        location (str | None): Location of the job, e.g. "New York, NY"
+        remote_allowed (bool | None): Whether the job can be done remotely
+        posted_at (datetime | None): Posting time, the time it is stored when missing
+        expires_at (datetime | None): Time the posting expires
+        skills (list[str] | None): Skills listed by the posting. job_embedder adds the
+            skills of its vocabulary found in the content, each is a term of the skill index
     """
     job_id: int
     title: str
     content: str
     work_type: str | None
+    location: str | None = None
+    remote_allowed: bool | None = None
+    posted_at: datetime | None = None
+    expires_at: datetime | None = None
+    skills: list[str] | None = None
 
 
 class weights(BaseModel):
@@ -50,10 +63,76 @@ class weights(BaseModel):
         title (float): Weight for job title similarity
         content (float): Weight for job description/content similarity
         work_type (float): Weight for work type matching
-        skills (float): Weight for skills matching
+        skills (float): Weight for the share of the base's skills a job holds
         
     Note: The sum of all weights should equal 1.0
     """
     title: float = 0.4
     content: float = 0.5
-    work_type: float = 0.1
\ No newline at end of file
+    work_type: float = 0.1
+    skills: float = 0.0
+
+class job_filter(BaseModel):
+    """
+    Metadata conditions candidate jobs must all meet, evaluated in SQL before
+    any embedding is fetched.
+
+    Attributes:
+        work_types (list[str] | None): Accepted work types, any of them
+        remote_allowed (bool | None): Required value of the job's remote_allowed
+        locations (list[str] | None): Accepted locations, exact match
+        posted_after (datetime | None): Earliest posting time
+        posted_within_days (float | None): Maximum age of the posting in days
+        active (bool): Exclude expired jobs
+        skills (list[str] | None): Jobs matching any of these skills, see Modules.skills
+        all_skills (bool): Jobs matching every skill instead of any of them
+    """
+    work_types: list[str] | None = None
+    remote_allowed: bool | None = None
+    locations: list[str] | None = None
+    posted_after: datetime | None = None
+    posted_within_days: float | None = None
+    active: bool = False
+    skills: list[str] | None = None
+    all_skills: bool = False
+
+class recommendation_request(BaseModel):
+    """
+    Body of the recommendation endpoints of the service.
+
+    Attributes:
+        jobs_ids (list[int] | None): Candidate job IDs, None to retrieve them with the ANN index
+        recommender_weights (weights): Feature weights, given as "weights" in JSON
+        top_k (int | None): Maximum number of jobs to return
+        threshold (float | None): Minimum score of returned jobs
+        filters (job_filter | None): Metadata conditions of the candidate jobs
+    """
+    model_config = ConfigDict(populate_by_name=True)
+
+    jobs_ids: list[int] | None = None
+    recommender_weights: weights = Field(default_factory=weights, alias='weights')
+    top_k: int | None = 10
+    threshold: float | None = None
+    filters: job_filter | None = None
+
+
+class job_recommendation_request(recommendation_request):
+    """
+    Jobs similar to a stored job.
+
+    Attributes:
+        job_id (int): ID of the base job
+    """
+    job_id: int
+
+
+class user_recommendation_request(recommendation_request):
+    """
+    Jobs matching a stored user profile.
+
+    Attributes:
+        user_id (int): ID of the user
+        skill_candidates (bool): Without jobs_ids, rank the jobs matching any of the user's skills
+    """
+    user_id: int
+    skill_candidates: bool = False
@@ -0,0 +1,267 @@
+import os
+import threading
+import numpy as np
+
+from Modules import utils
+from Modules.database import EmbeddingDB, db_listener
+from Modules.job_index import dense_column
+
+
+class inverted_list:
+    """
+    Vectors assigned to one IVF centroid, with their job ids.
+    """
+
+    def __init__(self, dim: int, capacity: int = 64):
+        self.vectors = dense_column(dim, np.float32, capacity)
+        self.ids = np.empty(max(capacity, 1), dtype=np.int64)
+        self.size = 0
+
+    def append(self, job_id: int, vector: np.ndarray) -> int:
+        position = self.size
+        self.vectors.set(position, vector)
+        if position >= len(self.ids):
+            self.ids = np.resize(self.ids, 2 * len(self.ids))
+        self.ids[position] = job_id
+        self.size += 1
+        return position
+
+    def remove(self, position: int) -> int | None:
+        """
+        Remove a vector by moving the last one into its place.
+        Returns the job id that moved, if any.
+        """
+        self.size -= 1
+        if position == self.size:
+            return None
+        self.vectors.move(self.size, position)
+        self.ids[position] = self.ids[self.size]
+        return int(self.ids[position])
+
+    def scores(self, query: np.ndarray) -> np.ndarray:
+        return self.vectors.data[:self.size] @ query
+
+
+def _stored_vectors(db: EmbeddingDB, feature: str) -> tuple[list[int], np.ndarray]:
+    """
+    Ids and float32 vectors of every stored job.
+    """
+    ids, vectors = [], []
+    for job_id, embeddings in db.iter_job_embeddings([feature]):
+        ids.append(job_id)
+        vectors.append(np.asarray(embeddings[feature], dtype=np.float32).reshape(-1))
+
+    if not vectors:
+        raise ValueError(f"No job embeddings stored in {db.db_path}")
+    return ids, np.stack(vectors)
+
+
+class IVFIndex(db_listener):
+    """
+    Inverted-file approximate nearest-neighbour index over job embeddings.
+
+    Vectors are grouped around k-means centroids; a search scores only the
+    vectors of the `n_probe` closest centroids. Similarity is the inner
+    product, which equals cosine similarity for the normalized MiniLM
+    title embeddings. The index follows EmbeddingDB writes once attached.
+    """
+
+    def __init__(self, dim: int, n_lists: int = 1, n_probe: int = 8, feature: str = 'title'):
+        self.dim = dim
+        self.n_probe = n_probe
+        self.feature = feature
+        self.centroids = np.zeros((1, dim), dtype=np.float32)
+        self.lists = [inverted_list(dim)]
+        self.positions: dict[int, tuple[int, int]] = dict()
+        self.n_lists = n_lists
+        self.lock = threading.RLock()
+
+        # Database followed once attached by build or load
+        self.db: EmbeddingDB | None = None
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __contains__(self, job_id: int):
+        return job_id in self.positions
+
+    @classmethod
+    def build(cls, db: EmbeddingDB, feature: str = 'title', n_lists: int = None, n_probe: int = 8,
+              attach: bool = True, seed: int = 0):
+        """
+        Build an index over every stored job.
+
+        Args:
+            db: Database to read the embeddings from
+            feature: Embedding column to index
+            n_lists: Number of centroids (defaults to sqrt of the number of jobs)
+            n_probe: Number of centroids scanned per search
+            attach: Follow later writes made through `db`
+            seed: Random seed of the k-means initialization
+        """
+        ids, vectors = _stored_vectors(db, feature)
+        index = cls(vectors.shape[1], n_lists or max(1, int(np.sqrt(len(vectors)))), n_probe, feature)
+        index.train(vectors, seed=seed)
+        index.add(ids, vectors)
+
+        if attach:
+            index.db = db
+            db.add_listener(index)
+        return index
+
+    def rebuild(self, db: EmbeddingDB, seed: int = 0):
+        """
+        Retrain the index over every stored job, e.g. after the dimension of its column changed.
+        """
+        ids, vectors = _stored_vectors(db, self.feature)
+        with self.lock:
+            self.dim = vectors.shape[1]
+            self.lists = [inverted_list(self.dim)]
+            self.positions = dict()
+            self.train(vectors, seed=seed)
+            self.add(ids, vectors)
+
+    def train(self, vectors: np.ndarray, n_iter: int = 10, seed: int = 0, max_train_size: int = 256):
+        """
+        Fit the centroids with spherical k-means and reassign the stored vectors.
+
+        Args:
+            vectors: Training vectors
+            n_iter: Number of k-means iterations
+            seed: Random seed
+            max_train_size: Maximum number of training vectors per centroid
+        """
+        rng = np.random.default_rng(seed)
+        vectors = np.asarray(vectors, dtype=np.float32)
+        n_lists = min(self.n_lists, len(vectors))
+
+        if len(vectors) > max_train_size * n_lists:
+            vectors = vectors[rng.choice(len(vectors), max_train_size * n_lists, replace=False)]
+
+        centroids = vectors[rng.choice(len(vectors), n_lists, replace=False)].copy()
+        for _ in range(n_iter):
+            assignment = np.argmax(vectors @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, vectors)
+
+            # Reseed empty centroids with random training vectors
+            empty = np.bincount(assignment, minlength=n_lists) == 0
+            sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()))]
+
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            centroids = sums / np.maximum(norms, 1e-12)
+
+        with self.lock:
+            ids, stored = self._stored()
+            self.centroids = centroids.astype(np.float32)
+            self.lists = [inverted_list(self.dim) for _ in range(n_lists)]
+            self.positions = dict()
+            self.add(ids, stored)
+
+    def add(self, job_ids: list[int], vectors: np.ndarray):
+        """
+        Insert or replace vectors.
+        """
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        with self.lock:
+            assignment = np.argmax(vectors @ self.centroids.T, axis=1) if len(vectors) else []
+            for job_id, list_no, vector in zip(job_ids, assignment, vectors):
+                job_id = int(job_id)
+                self._remove(job_id)
+                position = self.lists[list_no].append(job_id, vector)
+                self.positions[job_id] = (int(list_no), position)
+
+    def remove(self, job_id: int):
+        with self.lock:
+            self._remove(job_id)
+
+    def search(self, query: np.ndarray, k: int, n_probe: int = None, exclude: int = None):
+        """
+        Approximate top-k search.
+
+        Args:
+            query: Query embedding
+            k: Number of results
+            n_probe: Number of centroids to scan (defaults to the index setting)
+            exclude: Job id to leave out of the results, e.g. the query job itself
+
+        Returns:
+            Tuple of (job ids, scores) NumPy arrays sorted by descending score.
+        """
+        query = np.asarray(query, dtype=np.float32).reshape(-1)
+        with self.lock:
+            probed = utils.top_k(self.centroids @ query, n_probe or self.n_probe)
+            probed = [self.lists[list_no] for list_no in probed if self.lists[list_no].size]
+            if not probed:
+                return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+            ids = np.concatenate([inverted.ids[:inverted.size] for inverted in probed])
+            scores = np.concatenate([inverted.scores(query) for inverted in probed])
+
+        if exclude is not None:
+            keep = ids != exclude
+            ids, scores = ids[keep], scores[keep]
+
+        selected = utils.top_k(scores, k)
+        return ids[selected], scores[selected]
+
+    def on_job_stored(self, job_id: int, embeddings):
+        # Same precision as the vectors read from quantized columns
+        self.add([job_id], self.db.as_stored('jobs', self.feature, getattr(embeddings, self.feature)))
+
+    def on_job_deleted(self, job_id: int):
+        self.remove(job_id)
+
+    def on_column_rewritten(self, table: str, column: str):
+        if table == 'jobs' and column == self.feature:
+            self.rebuild(self.db)
+
+    def save(self, path: str):
+        """
+        Persist the index to a .npz file.
+        """
+        with self.lock:
+            ids, vectors = self._stored()
+            assignment = np.array([self.positions[int(job_id)][0] for job_id in ids], dtype=np.int64)
+            centroids = self.centroids
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        np.savez(path, centroids=centroids, ids=ids, vectors=vectors, assignment=assignment,
+                 n_probe=self.n_probe, feature=self.feature)
+
+    @classmethod
+    def load(cls, path: str, db: EmbeddingDB = None):
+        """
+        Load an index saved with `save`, optionally following writes made through `db`.
+        """
+        with np.load(path) as data:
+            centroids = data['centroids']
+            index = cls(centroids.shape[1], len(centroids), int(data['n_probe']), str(data['feature']))
+            index.centroids = centroids
+            index.lists = [inverted_list(index.dim) for _ in range(len(centroids))]
+
+            for job_id, list_no, vector in zip(data['ids'], data['assignment'], data['vectors']):
+                position = index.lists[list_no].append(int(job_id), vector)
+                index.positions[int(job_id)] = (int(list_no), position)
+
+        if db is not None:
+            index.db = db
+            db.add_listener(index)
+        return index
+
+    def _remove(self, job_id: int):
+        location = self.positions.pop(job_id, None)
+        if location is None:
+            return
+        list_no, position = location
+        moved = self.lists[list_no].remove(position)
+        if moved is not None:
+            self.positions[moved] = (list_no, position)
+
+    def _stored(self):
+        """
+        All stored ids and vectors.
+        """
+        ids = [inverted.ids[:inverted.size] for inverted in self.lists]
+        vectors = [inverted.vectors.data[:inverted.size] for inverted in self.lists]
+        return np.concatenate(ids), np.concatenate(vectors)
@@ -0,0 +1,84 @@
+import numpy as np
+
+# Masks are stored in SQLite INTEGER columns, so at most 63 categories
+MASK_DTYPE = np.int64
+MAX_CATEGORIES = 63
+
+
+def to_mask(onehot) -> int | None:
+    """
+    Bitmask of the categories set in a one-hot (or multi-hot) row, bit i for column i.
+    Returns None for rows with counts other than 0 / 1, whose dot products a
+    mask cannot reproduce.
+    """
+    row = np.asarray(onehot).reshape(-1)
+    if len(row) > MAX_CATEGORIES or not np.isin(row, (0, 1)).all():
+        return None
+    return sum(1 << int(i) for i in np.flatnonzero(row))
+
+
+def mask_of(values: list[str], categories: list[str]) -> int:
+    """
+    Bitmask of category names, in the column order of the encoder's categories.
+    """
+    positions = {category: i for i, category in enumerate(categories)}
+    return sum(1 << positions[value] for value in set(values) if value in positions)
+
+
+def mask_values(mask: int, masks: list[int]) -> list[int]:
+    """
+    Values among `masks` sharing at least one category with `mask`.
+    """
+    return [value for value in masks if value & mask]
+
+
+class category_masks:
+    """
+    One bitmask per row, standing in for a (n_rows, n_categories) one-hot matrix.
+    """
+
+    def __init__(self, masks: np.ndarray, n_categories: int):
+        self.masks = np.asarray(masks, dtype=MASK_DTYPE)
+        self.n_categories = n_categories
+
+    @property
+    def shape(self):
+        return (len(self.masks), self.n_categories)
+
+    def __len__(self):
+        return len(self.masks)
+
+    def __getitem__(self, rows):
+        return category_masks(self.masks[rows], self.n_categories)
+
+    def toarray(self) -> np.ndarray:
+        bits = np.arange(self.n_categories, dtype=MASK_DTYPE)
+        return ((self.masks[:, None] >> bits) & 1).astype(np.int32)
+
+
+def scores(bases, options: category_masks) -> np.ndarray:
+    """
+    Dot products of one-hot bases with masked options, as a vectorized bitwise test.
+
+    Args:
+        bases: (n_bases, n_categories) dense rows
+        options: Masks of the options
+
+    Returns:
+        (n_bases, n_options) array equal to bases @ one_hot(options).T
+    """
+    if hasattr(bases, 'toarray'):
+        bases = bases.toarray()
+    bases = np.asarray(bases).reshape(-1, options.n_categories)
+
+    result = np.empty((len(bases), len(options)), dtype=bases.dtype)
+    for row, base in enumerate(bases):
+        mask = to_mask(base)
+        if mask is not None:
+            # Binary base: the dot product counts the shared categories
+            result[row] = np.bitwise_count(options.masks & mask)
+        else:
+            # Summed rows: weight each category present in the option
+            bits = np.arange(options.n_categories, dtype=MASK_DTYPE)
+            result[row] = ((options.masks[:, None] >> bits) & 1) @ base
+    return result
@@ -1,19 +1,177 @@
 import sqlite3
+import struct
+import threading
 import numpy as np
 import os
+import time
+from datetime import datetime
 from io import BytesIO
-from typing import Optional
+from contextlib import contextmanager
+from typing import Iterable, Optional
+from scipy import sparse
+
+from Modules import utils, instrumentation, quantization, skills
+from Modules.quantization import QUANTIZED_DTYPES, int8_matrix
+from Modules.categorical import category_masks, to_mask, mask_values
+
+# Header of sparse row blobs: magic, dimension, number of stored values, data dtype
+CSR_MAGIC = b'CSR1'
+CSR_HEADER = struct.Struct('<4sII4s')
+
+# Legacy np.save blobs start with the .npy magic string
+NPY_MAGIC = b'\x93NUMPY'
+
+# Dense embeddings are stored as raw bytes of this dtype, described once per column
+RAW_DTYPE = '<f4'
+
+# Maximum number of ids bound in a single IN (...) clause
+MAX_QUERY_IDS = 900
+
+INSERT_JOB = '''
+    INSERT OR REPLACE INTO jobs
+    (job_id, title, content, work_type, work_type_mask, posted_at, expires_at, location, remote_allowed, skill_terms)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+# Non-embedding columns of each table, added to existing databases when missing
+METADATA_COLUMNS = {
+    'jobs': {
+        'created_at': 'TIMESTAMP',
+        'work_type_mask': 'INTEGER',
+        'posted_at': 'INTEGER',
+        'expires_at': 'INTEGER',
+        'location': 'TEXT',
+        'remote_allowed': 'INTEGER',
+        'skill_terms': 'BLOB',
+    },
+    'users': {'created_at': 'TIMESTAMP'},
+}
+
+INSERT_USER = '''
+    INSERT OR REPLACE INTO users
+    (user_id, title, about, preferred_work_types, experience_level, skills)
+    VALUES (?, ?, ?, ?, ?, ?)
+'''
+
+# Metadata columns of the jobs table indexed for filter_jobs.
+# remote_allowed is left out, a two-valued index rarely beats a scan
+INDEXED_JOB_COLUMNS = ['work_type_mask', 'posted_at', 'expires_at', 'location']
+
+# Pragmas applied to every pooled connection
+POOLED_PRAGMAS = {
+    'journal_mode': 'WAL',       # readers keep working while a writer commits
+    'synchronous': 'NORMAL',     # fsync on checkpoints only, safe with WAL
+    'cache_size': -64000,        # 64 MB page cache per connection
+    'mmap_size': 268435456,      # map up to 256 MB of the file
+    'temp_store': 'MEMORY',
+}
+
+
+class db_listener:
+    """
+    Receives notifications after EmbeddingDB rows are written or deleted.
+    Subclasses override the hooks they need; the defaults do nothing.
+    """
+
+    def on_job_stored(self, job_id: int, embeddings):
+        pass
+
+    def on_job_deleted(self, job_id: int):
+        pass
+
+    def on_user_stored(self, user_id: int, embeddings):
+        pass
+
+    def on_column_rewritten(self, table: str, column: str):
+        """Every row of a column was replaced, e.g. by rewrite_column"""
+        pass
 
 
 class EmbeddingDB:
-    def __init__(self, db_path="Data/embeddings.db"):
+    def __init__(self, db_path="Data/embeddings.db", pooled: bool = False, timeout: float = 30.0,
+                 quantize: dict[str, str] = None):
+        """
+        Args:
+            db_path: Path of the SQLite database file
+            pooled: Reuse one connection per thread, with WAL journaling and tuned pragmas,
+                instead of opening a new connection for every call
+            timeout: Seconds to wait for a lock held by another connection
+            quantize: Reduced-precision storage of jobs columns, e.g. {'title': 'float16',
+                'content': 'int8'}. Applies to columns whose first dense row is written
+                afterwards; the precision of a column is fixed once recorded.
+        """
+        self.quantize = dict(quantize or {})
+        invalid = {mode for mode in self.quantize.values() if mode not in QUANTIZED_DTYPES}
+        if invalid:
+            raise ValueError(f"Invalid quantization: {invalid}. Must be one of: {', '.join(QUANTIZED_DTYPES)}")
+
         self.db_path = db_path
+        self.pooled = pooled
+        self.timeout = timeout
+        self.listeners: list[db_listener] = []
+
+        # Thread-local pooled connections and every connection opened so far
+        self._local = threading.local()
+        self._connections: list[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+
         os.makedirs(os.path.dirname(db_path), exist_ok=True)
         self.initialize_db()
 
+    def _open_connection(self) -> sqlite3.Connection:
+        """Open a pooled connection and apply the tuned pragmas"""
+        # Each connection is only used by the thread that opened it,
+        # other threads touch it solely to close it in close()
+        conn = sqlite3.connect(self.db_path, timeout=self.timeout, check_same_thread=False)
+        for pragma, value in POOLED_PRAGMAS.items():
+            conn.execute(f'PRAGMA {pragma} = {value}')
+
+        with self._connections_lock:
+            self._connections.append(conn)
+        return conn
+
+    @contextmanager
+    def _connection(self):
+        """
+        Connection for a single operation.
+        The transaction is committed on success and rolled back on error.
+        """
+        if self.pooled:
+            conn = getattr(self._local, 'conn', None)
+            if conn is None:
+                conn = self._local.conn = self._open_connection()
+            with conn:
+                yield conn
+            return
+
+        conn = sqlite3.connect(self.db_path, timeout=self.timeout)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def close(self):
+        """Close every pooled connection"""
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+        self._local = threading.local()
+
+    def add_listener(self, listener: db_listener):
+        """Register a listener notified after every committed write"""
+        if listener not in self.listeners:
+            self.listeners.append(listener)
+
+    def remove_listener(self, listener: db_listener):
+        """Unregister a previously added listener"""
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+
     def initialize_db(self):
         """Create the database and tables if they don't exist"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connection() as conn:
             cursor = conn.cursor()
 
             # Create Jobs table - embeddings for title, content, and work_type
@@ -23,7 +181,13 @@ class EmbeddingDB:
                     title BLOB,           -- embedding for title
                     content BLOB,         -- embedding for content
                     work_type BLOB,       -- embedding for work_type
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    work_type_mask INTEGER, -- bit i set for the i-th work type category
+                    posted_at INTEGER,      -- unix time of the posting
+                    expires_at INTEGER,     -- unix time the posting expires
+                    location TEXT,
+                    remote_allowed INTEGER, -- 1 / 0, NULL when unknown
+                    skill_terms BLOB        -- sorted term ids of the skills, see Modules.skills
                 )
             ''')
 
@@ -40,102 +204,378 @@ class EmbeddingDB:
                 )
             ''')
 
+            # Dtype and dimension of the raw embedding blobs of each column
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS embedding_columns (
+                    table_name TEXT NOT NULL,
+                    column_name TEXT NOT NULL,
+                    dtype TEXT NOT NULL,
+                    dim INTEGER NOT NULL,
+                    PRIMARY KEY (table_name, column_name)
+                )
+            ''')
+
+            # Embeddings of already encoded texts, keyed by a hash of the text and model
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS embedding_cache (
+                    cache_key BLOB PRIMARY KEY,
+                    embedding BLOB NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+
+            # Databases created before a metadata column existed
+            for table, columns in METADATA_COLUMNS.items():
+                cursor.execute(f"PRAGMA table_info({table})")
+                existing = {row[1] for row in cursor.fetchall()}
+                for column, column_type in columns.items():
+                    if column not in existing:
+                        cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {column_type}')
+
+                        # Jobs stored before posting times were recorded were posted when stored
+                        if column == 'posted_at':
+                            cursor.execute("UPDATE jobs SET posted_at = CAST(strftime('%s', created_at) AS INTEGER)")
+
+            for column in INDEXED_JOB_COLUMNS:
+                cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_jobs_{column} ON jobs ({column})')
+
             conn.commit()
 
-    def _numpy_to_blob(self, arr: Optional[np.ndarray]) -> Optional[bytes]:
-        """Convert numpy array to binary blob"""
+            self.column_meta = self._load_column_meta(cursor)
+
+            # Validate column names once against the actual schema
+            self.job_columns = self._table_columns(cursor, 'jobs', 'job_id')
+            self.user_columns = self._table_columns(cursor, 'users', 'user_id')
+
+    def _table_columns(self, cursor: sqlite3.Cursor, table: str, key: str) -> frozenset[str]:
+        """Embedding columns of a table, excluding the key and metadata columns"""
+        cursor.execute(f"PRAGMA table_info({table})")
+        excluded = {key} | set(METADATA_COLUMNS[table])
+        return frozenset(row[1] for row in cursor.fetchall() if row[1] not in excluded)
+
+    def _load_column_meta(self, cursor: sqlite3.Cursor) -> dict[tuple[str, str], tuple[np.dtype, int]]:
+        """Read the dtype and dimension of every raw column"""
+        cursor.execute('SELECT table_name, column_name, dtype, dim FROM embedding_columns')
+        return {(table, column): (np.dtype(dtype), dim) for table, column, dtype, dim in cursor.fetchall()}
+
+    def _raw_column(self, table: str, column: str, arr: np.ndarray) -> tuple[np.dtype, int]:
+        """
+        Dtype and dimension of a raw column.
+        Recorded from the first array written to the column.
+        """
+        meta = self.column_meta.get((table, column))
+        if meta is not None:
+            return meta
+
+        dtype = RAW_DTYPE
+        if table == 'jobs' and column in self.quantize:
+            dtype = QUANTIZED_DTYPES[self.quantize[column]].str
+
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT OR IGNORE INTO embedding_columns (table_name, column_name, dtype, dim)
+                VALUES (?, ?, ?, ?)
+            ''', (table, column, dtype, arr.size))
+            conn.commit()
+
+            # Another connection may have registered the column first
+            self.column_meta = self._load_column_meta(cursor)
+
+        return self.column_meta[(table, column)]
+
+    @staticmethod
+    def _raw_nbytes(meta: tuple[np.dtype, int]) -> int:
+        """Size of a raw blob, int8 rows carry their scale"""
+        dtype, dim = meta
+        if dtype == np.int8:
+            return quantization.int8_nbytes(dim)
+        return dtype.itemsize * dim
+
+    def _numpy_to_blob(self, arr: Optional[np.ndarray | sparse.spmatrix],
+                       table: str = None, column: str = None) -> Optional[bytes]:
+        """
+        Convert numpy array (or a single sparse row) to binary blob.
+        Single numeric rows of a known table column are stored as raw bytes,
+        anything else as a .npy blob.
+        """
         if arr is None:
             return None
+        if sparse.issparse(arr):
+            return self._sparse_to_blob(arr)
+
+        arr = np.asarray(arr)
+        if table is not None and arr.ndim in (1, 2) and arr.shape[0] == 1 and arr.dtype.kind in 'biuf':
+            meta = self._raw_column(table, column, arr)
+            if arr.size != meta[1]:
+                raise ValueError(f"{table}.{column} embeddings have dimension {meta[1]}, got {arr.size}")
+            return self._raw_blob(arr, meta)
+
         buf = BytesIO()
         np.save(buf, arr, allow_pickle=False)
         return buf.getvalue()
 
-    def _blob_to_numpy(self, blob: Optional[bytes]) -> Optional[np.ndarray]:
-        """Convert binary blob back to numpy array"""
+    @staticmethod
+    def _raw_blob(arr: np.ndarray, meta: tuple[np.dtype, int]) -> bytes:
+        """Raw bytes of a single row in the dtype of its column"""
+        if meta[0] == np.int8:
+            return quantization.int8_to_bytes(arr)
+        return arr.astype(meta[0], copy=False).tobytes()
+
+    def _blob_to_numpy(self, blob: Optional[bytes],
+                       table: str = None, column: str = None) -> Optional[np.ndarray | sparse.csr_matrix]:
+        """
+        Convert binary blob back to numpy array (or a (1, dim) CSR matrix for sparse blobs).
+        Raw blobs are recognized by their size and returned as a read-only (1, dim) view,
+        int8 rows are dequantized to float32.
+        """
         if blob is None:
             return None
-        buf = BytesIO(blob)
-        return np.load(buf, allow_pickle=False)
+
+        meta = self.column_meta.get((table, column))
+        if meta is not None and len(blob) == self._raw_nbytes(meta):
+            if meta[0] == np.int8:
+                codes, scale = quantization.int8_from_bytes(blob)
+                return (codes.astype(np.float32) * scale).reshape(1, meta[1])
+            return np.frombuffer(blob, dtype=meta[0]).reshape(1, meta[1])
+
+        if blob[:len(CSR_MAGIC)] == CSR_MAGIC:
+            return self._blob_to_sparse(blob)
+        if blob[:len(NPY_MAGIC)] == NPY_MAGIC:
+            buf = BytesIO(blob)
+            return np.load(buf, allow_pickle=False)
+
+        # The column may have been registered by another connection (or process) since this one was opened
+        if meta is None and table is not None:
+            with self._connection() as conn:
+                self.column_meta = self._load_column_meta(conn.cursor())
+            if (table, column) in self.column_meta:
+                return self._blob_to_numpy(blob, table, column)
+
+        raise ValueError(f"Unrecognized embedding blob of {len(blob)} bytes in {table}.{column}")
+
+    def as_stored(self, table: str, column: str, arr):
+        """
+        Value a row reads back as once stored: rows of reduced-precision columns
+        round-trip through their storage dtype, anything else is returned as is.
+        """
+        meta = self.column_meta.get((table, column))
+        if arr is None or meta is None or meta[0] == np.dtype(RAW_DTYPE) or sparse.issparse(arr):
+            return arr
+        return self._blob_to_numpy(self._numpy_to_blob(arr, table, column), table, column)
+
+    def _sparse_to_blob(self, row: sparse.spmatrix) -> bytes:
+        """Convert a (1, dim) sparse row to a blob of CSR indices and data"""
+        row = sparse.csr_matrix(row)
+        row.sum_duplicates()
+        if row.shape[0] != 1:
+            raise ValueError(f"Sparse embeddings must be a single row, got shape {row.shape}")
+
+        data = row.data.astype(row.data.dtype.newbyteorder('<'), copy=False)
+        header = CSR_HEADER.pack(CSR_MAGIC, row.shape[1], row.nnz, data.dtype.str.encode().ljust(4))
+        return header + row.indices.astype('<i4', copy=False).tobytes() + data.tobytes()
+
+    def _blob_to_sparse(self, blob: bytes) -> sparse.csr_matrix:
+        """Convert a CSR blob back to a (1, dim) sparse row"""
+        _, dim, nnz, dtype = CSR_HEADER.unpack_from(blob)
+        indices = np.frombuffer(blob, dtype='<i4', count=nnz, offset=CSR_HEADER.size)
+        data = np.frombuffer(blob, dtype=dtype.decode().strip(), count=nnz,
+                             offset=CSR_HEADER.size + indices.nbytes)
+        return sparse.csr_matrix((data, indices, np.array([0, nnz])), shape=(1, dim))
+
+    def _job_row(self, job_id: int, embeddings) -> tuple:
+        """Parameters of the jobs INSERT statement for one job"""
+        return (
+            job_id,
+            self._numpy_to_blob(embeddings.title, 'jobs', 'title'),
+            self._numpy_to_blob(embeddings.content, 'jobs', 'content'),
+            self._numpy_to_blob(embeddings.work_type, 'jobs', 'work_type'),
+            self._work_type_mask(embeddings.work_type),
+            self._timestamp(getattr(embeddings, 'posted_at', None), default=int(time.time())),
+            self._timestamp(getattr(embeddings, 'expires_at', None)),
+            getattr(embeddings, 'location', None),
+            getattr(embeddings, 'remote_allowed', None),
+            self._skill_terms(getattr(embeddings, 'skills', None))
+        )
+
+    @staticmethod
+    def _timestamp(value: Optional[datetime | float], default: Optional[int] = None) -> Optional[int]:
+        """Unix time of a datetime (or of a number already in seconds), default when missing"""
+        if value is None:
+            return default
+        if isinstance(value, datetime):
+            return int(value.timestamp())
+        return int(value)
+
+    @staticmethod
+    def _skill_terms(job_skills: Optional[list[str]]) -> Optional[bytes]:
+        """Term ids blob of the skills set by job_embedder.preprocess, None when unknown"""
+        if job_skills is None:
+            return None
+        return skills.to_blob(skills.term_ids(job_skills))
+
+    @staticmethod
+    def _work_type_mask(work_type) -> Optional[int]:
+        """Bitmask of a dense one-hot work type, None when it cannot be represented"""
+        if work_type is None or sparse.issparse(work_type):
+            return None
+        return to_mask(work_type)
+
+    def _user_row(self, user_id: int, embeddings) -> tuple:
+        """Parameters of the users INSERT statement for one user"""
+        return (
+            user_id,
+            self._numpy_to_blob(embeddings.title, 'users', 'title'),
+            self._numpy_to_blob(embeddings.about, 'users', 'about'),
+            self._numpy_to_blob(embeddings.preferred_work_types, 'users', 'preferred_work_types'),
+            self._numpy_to_blob(embeddings.experience_level, 'users', 'experience_level'),
+            self._numpy_to_blob(embeddings.skills, 'users', 'skills')
+        )
 
     def store_job_embeddings(self, job_id: int, embeddings: dict):
         """Store job embeddings in the database"""
-        with sqlite3.connect(self.db_path) as conn:
+        with instrumentation.stage('db.write'), self._connection() as conn:
             cursor = conn.cursor()
+            cursor.execute(INSERT_JOB, self._job_row(job_id, embeddings))
+            conn.commit()
+        instrumentation.count('db.rows_written')
 
-            cursor.execute('''
-                INSERT OR REPLACE INTO jobs 
-                (job_id, title, content, work_type)
-                VALUES (?, ?, ?, ?)
-            ''', (
-                job_id,
-                self._numpy_to_blob(embeddings.title),
-                self._numpy_to_blob(embeddings.content),
-                self._numpy_to_blob(embeddings.work_type)
-            ))
+        for listener in self.listeners:
+            listener.on_job_stored(job_id, embeddings)
+
+    def store_job_embeddings_batch(self, jobs: Iterable[tuple[int, object]], chunk_size: int = 1000) -> int:
+        """
+        Store many job embeddings with one executemany and one commit per chunk.
+
+        Args:
+            jobs: Iterable (or generator) of (job_id, embeddings) pairs, consumed lazily
+            chunk_size: Number of rows written per commit
 
+        Returns:
+            Number of rows written
+        """
+        written = 0
+        with self._connection() as conn:
+            cursor = conn.cursor()
+
+            for chunk in utils.chunked(jobs, chunk_size):
+                with instrumentation.stage('db.write'):
+                    rows = [self._job_row(job_id, embeddings) for job_id, embeddings in chunk]
+                    cursor.executemany(INSERT_JOB, rows)
+                    conn.commit()
+                written += len(chunk)
+                instrumentation.count('db.rows_written', len(chunk))
+
+                for listener in self.listeners:
+                    for job_id, embeddings in chunk:
+                        listener.on_job_stored(job_id, embeddings)
+
+        return written
+
+    def delete_job_embeddings(self, job_id: int):
+        """Delete job embeddings from the database"""
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('DELETE FROM jobs WHERE job_id = ?', (job_id,))
             conn.commit()
 
+        for listener in self.listeners:
+            listener.on_job_deleted(job_id)
+
     def store_user_embeddings(self, user_id: int, embeddings: dict):
         """Store user embeddings in the database"""
-        with sqlite3.connect(self.db_path) as conn:
+        with instrumentation.stage('db.write'), self._connection() as conn:
             cursor = conn.cursor()
+            cursor.execute(INSERT_USER, self._user_row(user_id, embeddings))
+            conn.commit()
+        instrumentation.count('db.rows_written')
 
-            cursor.execute('''
-                INSERT OR REPLACE INTO users 
-                (user_id, title, about, preferred_work_types, experience_level, skills)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (
-                user_id,
-                self._numpy_to_blob(embeddings.title),
-                self._numpy_to_blob(embeddings.about),
-                self._numpy_to_blob(embeddings.preferred_work_types),
-                self._numpy_to_blob(embeddings.experience_level),
-                self._numpy_to_blob(embeddings.skills)
-            ))
+        for listener in self.listeners:
+            listener.on_user_stored(user_id, embeddings)
 
-            conn.commit()
+    def store_user_embeddings_batch(self, users: Iterable[tuple[int, object]], chunk_size: int = 1000) -> int:
+        """
+        Store many user embeddings with one executemany and one commit per chunk.
+
+        Args:
+            users: Iterable (or generator) of (user_id, embeddings) pairs, consumed lazily
+            chunk_size: Number of rows written per commit
+
+        Returns:
+            Number of rows written
+        """
+        written = 0
+        with self._connection() as conn:
+            cursor = conn.cursor()
+
+            for chunk in utils.chunked(users, chunk_size):
+                with instrumentation.stage('db.write'):
+                    rows = [self._user_row(user_id, embeddings) for user_id, embeddings in chunk]
+                    cursor.executemany(INSERT_USER, rows)
+                    conn.commit()
+                written += len(chunk)
+                instrumentation.count('db.rows_written', len(chunk))
+
+                for listener in self.listeners:
+                    for user_id, embeddings in chunk:
+                        listener.on_user_stored(user_id, embeddings)
+
+        return written
 
     def get_job_embeddings(self, job_id: int) -> dict:
         """Retrieve job embeddings from the database"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connection() as conn:
             cursor = conn.cursor()
 
-            cursor.execute('''
-                SELECT title, content, work_type
-                FROM jobs WHERE job_id = ?
-            ''', (job_id,))
+            with instrumentation.stage('db.query'):
+                cursor.execute('''
+                    SELECT title, content, work_type
+                    FROM jobs WHERE job_id = ?
+                ''', (job_id,))
 
-            result = cursor.fetchone()
+                result = cursor.fetchone()
         if result:
-            return {
-                'title': self._blob_to_numpy(result[0]),
-                'content': self._blob_to_numpy(result[1]),
-                'work_type': self._blob_to_numpy(result[2])
-            }
+            self._count_fetched(result)
+            with instrumentation.stage('db.decode'):
+                return {
+                    'title': self._blob_to_numpy(result[0], 'jobs', 'title'),
+                    'content': self._blob_to_numpy(result[1], 'jobs', 'content'),
+                    'work_type': self._blob_to_numpy(result[2], 'jobs', 'work_type')
+                }
         return None
     
     def get_user_embeddings(self, user_id: int) -> dict:
         """Retrieve user embeddings from the database"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connection() as conn:
             cursor = conn.cursor()
 
-            cursor.execute('''
-                SELECT title, about, preferred_work_types, experience_level, skills
-                FROM users WHERE user_id = ?
-            ''', (user_id,))
+            with instrumentation.stage('db.query'):
+                cursor.execute('''
+                    SELECT title, about, preferred_work_types, experience_level, skills
+                    FROM users WHERE user_id = ?
+                ''', (user_id,))
 
-            result = cursor.fetchone()
+                result = cursor.fetchone()
         if result:
-            return {
-                'title': self._blob_to_numpy(result[0]),
-                'about': self._blob_to_numpy(result[1]),
-                'preferred_work_types': self._blob_to_numpy(result[2]),
-                'experience_level': self._blob_to_numpy(result[3]),
-                'skills': self._blob_to_numpy(result[4])
-            }
+            self._count_fetched(result)
+            with instrumentation.stage('db.decode'):
+                return {
+                    'title': self._blob_to_numpy(result[0], 'users', 'title'),
+                    'about': self._blob_to_numpy(result[1], 'users', 'about'),
+                    'preferred_work_types': self._blob_to_numpy(result[2], 'users', 'preferred_work_types'),
+                    'experience_level': self._blob_to_numpy(result[3], 'users', 'experience_level'),
+                    'skills': self._blob_to_numpy(result[4], 'users', 'skills')
+                }
         return None
 
-    def get_jobs_column_embeddings(self, job_ids: list[int], column_name: str) -> list[Optional[np.ndarray]]:
+    @staticmethod
+    def _count_fetched(row: tuple):
+        """Count one fetched row and the bytes of its blobs"""
+        if instrumentation.enabled():
+            instrumentation.count('db.rows_fetched')
+            instrumentation.count('db.bytes_decoded', sum(len(blob) for blob in row if blob is not None))
+
+    def get_jobs_column_embeddings(self, job_ids: list[int], column_name: str) -> np.ndarray | sparse.csr_matrix:
         """
         Retrieve embeddings for a specific column for multiple job IDs.
         Returns embeddings in the same order as the input job_ids list.
@@ -145,44 +585,490 @@ class EmbeddingDB:
             column_name: Name of the column to fetch ('title', 'content', or 'work_type')
             
         Returns:
-            List of numpy arrays in the same order as job_ids. 
-            If a job_id is not found, None will be in its place.
+            Matrix with one row per job in the same order as job_ids.
+            If any of the rows is stored sparse, a CSR matrix is returned
+            (legacy dense rows are converted), otherwise a dense array.
         """
         if not job_ids:
             return []
             
-        # Get all column names from jobs table except job_id
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute("PRAGMA table_info(jobs)")
-            valid_columns = {row[1] for row in cursor.fetchall() if row[1] != 'job_id'}
-        
-        if column_name not in valid_columns:
-            raise ValueError(f"Invalid column name: {column_name}. Must be one of: title, content, work_type")
+        if column_name not in self.job_columns:
+            raise ValueError(f"Invalid column name: {column_name}. Must be one of: {', '.join(sorted(self.job_columns))}")
+
+        return self._get_column_embeddings('jobs', 'job_id', job_ids, column_name)
+
+    def get_users_column_embeddings(self, user_ids: list[int], column_name: str) -> np.ndarray | sparse.csr_matrix:
+        """
+        Retrieve embeddings for a specific column for multiple user IDs.
+        Same as get_jobs_column_embeddings for the users table.
+        """
+        if not user_ids:
+            return []
 
-        with sqlite3.connect(self.db_path) as conn:
+        if column_name not in self.user_columns:
+            raise ValueError(f"Invalid column name: {column_name}. Must be one of: {', '.join(sorted(self.user_columns))}")
+
+        return self._get_column_embeddings('users', 'user_id', user_ids, column_name)
+
+    def _get_column_embeddings(self, table: str, key: str, ids: list[int], column_name: str):
+        """Stack the embeddings of one column for the given ids, in order"""
+        # Output rows of every requested id, ids may repeat
+        positions = dict()
+        for row, row_id in enumerate(ids):
+            positions.setdefault(row_id, []).append(row)
+
+        meta = self.column_meta.get((table, column_name))
+        raw_size = self._raw_nbytes(meta) if meta else None
+
+        # Raw rows are decoded straight into a preallocated matrix,
+        # rows in another format are decoded one by one
+        embeddings = np.empty((len(ids), meta[1]), dtype=meta[0]) if meta else None
+
+        # int8 rows keep their codes, with one scale per row
+        scales = np.empty(len(ids), dtype=quantization.INT8_SCALE_DTYPE) if meta and meta[0] == np.int8 else None
+        decoded = dict()
+        found = set()
+        n_bytes = 0
+
+        with self._connection() as conn:
             cursor = conn.cursor()
-            
-            # Create placeholders for SQL IN clause
-            placeholders = ','.join('?' * len(job_ids))
-            
-            # Query the specific column for all job_ids
-            cursor.execute(f'''
-                SELECT job_id, {column_name}
-                FROM jobs 
-                WHERE job_id IN ({placeholders})
-            ''', job_ids)
-            
-            # Create a mapping of job_id to embedding
-            results_dict = {
-                job_id: self._blob_to_numpy(embedding_blob)
-                for job_id, embedding_blob in cursor.fetchall()
-            }
-            
-        # Stack all embeddings into a single array
-        embeddings = np.stack([results_dict[job_id][0,:] for job_id in job_ids], axis=0)
+
+            for chunk in utils.chunked(positions.keys(), MAX_QUERY_IDS):
+                # Create placeholders for SQL IN clause
+                placeholders = ','.join('?' * len(chunk))
+
+                # Query the specific column for the chunk of ids
+                with instrumentation.stage('db.query'):
+                    cursor.execute(f'''
+                        SELECT {key}, {column_name}
+                        FROM {table}
+                        WHERE {key} IN ({placeholders})
+                    ''', chunk)
+                    rows = cursor.fetchall()
+
+                with instrumentation.stage('db.decode'):
+                    for row_id, blob in rows:
+                        found.add(row_id)
+                        n_bytes += len(blob) if blob is not None else 0
+                        if blob is not None and len(blob) == raw_size:
+                            if scales is not None:
+                                codes, scale = quantization.int8_from_bytes(blob)
+                                embeddings[positions[row_id]] = codes
+                                scales[positions[row_id]] = scale
+                            else:
+                                embeddings[positions[row_id]] = np.frombuffer(blob, dtype=meta[0])
+                        else:
+                            decoded[row_id] = self._blob_to_numpy(blob, table, column_name)
+
+        instrumentation.count('db.rows_fetched', len(found))
+        instrumentation.count('db.bytes_decoded', n_bytes)
+
+        missing = [row_id for row_id in positions if row_id not in found]
+        if missing:
+            raise KeyError(f"Ids not found in {table}: {missing}")
+
+        if scales is not None:
+            if not decoded:
+                return int8_matrix(embeddings, scales)
+            embeddings = int8_matrix(embeddings, scales).dequantize()
+
+        if not decoded:
+            return embeddings
+
+        # Keep sparse rows sparse, legacy dense rows are converted to CSR
+        if any(sparse.issparse(row) for row in decoded.values()):
+            rows = [
+                decoded[row_id] if row_id in decoded else embeddings[row:row + 1]
+                for row, row_id in enumerate(ids)
+            ]
+            return sparse.vstack([sparse.csr_matrix(row) for row in rows], format='csr')
+
+        # Legacy .npy rows
+        if embeddings is None:
+            first = next(iter(decoded.values()))
+            embeddings = np.empty((len(ids), first.shape[-1]), dtype=first.dtype)
+        for row_id, row in decoded.items():
+            embeddings[positions[row_id]] = row[0, :]
         return embeddings
-    
+
+    def get_jobs_work_type_masks(self, job_ids: list[int]) -> Optional[category_masks]:
+        """
+        Work type bitmasks of the given jobs, in the order of job_ids.
+        Scores like the one-hot work_type column without decoding it.
+
+        Returns:
+            category_masks, or None when a job has no mask (see backfill_work_type_masks)
+            or the work_type column is not in the raw format
+        """
+        meta = self.column_meta.get(('jobs', 'work_type'))
+        if meta is None:
+            return None
+
+        masks = dict()
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            for chunk in utils.chunked(set(job_ids), MAX_QUERY_IDS):
+                placeholders = ','.join('?' * len(chunk))
+                with instrumentation.stage('db.query'):
+                    cursor.execute(f'''
+                        SELECT job_id, work_type_mask FROM jobs
+                        WHERE job_id IN ({placeholders})
+                    ''', chunk)
+                    masks.update(cursor.fetchall())
+
+        missing = [job_id for job_id in job_ids if job_id not in masks]
+        if missing:
+            raise KeyError(f"Ids not found in jobs: {missing}")
+
+        instrumentation.count('db.rows_fetched', len(masks))
+        if any(mask is None for mask in masks.values()):
+            return None
+        return category_masks(np.fromiter((masks[job_id] for job_id in job_ids), dtype=np.int64,
+                                          count=len(job_ids)), meta[1])
+
+    def filter_jobs(self, job_ids: list[int] = None, work_type_mask: int = None,
+                    posted_after: Optional[datetime | float] = None, active_at: Optional[datetime | float] = None,
+                    locations: list[str] = None, remote_allowed: bool = None) -> list[int]:
+        """
+        SQL-side prefilter on the indexed metadata columns, jobs meeting every given condition.
+        Jobs whose value of a filtered column is unknown are left out, except for
+        a missing expiry which counts as active.
+
+        Args:
+            job_ids: Restrict the search to these jobs (all jobs when None)
+            work_type_mask: Jobs sharing at least one work type with this bitmask, see categorical.mask_of
+            posted_after: Earliest posting time
+            active_at: Jobs not expired at this time
+            locations: Accepted locations
+            remote_allowed: Required remote_allowed value
+
+        Returns:
+            Matching job ids, in the order of job_ids when given
+        """
+        clauses, params = [], []
+
+        with self._connection() as conn:
+            cursor = conn.cursor()
+
+            if work_type_mask is not None:
+                # Few distinct masks exist, listing them is an index-only scan
+                cursor.execute('SELECT DISTINCT work_type_mask FROM jobs WHERE work_type_mask IS NOT NULL')
+                values = mask_values(work_type_mask, [row[0] for row in cursor.fetchall()])
+                if not values:
+                    return []
+                clauses.append(f"work_type_mask IN ({','.join('?' * len(values))})")
+                params.extend(values)
+
+            if posted_after is not None:
+                clauses.append('posted_at >= ?')
+                params.append(self._timestamp(posted_after))
+
+            if active_at is not None:
+                clauses.append('(expires_at IS NULL OR expires_at > ?)')
+                params.append(self._timestamp(active_at))
+
+            if locations is not None:
+                if not locations:
+                    return []
+                clauses.append(f"location IN ({','.join('?' * len(locations))})")
+                params.extend(locations)
+
+            if remote_allowed is not None:
+                clauses.append('remote_allowed = ?')
+                params.append(int(remote_allowed))
+
+            where = ' AND '.join(clauses) or '1'
+
+            with instrumentation.stage('db.query'):
+                if job_ids is None:
+                    cursor.execute(f'SELECT job_id FROM jobs WHERE {where} ORDER BY job_id', params)
+                    return [row[0] for row in cursor.fetchall()]
+
+                matching = set()
+                for chunk in utils.chunked(job_ids, MAX_QUERY_IDS):
+                    placeholders = ','.join('?' * len(chunk))
+                    cursor.execute(f'SELECT job_id FROM jobs WHERE job_id IN ({placeholders}) AND {where}',
+                                   chunk + params)
+                    matching.update(row[0] for row in cursor.fetchall())
+
+        return [job_id for job_id in job_ids if job_id in matching]
+
+    def filter_jobs_by_work_type(self, mask: int, job_ids: list[int] = None) -> list[int]:
+        """
+        Jobs sharing at least one work type with `mask`, see filter_jobs.
+        """
+        return self.filter_jobs(job_ids, work_type_mask=mask)
+
+    def backfill_work_type_masks(self, chunk_size: int = 1000) -> int:
+        """
+        Compute the work type mask of jobs stored before masks existed.
+
+        Returns:
+            Number of jobs updated
+        """
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT job_id, work_type FROM jobs WHERE work_type_mask IS NULL AND work_type IS NOT NULL')
+            rows = cursor.fetchall()
+
+        updates = []
+        for job_id, blob in rows:
+            mask = self._work_type_mask(self._blob_to_numpy(blob, 'jobs', 'work_type'))
+            if mask is not None:
+                updates.append((mask, job_id))
+
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            for chunk in utils.chunked(updates, chunk_size):
+                cursor.executemany('UPDATE jobs SET work_type_mask = ? WHERE job_id = ?', chunk)
+                conn.commit()
+
+        return len(updates)
+
+    def iter_job_embeddings(self, columns: list[str]):
+        """
+        Iterate over every stored job.
+
+        Args:
+            columns: Names of the embedding columns to fetch
+
+        Yields:
+            Tuples of (job_id, {column_name: embedding})
+        """
+        invalid = set(columns) - self.job_columns
+        if invalid:
+            raise ValueError(f"Invalid column names: {invalid}. Must be one of: {', '.join(sorted(self.job_columns))}")
+
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f'SELECT job_id, {", ".join(columns)} FROM jobs ORDER BY job_id')
+
+            for job_id, *blobs in cursor:
+                yield job_id, {
+                    column: self._blob_to_numpy(blob, 'jobs', column)
+                    for column, blob in zip(columns, blobs)
+                }
+
+    def iter_job_skill_terms(self):
+        """
+        Iterate over the jobs with known skills.
+
+        Yields:
+            Tuples of (job_id, sorted term ids)
+        """
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT job_id, skill_terms FROM jobs WHERE skill_terms IS NOT NULL')
+            for job_id, blob in cursor:
+                yield job_id, skills.from_blob(blob)
+
+    def get_users_skills(self, user_ids: list[int]) -> list:
+        """
+        Skills of many users as stored (see user_embedder.preprocess), in the order of user_ids.
+        """
+        found = dict()
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            for chunk in utils.chunked(set(user_ids), MAX_QUERY_IDS):
+                placeholders = ','.join('?' * len(chunk))
+                with instrumentation.stage('db.query'):
+                    cursor.execute(f'SELECT user_id, skills FROM users WHERE user_id IN ({placeholders})', chunk)
+                    rows = cursor.fetchall()
+                for user_id, blob in rows:
+                    found[user_id] = self._blob_to_numpy(blob, 'users', 'skills')
+
+        missing = [user_id for user_id in user_ids if user_id not in found]
+        if missing:
+            raise KeyError(f"Ids not found in users: {missing}")
+        return [found[user_id] for user_id in user_ids]
+
+    def migrate_legacy_blobs(self, chunk_size: int = 1000) -> int:
+        """
+        Rewrite legacy .npy blobs of numeric single-row embeddings in the raw format.
+        Rows already raw or sparse, and non-numeric values, are left untouched,
+        so running the migration again is a no-op.
+
+        Args:
+            chunk_size: Number of rows updated per commit
+
+        Returns:
+            Number of cells rewritten
+        """
+        tables = {'jobs': ('job_id', self.job_columns), 'users': ('user_id', self.user_columns)}
+        migrated = 0
+
+        for table, (key, columns) in tables.items():
+            for column in sorted(columns):
+                with self._connection() as conn:
+                    cursor = conn.cursor()
+                    cursor.execute(f'''
+                        SELECT {key}, {column} FROM {table}
+                        WHERE substr({column}, 1, {len(NPY_MAGIC)}) = ?
+                    ''', (NPY_MAGIC,))
+                    legacy = cursor.fetchall()
+
+                # Raw rows can start with the magic bytes by chance
+                meta = self.column_meta.get((table, column))
+                raw_size = self._raw_nbytes(meta) if meta else None
+
+                updates = []
+                for row_id, blob in legacy:
+                    if len(blob) == raw_size:
+                        continue
+                    new_blob = self._numpy_to_blob(self._blob_to_numpy(blob), table, column)
+                    if new_blob != blob:
+                        updates.append((new_blob, row_id))
+
+                with self._connection() as conn:
+                    cursor = conn.cursor()
+                    for chunk in utils.chunked(updates, chunk_size):
+                        cursor.executemany(f'UPDATE {table} SET {column} = ? WHERE {key} = ?', chunk)
+                        conn.commit()
+
+                migrated += len(updates)
+
+        return migrated
+
+    def rewrite_column(self, table: str, column: str, transform, chunk_size: int = 1000) -> int:
+        """
+        Replace every embedding of a column by transform(embeddings), e.g. to
+        project it to fewer dimensions. The recorded dimension of the column is
+        replaced and all rows are rewritten in one transaction, so readers never
+        see a mix of old and new embeddings. Listeners are notified once committed.
+
+        Args:
+            table: 'jobs' or 'users'
+            column: Embedding column to rewrite
+            transform: Function mapping a (n, dim) array or CSR matrix of stored
+                embeddings to a dense (n, new_dim) array
+            chunk_size: Number of rows transformed at once
+
+        Returns:
+            Number of rows rewritten
+        """
+        tables = {'jobs': ('job_id', self.job_columns), 'users': ('user_id', self.user_columns)}
+        if table not in tables:
+            raise ValueError(f"Invalid table name: {table}. Must be one of: {', '.join(tables)}")
+        key, columns = tables[table]
+        if column not in columns:
+            raise ValueError(f"Invalid column name: {column}. Must be one of: {', '.join(sorted(columns))}")
+
+        dtype = RAW_DTYPE
+        if table == 'jobs' and column in self.quantize:
+            dtype = QUANTIZED_DTYPES[self.quantize[column]].str
+
+        meta = None
+        rewritten = 0
+
+        with self._connection() as conn:
+            read, write = conn.cursor(), conn.cursor()
+            read.execute(f'SELECT {key} FROM {table} WHERE {column} IS NOT NULL ORDER BY {key}')
+            ids = [row[0] for row in read.fetchall()]
+
+            # Single transaction, committed once every row is rewritten and rolled back on error
+            for chunk in utils.chunked(ids, min(chunk_size, MAX_QUERY_IDS)):
+                placeholders = ','.join('?' * len(chunk))
+                read.execute(f'SELECT {key}, {column} FROM {table} WHERE {key} IN ({placeholders})', chunk)
+                rows = read.fetchall()
+
+                # Rows are decoded with the previous dimension of the column until the commit
+                embeddings = [self._blob_to_numpy(blob, table, column) for _, blob in rows]
+                if any(sparse.issparse(embedding) for embedding in embeddings):
+                    matrix = sparse.vstack([sparse.csr_matrix(embedding) for embedding in embeddings], format='csr')
+                else:
+                    matrix = np.vstack(embeddings)
+                transformed = np.asarray(transform(matrix))
+
+                if meta is None:
+                    meta = (np.dtype(dtype), transformed.shape[1])
+                write.executemany(f'UPDATE {table} SET {column} = ? WHERE {key} = ?',
+                                  [(self._raw_blob(vector, meta), row_id)
+                                   for vector, (row_id, _) in zip(transformed, rows)])
+                rewritten += len(rows)
+
+            if meta is not None:
+                write.execute('''
+                    INSERT OR REPLACE INTO embedding_columns (table_name, column_name, dtype, dim)
+                    VALUES (?, ?, ?, ?)
+                ''', (table, column, dtype, meta[1]))
+            conn.commit()
+
+            self.column_meta = self._load_column_meta(write)
+
+        if meta is not None:
+            for listener in self.listeners:
+                listener.on_column_rewritten(table, column)
+
+        return rewritten
+
+    def get_cached_embeddings(self, keys: list[bytes]) -> dict[bytes, np.ndarray | sparse.csr_matrix]:
+        """
+        Look up embeddings of the embedding cache.
+
+        Args:
+            keys: Cache keys to look up
+
+        Returns:
+            Mapping of the keys found to their embeddings
+        """
+        found = dict()
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            for chunk in utils.chunked(keys, MAX_QUERY_IDS):
+                placeholders = ','.join('?' * len(chunk))
+                cursor.execute(f'''
+                    SELECT cache_key, embedding FROM embedding_cache
+                    WHERE cache_key IN ({placeholders})
+                ''', chunk)
+                found.update((key, self._blob_to_numpy(blob)) for key, blob in cursor)
+        return found
+
+    def store_cached_embeddings(self, items: dict[bytes, np.ndarray | sparse.spmatrix]):
+        """Store embeddings in the embedding cache, exactly as given (dtype included)"""
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            cursor.executemany(
+                'INSERT OR REPLACE INTO embedding_cache (cache_key, embedding) VALUES (?, ?)',
+                [(key, self._numpy_to_blob(embedding)) for key, embedding in items.items()]
+            )
+            conn.commit()
+
+    def clear_cached_embeddings(self):
+        """Delete every entry of the embedding cache"""
+        with self._connection() as conn:
+            conn.execute('DELETE FROM embedding_cache')
+
+    def vacuum(self):
+        """Rebuild the database file to reclaim unused space"""
+        with self._connection() as conn:
+            conn.execute('VACUUM')
+
+    def get_job_ids(self) -> list[int]:
+        """Ids of every stored job, in ascending order"""
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT job_id FROM jobs ORDER BY job_id')
+            return [row[0] for row in cursor.fetchall()]
+
+    def get_user_ids(self) -> list[int]:
+        """Ids of every stored user, in ascending order"""
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT user_id FROM users ORDER BY user_id')
+            return [row[0] for row in cursor.fetchall()]
+
+    def get_complete_columns(self, table: str) -> list[str]:
+        """Embedding columns of a table set for every row, in alphabetical order"""
+        if table not in METADATA_COLUMNS:
+            raise ValueError(f"Invalid table: {table}. Must be one of: {', '.join(METADATA_COLUMNS)}")
+
+        columns = sorted(self.job_columns if table == 'jobs' else self.user_columns)
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"SELECT COUNT(*), {', '.join(f'COUNT({column})' for column in columns)} FROM {table}")
+            total, *counts = cursor.fetchone()
+        return [column for column, count in zip(columns, counts) if count == total]
+
     def get_missing_job_ids(self, job_ids: list[int]) -> list[int]:
         """
         Get list of job IDs that don't exist in the database.
@@ -196,7 +1082,7 @@ class EmbeddingDB:
         if not job_ids:
             return []
             
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connection() as conn:
             cursor = conn.cursor()
             
             # Create placeholders for SQL IN clause
@@ -227,7 +1113,7 @@ class EmbeddingDB:
         if not user_ids:
             return []
             
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connection() as conn:
             cursor = conn.cursor()
             
             # Create placeholders for SQL IN clause
@@ -0,0 +1,182 @@
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from scipy import sparse
+
+from Modules.database import EmbeddingDB
+
+# Precision of cached embeddings, the precision of the embeddings tables
+CACHE_DTYPE = np.float32
+
+
+def embedding_nbytes(embedding) -> int:
+    """Memory used by a dense or sparse embedding"""
+    if sparse.issparse(embedding):
+        return embedding.data.nbytes + embedding.indices.nbytes + embedding.indptr.nbytes
+    return np.asarray(embedding).nbytes
+
+
+def compact(embedding):
+    """
+    Owned float32 copy of an embedding row, dense or CSR. Slices of an encoded
+    batch would keep the whole batch alive, and float64 doubles the size of cached rows.
+    """
+    if sparse.issparse(embedding):
+        return sparse.csr_matrix(embedding, dtype=CACHE_DTYPE, copy=True)
+    embedding = np.asarray(embedding)
+    return np.array(embedding, dtype=CACHE_DTYPE if embedding.dtype.kind == 'f' else embedding.dtype)
+
+
+class EmbeddingCache:
+    """
+    Two-tier cache of text embeddings.
+
+    Keys are a hash of the model fingerprint and the cleaned text, so reposted
+    or duplicated job text is encoded once per model. Entries live in an
+    in-memory LRU tier bounded by size in bytes, backed by the embedding_cache
+    table of an EmbeddingDB.
+    """
+
+    def __init__(self, db: EmbeddingDB = None, max_bytes: int = 256 * 1024 * 1024):
+        """
+        Args:
+            db: Database holding the persistent tier, None for a memory-only cache
+            max_bytes: Maximum size of the in-memory tier
+        """
+        self.db = db
+        self.max_bytes = max_bytes
+        self.memory = OrderedDict()
+        self.memory_bytes = 0
+        self.lock = threading.Lock()
+
+        # Counters
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+        self.encode_seconds = 0.0
+
+    @staticmethod
+    def key(fingerprint: str, text: str) -> bytes:
+        return hashlib.sha256(f"{fingerprint}\0{text}".encode()).digest()
+
+    def get_many(self, keys: list[bytes]) -> dict:
+        """
+        Embeddings of the keys found in either tier.
+        Keys found in the database are promoted to the memory tier.
+        """
+        found = dict()
+        with self.lock:
+            for key in keys:
+                if key in self.memory:
+                    self.memory.move_to_end(key)
+                    found[key] = self.memory[key]
+            self.memory_hits += sum(1 for key in keys if key in found)
+
+        remaining = [key for key in dict.fromkeys(keys) if key not in found]
+        if remaining and self.db is not None:
+            # Entries written before they were compacted are read back as float32 too
+            stored = {key: compact(embedding) for key, embedding in self.db.get_cached_embeddings(remaining).items()}
+            with self.lock:
+                self.db_hits += sum(1 for key in keys if key in stored)
+                for key, embedding in stored.items():
+                    self._remember(key, embedding)
+            found.update(stored)
+
+        with self.lock:
+            self.misses += sum(1 for key in keys if key not in found)
+        return found
+
+    def put_many(self, items: dict, encode_seconds: float = 0.0) -> dict:
+        """
+        Store newly encoded embeddings in both tiers, as float32 copies (see compact).
+
+        Args:
+            items: Mapping of cache keys to embeddings
+            encode_seconds: Time spent encoding them, used to estimate the time saved by hits
+
+        Returns:
+            Mapping of the keys to the embeddings stored
+        """
+        items = {key: compact(embedding) for key, embedding in items.items()}
+        with self.lock:
+            for key, embedding in items.items():
+                self._remember(key, embedding)
+            self.encode_seconds += encode_seconds
+
+        if self.db is not None and items:
+            self.db.store_cached_embeddings(items)
+        return items
+
+    def get_or_encode(self, encode, keys: list[bytes], values: list):
+        """
+        Encode the values of the keys not in the cache, store them and return
+        the embedding of every key. Duplicated keys are encoded once.
+        """
+        found = self.get_many(keys)
+
+        missing = dict()
+        for key, value in zip(keys, values):
+            if key not in found and key not in missing:
+                missing[key] = value
+
+        if missing:
+            start = time.perf_counter()
+            embeddings = encode(list(missing.values()))
+            encoded = {key: embeddings[i:i + 1] for i, key in enumerate(missing)}
+            encoded = self.put_many(encoded, time.perf_counter() - start)
+            found.update(encoded)
+
+        return [found[key] for key in keys]
+
+    def stats(self) -> dict:
+        """
+        Hit / miss counters and the estimated encode time saved by hits.
+        """
+        with self.lock:
+            hits = self.memory_hits + self.db_hits
+            lookups = hits + self.misses
+            seconds_per_miss = self.encode_seconds / self.misses if self.misses else 0.0
+            return {
+                'memory_hits': self.memory_hits,
+                'db_hits': self.db_hits,
+                'misses': self.misses,
+                'hit_rate': hits / lookups if lookups else 0.0,
+                'memory_entries': len(self.memory),
+                'memory_bytes': self.memory_bytes,
+                'encode_seconds': self.encode_seconds,
+                'estimated_seconds_saved': hits * seconds_per_miss,
+            }
+
+    def reset_stats(self):
+        with self.lock:
+            self.memory_hits = self.db_hits = self.misses = 0
+            self.encode_seconds = 0.0
+
+    def clear(self):
+        """
+        Drop every entry of both tiers.
+        """
+        with self.lock:
+            self.memory = OrderedDict()
+            self.memory_bytes = 0
+        if self.db is not None:
+            self.db.clear_cached_embeddings()
+
+    def _remember(self, key: bytes, embedding):
+        if key in self.memory:
+            self.memory_bytes -= embedding_nbytes(self.memory.pop(key))
+
+        size = embedding_nbytes(embedding)
+        if size > self.max_bytes:
+            return
+
+        self.memory[key] = embedding
+        self.memory_bytes += size
+
+        # Evict least recently used entries until the tier fits
+        while self.memory_bytes > self.max_bytes:
+            _, evicted = self.memory.popitem(last=False)
+            self.memory_bytes -= embedding_nbytes(evicted)
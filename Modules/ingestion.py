@@ -0,0 +1,340 @@
+"""
+Streaming ingestion of jobs and users into the embeddings database.
+
+Records are read lazily from CSV or JSONL, rows already embedded are skipped,
+and cleaning, encoding and database writes run as overlapping stages connected
+by bounded queues, so memory stays flat whatever the size of the input.
+
+Usage:
+    python -m Modules.ingestion jobs Data/postings.csv --db Data/embeddings.db
+    python -m Modules.ingestion users Data/users.jsonl --progress-file Data/users.progress.json
+"""
+import os
+import sys
+import csv
+import json
+import time
+import queue
+import argparse
+import threading
+from typing import Iterable, Iterator
+
+from pydantic import ValidationError
+
+from Models.models import job, user
+from Modules import utils
+from Modules.database import EmbeddingDB, MAX_QUERY_IDS
+
+# Source columns accepted for each model field, e.g. the LinkedIn postings dump
+FIELD_ALIASES = {
+    'jobs': {
+        'job_id': ['job_id', 'id'],
+        'title': ['title'],
+        'content': ['content', 'description'],
+        'work_type': ['work_type', 'formatted_work_type'],
+        'location': ['location'],
+        'remote_allowed': ['remote_allowed'],
+        'posted_at': ['posted_at', 'listed_time', 'original_listed_time'],
+        'expires_at': ['expires_at', 'expiry'],
+        'skills': ['skills', 'skills_desc'],
+    },
+    'users': {
+        'user_id': ['user_id', 'id'],
+        'title': ['title'],
+        'about': ['about'],
+        'preferred_work_types': ['preferred_work_types'],
+        'experience_level': ['experience_level'],
+        'expected_salary': ['expected_salary'],
+        'skills': ['skills'],
+    },
+}
+
+LIST_FIELDS = {'preferred_work_types', 'skills'}
+
+# Flags exported as numbers, e.g. "1.0" in CSV files
+BOOL_FIELDS = {'remote_allowed'}
+
+# Marks the end of the stream between stages
+_END = object()
+
+
+def read_records(path: str) -> Iterator[dict]:
+    """
+    Lazily read records from a .csv or .jsonl file.
+    """
+    if path.endswith('.csv'):
+        # Job descriptions can be longer than the default field limit
+        csv.field_size_limit(sys.maxsize)
+        with open(path, newline='', encoding='utf-8') as f:
+            yield from csv.DictReader(f)
+
+    elif path.endswith(('.jsonl', '.ndjson')):
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+    else:
+        raise ValueError(f"Unsupported input format: {path}. Must be .csv or .jsonl")
+
+
+def to_model(record: dict, kind: str) -> job | user:
+    """
+    Build a job or user model from a source record.
+    List fields given as text are parsed as JSON lists or comma separated values.
+    """
+    values = dict()
+    for field, aliases in FIELD_ALIASES[kind].items():
+        value = next((record[alias] for alias in aliases if record.get(alias) not in (None, '')), None)
+
+        if field in LIST_FIELDS:
+            if isinstance(value, str):
+                value = json.loads(value) if value.startswith('[') else [v.strip() for v in value.split(',') if v.strip()]
+            elif value is None:
+                value = []
+
+        if field in BOOL_FIELDS and isinstance(value, (str, int, float)) and not isinstance(value, bool):
+            value = float(value) != 0
+
+        values[field] = value
+
+    model = job if kind == 'jobs' else user
+    return model(**values)
+
+
+class ingestion_pipeline:
+    """
+    Reads, cleans, encodes and stores records in four threads connected by
+    bounded queues. Progress is checkpointed after every written chunk so an
+    interrupted run resumes where it stopped.
+    """
+
+    def __init__(self,
+                 db: EmbeddingDB,
+                 embedder,
+                 kind: str,
+                 chunk_size: int = 512,
+                 batch_size: int = 64,
+                 queue_size: int = 4,
+                 progress_path: str = None,
+                 report_every: float = 10.0):
+        """
+        Args:
+            db: Database the embeddings are written to
+            embedder: job_embedder or user_embedder matching `kind`
+            kind: 'jobs' or 'users'
+            chunk_size: Number of records moving through the stages together
+            batch_size: Encoder batch size
+            queue_size: Maximum number of chunks waiting between two stages
+            progress_path: JSON file recording how many source records are done
+            report_every: Seconds between two progress reports on stderr
+        """
+        if kind not in FIELD_ALIASES:
+            raise ValueError(f"Invalid kind: {kind}. Must be one of: {', '.join(FIELD_ALIASES)}")
+
+        self.db = db
+        self.embedder = embedder
+        self.kind = kind
+        self.chunk_size = chunk_size
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.progress_path = progress_path
+        self.report_every = report_every
+
+        self.key = 'job_id' if kind == 'jobs' else 'user_id'
+        self.get_missing_ids = db.get_missing_job_ids if kind == 'jobs' else db.get_missing_user_ids
+        self.store_batch = db.store_job_embeddings_batch if kind == 'jobs' else db.store_user_embeddings_batch
+
+        self.stats = {'read': 0, 'invalid': 0, 'skipped': 0, 'written': 0}
+        self.error = None
+        self.stop = threading.Event()
+
+    def run(self, records: Iterable[dict]) -> dict:
+        """
+        Ingest the records and return the run statistics.
+        """
+        offset = self._load_progress()
+
+        to_clean = queue.Queue(self.queue_size)
+        to_encode = queue.Queue(self.queue_size)
+        to_write = queue.Queue(self.queue_size)
+
+        stages = [
+            threading.Thread(target=self._guard, args=(self._read, records, offset, to_clean), daemon=True),
+            threading.Thread(target=self._guard, args=(self._transform, self._clean, to_clean, to_encode), daemon=True),
+            threading.Thread(target=self._guard, args=(self._transform, self._encode, to_encode, to_write), daemon=True),
+            threading.Thread(target=self._guard, args=(self._write, to_write), daemon=True),
+        ]
+
+        self.start_time = time.perf_counter()
+        self.last_report = self.start_time
+        for stage in stages:
+            stage.start()
+        for stage in stages:
+            stage.join()
+
+        if self.error is not None:
+            raise self.error
+
+        self._report(final=True)
+        return dict(self.stats, seconds=time.perf_counter() - self.start_time)
+
+    def _guard(self, stage, *args):
+        """
+        Run a stage, stopping the whole pipeline on error.
+        """
+        try:
+            stage(*args)
+        except BaseException as error:
+            if self.error is None:
+                self.error = error
+            self.stop.set()
+
+    def _put(self, outbox: queue.Queue, item):
+        # Block on a full queue (backpressure) but give up if another stage failed
+        while not self.stop.is_set():
+            try:
+                outbox.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def _get(self, inbox: queue.Queue):
+        while not self.stop.is_set():
+            try:
+                return inbox.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        return _END
+
+    def _read(self, records: Iterable[dict], offset: int, outbox: queue.Queue):
+        """
+        Stage 1: parse records into models and drop rows already in the database.
+        Each chunk carries the source offset reached, used as the resume point.
+        """
+        position = 0
+        for chunk in utils.chunked(records, self.chunk_size):
+            position += len(chunk)
+            if position <= offset:
+                continue
+
+            # Part of the first chunk may already be done
+            chunk = chunk[max(0, offset - (position - len(chunk))):]
+
+            models = []
+            for record in chunk:
+                try:
+                    models.append(to_model(record, self.kind))
+                except (ValidationError, ValueError):
+                    self.stats['invalid'] += 1
+
+            ids = [getattr(model, self.key) for model in models]
+            missing = set()
+            for ids_chunk in utils.chunked(ids, MAX_QUERY_IDS):
+                missing.update(self.get_missing_ids(ids_chunk))
+            new_models = [model for model in models if getattr(model, self.key) in missing]
+
+            self.stats['read'] += len(chunk)
+            self.stats['skipped'] += len(models) - len(new_models)
+            self._put(outbox, (position, new_models))
+
+            if self.stop.is_set():
+                return
+
+        self._put(outbox, _END)
+
+    def _transform(self, transform, inbox: queue.Queue, outbox: queue.Queue):
+        while (item := self._get(inbox)) is not _END:
+            position, models = item
+            self._put(outbox, (position, transform(models) if models else models))
+        self._put(outbox, _END)
+
+    def _clean(self, models: list):
+        """Stage 2: text cleaning"""
+        return [self.embedder.preprocess(model) for model in models]
+
+    def _encode(self, models: list):
+        """Stage 3: batched encoding"""
+        return self.embedder.encode_batch(models, batch_size=self.batch_size)
+
+    def _write(self, inbox: queue.Queue):
+        """Stage 4: bulk database writes and progress checkpoints"""
+        while (item := self._get(inbox)) is not _END:
+            position, models = item
+            self.stats['written'] += self.store_batch(
+                ((getattr(model, self.key), model) for model in models), chunk_size=self.chunk_size
+            )
+            self._save_progress(position)
+            self._report()
+
+    def _load_progress(self) -> int:
+        if not self.progress_path or not os.path.exists(self.progress_path):
+            return 0
+        with open(self.progress_path) as f:
+            return json.load(f)['records_done']
+
+    def _save_progress(self, position: int):
+        if not self.progress_path:
+            return
+
+        # Write then rename so an interruption never leaves a partial file
+        tmp_path = self.progress_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'records_done': position, **self.stats}, f)
+        os.replace(tmp_path, self.progress_path)
+
+    def _report(self, final: bool = False):
+        now = time.perf_counter()
+        if not final and now - self.last_report < self.report_every:
+            return
+
+        self.last_report = now
+        elapsed = max(now - self.start_time, 1e-9)
+        print(
+            f"[{self.kind}] read {self.stats['read']} ({self.stats['read'] / elapsed:.1f} rows/sec), "
+            f"written {self.stats['written']} ({self.stats['written'] / elapsed:.1f} rows/sec), "
+            f"skipped {self.stats['skipped']}, invalid {self.stats['invalid']}",
+            file=sys.stderr,
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Embed jobs or users from a CSV / JSONL file into the embeddings database')
+    parser.add_argument('kind', choices=list(FIELD_ALIASES), help='Type of records in the input file')
+    parser.add_argument('path', help='Input .csv or .jsonl file')
+    parser.add_argument('--db', default='Data/embeddings.db', help='Path of the embeddings database')
+    parser.add_argument('--chunk-size', type=int, default=512, help='Records per pipeline chunk')
+    parser.add_argument('--batch-size', type=int, default=64, help='Encoder batch size')
+    parser.add_argument('--queue-size', type=int, default=4, help='Chunks buffered between stages')
+    parser.add_argument('--sparse', action='store_true', help='Store TF-IDF embeddings sparse')
+    parser.add_argument('--projected', action='store_true',
+                        help='Encode content with the fitted TF-IDF projection, see Modules.projection')
+    parser.add_argument('--progress-file', help='Checkpoint file used to resume an interrupted run')
+    parser.add_argument('--skill-vocabulary',
+                        help='Text file of known skills, one per line, also taken from the content of jobs')
+    args = parser.parse_args()
+
+    # Deferred so --help does not load the preprocessing stack
+    from Modules.preprocessor import job_embedder, user_embedder
+    from Modules.skills import skill_vocabulary
+
+    if args.kind == 'jobs':
+        vocabulary = skill_vocabulary.from_file(args.skill_vocabulary) if args.skill_vocabulary else None
+        embedder = job_embedder(sparse=args.sparse, projected=args.projected, skill_vocabulary=vocabulary)
+    else:
+        embedder = user_embedder(sparse=args.sparse, projected=args.projected)
+    pipeline = ingestion_pipeline(
+        EmbeddingDB(args.db, pooled=True),
+        embedder,
+        args.kind,
+        chunk_size=args.chunk_size,
+        batch_size=args.batch_size,
+        queue_size=args.queue_size,
+        progress_path=args.progress_file,
+    )
+    stats = pipeline.run(read_records(args.path))
+    print(json.dumps(stats))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,318 @@
+"""
+Per-stage timings and counters for the embedding, storage and ranking code.
+
+Code paths wrap their stages with `stage(name)` and report volumes with
+`count(name, value)`. Both are forwarded to the installed sink; the default
+sink is disabled, so an uninstrumented process only pays for a flag check.
+
+    from Modules import instrumentation
+
+    sink = instrumentation.PrometheusSink()
+    instrumentation.set_sink(sink)
+    ...
+    print(sink.render())
+
+Slow requests can additionally be profiled with a sampling profiler:
+
+    instrumentation.set_profiler(instrumentation.sampling_profiler(threshold=0.5))
+"""
+import re
+import sys
+import time
+import random
+import bisect
+import logging
+import threading
+from collections import Counter
+from functools import wraps
+from contextlib import nullcontext
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the stage duration histogram buckets, in seconds
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Returned by stage() and request() when nothing is recorded
+_NULL_CONTEXT = nullcontext()
+
+
+class metrics_sink:
+    """
+    Receives stage durations and counter increments.
+    The base class drops everything; subclasses set `enabled` and override the hooks.
+    """
+    enabled = False
+
+    def observe(self, stage: str, seconds: float):
+        pass
+
+    def increment(self, counter: str, value: float = 1):
+        pass
+
+
+class PrometheusSink(metrics_sink):
+    """
+    Keeps stage duration histograms and counters in memory and renders them
+    in the Prometheus text exposition format.
+    """
+    enabled = True
+
+    def __init__(self, namespace: str = 'recommender', buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.namespace = namespace
+        self.buckets = tuple(sorted(buckets))
+        self.histograms: dict[str, list] = dict()
+        self.sums: dict[str, float] = dict()
+        self.counters: dict[str, float] = dict()
+        self.lock = threading.Lock()
+
+    def observe(self, stage: str, seconds: float):
+        with self.lock:
+            if stage not in self.histograms:
+                # One count per bucket plus the +Inf bucket
+                self.histograms[stage] = [0] * (len(self.buckets) + 1)
+                self.sums[stage] = 0.0
+            self.histograms[stage][bisect.bisect_left(self.buckets, seconds)] += 1
+            self.sums[stage] += seconds
+
+    def increment(self, counter: str, value: float = 1):
+        with self.lock:
+            self.counters[counter] = self.counters.get(counter, 0) + value
+
+    def snapshot(self) -> dict:
+        """
+        Current values: {'stages': {stage: {'count', 'sum'}}, 'counters': {name: value}}.
+        """
+        with self.lock:
+            return {
+                'stages': {stage: {'count': sum(counts), 'sum': self.sums[stage]}
+                           for stage, counts in self.histograms.items()},
+                'counters': dict(self.counters),
+            }
+
+    def reset(self):
+        with self.lock:
+            self.histograms.clear()
+            self.sums.clear()
+            self.counters.clear()
+
+    def render(self) -> str:
+        """
+        Metrics in the Prometheus text exposition format.
+        """
+        name = f'{self.namespace}_stage_duration_seconds'
+        lines = [f'# HELP {name} Duration of instrumented stages.', f'# TYPE {name} histogram']
+
+        with self.lock:
+            for stage in sorted(self.histograms):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float('inf'),), self.histograms[stage]):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f'{name}_bucket{{stage="{stage}",le="{le}"}} {cumulative}')
+                lines.append(f'{name}_sum{{stage="{stage}"}} {self.sums[stage]}')
+                lines.append(f'{name}_count{{stage="{stage}"}} {cumulative}')
+
+            for counter in sorted(self.counters):
+                metric = f'{self.namespace}_{_metric_name(counter)}_total'
+                lines.append(f'# TYPE {metric} counter')
+                lines.append(f'{metric} {self.counters[counter]}')
+
+        return '\n'.join(lines) + '\n'
+
+
+def _metric_name(name: str) -> str:
+    return re.sub(r'[^a-zA-Z0-9_]', '_', name)
+
+
+class _stage_timer:
+    __slots__ = ('sink', 'name', 'start')
+
+    def __init__(self, sink: metrics_sink, name: str):
+        self.sink = sink
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.sink.observe(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class sampling_profiler:
+    """
+    Samples the stack of the thread serving a request at a fixed interval and
+    reports the folded stacks of requests slower than `threshold` seconds.
+    """
+
+    def __init__(self, interval: float = 0.005, threshold: float = 0.5,
+                 sample_rate: float = 1.0, callback=None, max_depth: int = 64):
+        """
+        Args:
+            interval: Seconds between two stack samples
+            threshold: Minimum request duration reported to the callback
+            sample_rate: Fraction of requests profiled
+            callback: Called as callback(name, seconds, stacks) for slow requests, where
+                stacks is a Counter of 'outer;...;inner' frame strings; logs them by default
+            max_depth: Maximum number of frames kept per sample
+        """
+        self.interval = interval
+        self.threshold = threshold
+        self.sample_rate = sample_rate
+        self.callback = callback or self.log_slow_request
+        self.max_depth = max_depth
+
+    def profile(self, name: str):
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return _NULL_CONTEXT
+        return _profiled_request(self, name)
+
+    def sample(self, thread_id: int, stacks: Counter, stop: threading.Event):
+        while not stop.wait(self.interval):
+            frame = sys._current_frames().get(thread_id)
+            frames = []
+            while frame is not None and len(frames) < self.max_depth:
+                code = frame.f_code
+                frames.append(f'{code.co_filename}:{code.co_name}:{frame.f_lineno}')
+                frame = frame.f_back
+            if frames:
+                stacks[';'.join(reversed(frames))] += 1
+
+    @staticmethod
+    def log_slow_request(name: str, seconds: float, stacks: Counter):
+        top = '\n'.join(f'  {count:5d} {stack}' for stack, count in stacks.most_common(5))
+        logger.warning('Slow request %s took %.3fs, top sampled stacks:\n%s', name, seconds, top)
+
+
+class _profiled_request:
+    def __init__(self, profiler: sampling_profiler, name: str):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.stacks = Counter()
+        self.stop = threading.Event()
+        self.sampler = threading.Thread(
+            target=self.profiler.sample, args=(threading.get_ident(), self.stacks, self.stop), daemon=True
+        )
+        self.start = time.perf_counter()
+        self.sampler.start()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.start
+        self.stop.set()
+        self.sampler.join()
+        if seconds >= self.profiler.threshold:
+            self.profiler.callback(self.name, seconds, self.stacks)
+        return False
+
+
+class _request:
+    """
+    Times a whole request as the stage 'request.<name>' and profiles it if a profiler
+    is installed. Nested requests are only profiled by the outermost one.
+    """
+    _depth = threading.local()
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        depth = getattr(self._depth, 'value', 0)
+        self._depth.value = depth + 1
+
+        self.contexts = [stage(f'request.{self.name}')]
+        if depth == 0 and _profiler is not None:
+            self.contexts.append(_profiler.profile(self.name))
+
+        for context in self.contexts:
+            context.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        for context in reversed(self.contexts):
+            context.__exit__(*exc)
+        self._depth.value -= 1
+        return False
+
+
+_sink = metrics_sink()
+_profiler: sampling_profiler = None
+
+
+def set_sink(sink: metrics_sink | None):
+    """
+    Install the sink receiving every measurement, None restores the no-op default.
+    """
+    global _sink
+    _sink = sink or metrics_sink()
+
+
+def get_sink() -> metrics_sink:
+    return _sink
+
+
+def set_profiler(profiler: sampling_profiler | None):
+    """
+    Install the profiler of slow requests, None disables profiling.
+    """
+    global _profiler
+    _profiler = profiler
+
+
+def enabled() -> bool:
+    return _sink.enabled
+
+
+def stage(name: str):
+    """
+    Context manager timing a stage.
+    """
+    if not _sink.enabled:
+        return _NULL_CONTEXT
+    return _stage_timer(_sink, name)
+
+
+def count(name: str, value: float = 1):
+    """
+    Add `value` to a counter.
+    """
+    if _sink.enabled:
+        _sink.increment(name, value)
+
+
+def request(name: str):
+    """
+    Context manager wrapping a whole request, see _request.
+    """
+    if not _sink.enabled and _profiler is None:
+        return _NULL_CONTEXT
+    return _request(name)
+
+
+def timed(name: str):
+    """
+    Decorator timing every call of a function as the stage `name`.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def traced(name: str):
+    """
+    Decorator running every call of a function as the request `name`.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with request(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
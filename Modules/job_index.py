@@ -0,0 +1,199 @@
+import threading
+import numpy as np
+from scipy import sparse
+
+from Modules import consts
+from Modules.database import EmbeddingDB, db_listener
+
+
+class dense_column:
+    """
+    Contiguous (n_rows, dim) matrix with amortized growth.
+    """
+
+    def __init__(self, dim: int, dtype, capacity: int = 1024):
+        self.data = np.empty((max(capacity, 1), dim), dtype=dtype)
+
+    def set(self, row: int, value: np.ndarray):
+        if row >= len(self.data):
+            # Double the capacity to keep appends amortized O(1)
+            grown = np.empty((max(2 * len(self.data), row + 1), self.data.shape[1]), dtype=self.data.dtype)
+            grown[:len(self.data)] = self.data
+            self.data = grown
+        self.data[row] = np.asarray(value).reshape(-1)
+
+    def move(self, src: int, dst: int):
+        self.data[dst] = self.data[src]
+
+    def take(self, rows: np.ndarray) -> np.ndarray:
+        return self.data[rows]
+
+
+class sparse_column:
+    """
+    Sparse rows kept as a list, stacked into a CSR matrix lazily after changes.
+    """
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        self.rows: list[sparse.csr_matrix] = []
+        self._stacked = None
+
+    def set(self, row: int, value):
+        value = sparse.csr_matrix(value).reshape(1, self.dim)
+        if row == len(self.rows):
+            self.rows.append(value)
+        else:
+            self.rows[row] = value
+        self._stacked = None
+
+    def move(self, src: int, dst: int):
+        self.rows[dst] = self.rows[src]
+        self._stacked = None
+
+    def truncate(self, n_rows: int):
+        del self.rows[n_rows:]
+        self._stacked = None
+
+    def take(self, rows: np.ndarray) -> sparse.csr_matrix:
+        if self._stacked is None:
+            self._stacked = sparse.vstack(self.rows, format='csr') if self.rows else sparse.csr_matrix((0, self.dim))
+        return self._stacked[rows]
+
+
+class JobIndex(db_listener):
+    """
+    Resident in-memory copy of the jobs embeddings.
+
+    Loads the jobs table once into one contiguous matrix per feature plus a
+    job_id -> row map, then follows every store / delete made through the
+    EmbeddingDB it is attached to, so recommenders can slice candidate rows
+    without touching SQLite.
+    """
+
+    def __init__(self, db: EmbeddingDB, features: list[str] = None):
+        self.db = db
+        self.features = features or consts.job_recommendation_features
+        self.columns = dict()
+        self.ids = np.empty(0, dtype=np.int64)
+        self.rows: dict[int, int] = dict()
+        self.lock = threading.RLock()
+
+        self.load()
+        db.add_listener(self)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, job_id: int):
+        return job_id in self.rows
+
+    def load(self):
+        """
+        (Re)load every job from the database.
+        """
+        with self.lock:
+            self.columns = dict()
+            self.ids = np.empty(0, dtype=np.int64)
+            self.rows = dict()
+
+            for job_id, embeddings in self.db.iter_job_embeddings(self.features):
+                self._upsert(job_id, embeddings)
+
+    def close(self):
+        """
+        Stop following database writes.
+        """
+        self.db.remove_listener(self)
+
+    def on_job_stored(self, job_id: int, embeddings):
+        # Same precision as the rows loaded from quantized columns
+        self.upsert(job_id, {feature: self.db.as_stored('jobs', feature, getattr(embeddings, feature))
+                             for feature in self.features})
+
+    def on_job_deleted(self, job_id: int):
+        self.delete(job_id)
+
+    def on_column_rewritten(self, table: str, column: str):
+        if table == 'jobs' and column in self.features:
+            self.load()
+
+    def upsert(self, job_id: int, embeddings: dict):
+        """
+        Insert or replace the embeddings of a job.
+        """
+        with self.lock:
+            self._upsert(job_id, embeddings)
+
+    def delete(self, job_id: int):
+        """
+        Remove a job, moving the last row into its place.
+        """
+        with self.lock:
+            row = self.rows.pop(job_id, None)
+            if row is None:
+                return
+
+            last = len(self.rows)
+            if row != last:
+                last_id = int(self.ids[last])
+                for column in self.columns.values():
+                    column.move(last, row)
+                self.ids[row] = last_id
+                self.rows[last_id] = row
+
+            for column in self.columns.values():
+                if isinstance(column, sparse_column):
+                    column.truncate(last)
+
+    def get_job(self, job_id: int) -> dict:
+        """
+        Embeddings of a single job as (1, dim) matrices, or None if it is not indexed.
+        """
+        with self.lock:
+            row = self.rows.get(job_id)
+            if row is None:
+                return None
+            return {feature: column.take(np.array([row])) for feature, column in self.columns.items()}
+
+    def get_jobs(self, job_ids: list[int]) -> dict:
+        """
+        Candidate matrices for the given jobs, one row per job in the order of job_ids.
+        """
+        with self.lock:
+            rows = np.fromiter((self.rows[job_id] for job_id in job_ids), dtype=np.int64, count=len(job_ids))
+            return {feature: column.take(rows) for feature, column in self.columns.items()}
+
+    def _upsert(self, job_id: int, embeddings: dict):
+        n_rows = len(self.rows)
+        row = self.rows.get(job_id, n_rows)
+
+        for feature in self.features:
+            self._column(feature, embeddings[feature], n_rows).set(row, embeddings[feature])
+
+        if job_id not in self.rows:
+            if row >= len(self.ids):
+                self.ids = np.resize(self.ids, max(2 * len(self.ids), row + 1))
+            self.ids[row] = job_id
+            self.rows[job_id] = row
+
+    def _column(self, feature: str, value, n_rows: int):
+        """
+        Column for a feature, created from its first value.
+        A dense column is converted to sparse as soon as a sparse row arrives.
+        """
+        column = self.columns.get(feature)
+        dim = value.shape[-1]
+
+        if column is None:
+            column = sparse_column(dim) if sparse.issparse(value) else dense_column(dim, value.dtype)
+            self.columns[feature] = column
+
+        elif sparse.issparse(value) and isinstance(column, dense_column):
+            dense = column
+            column = sparse_column(dim)
+            for row in range(n_rows):
+                column.set(row, dense.data[row:row + 1])
+            self.columns[feature] = column
+
+        return column
@@ -0,0 +1,31 @@
+"""
+One-time migration of an embeddings database to the raw float32 blob format,
+also filling the work type masks of jobs stored before they existed.
+
+Usage:
+    python -m Modules.migrations --db Data/embeddings.db
+"""
+import argparse
+
+from Modules.database import EmbeddingDB
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--db', default='Data/embeddings.db', help='Path of the embeddings database')
+    parser.add_argument('--chunk-size', type=int, default=1000, help='Rows updated per commit')
+    args = parser.parse_args()
+
+    db = EmbeddingDB(args.db)
+    migrated = db.migrate_legacy_blobs(chunk_size=args.chunk_size)
+    print(f"Migrated {migrated} embeddings to the raw format")
+
+    backfilled = db.backfill_work_type_masks(chunk_size=args.chunk_size)
+    print(f"Computed the work type mask of {backfilled} jobs")
+
+    # Reclaim the space freed by the smaller blobs
+    db.vacuum()
+
+
+if __name__ == '__main__':
+    main()
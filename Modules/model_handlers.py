@@ -1,28 +1,67 @@
 import os
+import sys
 import pickle
+import hashlib
+import threading
+import numpy as np
 from .consts import workspace_dir
-from sentence_transformers import SentenceTransformer
-from sklearn.preprocessing import OneHotEncoder
-from sklearn.feature_extraction.text import TfidfVectorizer
+
+# sentence_transformers (and torch) and scikit-learn are imported lazily,
+# the first time a model is loaded, to keep imports of this package fast
 
 models_path = workspace_dir + 'AI_Models/'
 vectorizers_path = models_path + 'Vectorizers/'
 encoders_path = models_path + 'Encoders/'
 
 
-def embed(model, inpt):
-    if isinstance(model, SentenceTransformer):
-        return model.encode(inpt)
+def _isinstance(obj, module: str, name: str) -> bool:
+    """isinstance check that does not import `module` if it is not imported yet"""
+    loaded = sys.modules.get(module)
+    return loaded is not None and isinstance(obj, getattr(loaded, name))
 
-    elif isinstance(model, TfidfVectorizer):
-        return model.transform(inpt).toarray()
 
-    elif isinstance(model, OneHotEncoder):
+def embed(model, inpt, batch_size: int = 32, sparse: bool = False):
+    if _isinstance(model, 'sentence_transformers', 'SentenceTransformer'):
+        return model.encode(inpt, batch_size=batch_size)
+
+    elif _isinstance(model, 'Modules.quantized_encoder', 'QuantizedSentenceEncoder'):
+        return model.encode(inpt, batch_size=batch_size)
+
+    elif _isinstance(model, 'sklearn.feature_extraction.text', 'TfidfVectorizer'):
+        # Keep the CSR output when sparse embeddings are requested
+        embeddings = model.transform(inpt)
+        return embeddings if sparse else embeddings.toarray()
+
+    elif _isinstance(model, 'sklearn.pipeline', 'Pipeline'):
+        # TF-IDF followed by the content projection, always dense
+        return np.asarray(model.transform(inpt))
+
+    elif _isinstance(model, 'sklearn.preprocessing', 'OneHotEncoder'):
         return model.transform(inpt).toarray()
     else:
         raise ValueError('Invalid model type:', type(model))
 
 
+def model_fingerprint(model) -> str:
+    """
+    Short hash identifying a model and its weights.
+    Torch modules are hashed from their parameter names, shapes and sums,
+    models with a fingerprint() method from its result, other models from
+    their pickled state.
+    """
+    digest = hashlib.sha256(type(model).__qualname__.encode())
+
+    if hasattr(model, 'fingerprint'):
+        digest.update(model.fingerprint().encode())
+    elif _isinstance(model, 'torch.nn', 'Module'):
+        for name, tensor in model.state_dict().items():
+            digest.update(f"{name}{tuple(tensor.shape)}{float(tensor.float().sum())!r}".encode())
+    else:
+        digest.update(pickle.dumps(model))
+
+    return digest.hexdigest()[:16]
+
+
 class model_loader:
 
     def __load_model(self, path: str):
@@ -36,14 +75,22 @@ class model_loader:
         return model
 
     def load_sentence_transformer(self, path: str):
+        from sentence_transformers import SentenceTransformer
         return SentenceTransformer(path)
 
+    def load_quantized_sentence_transformer(self, path: str, **options):
+        # Options of QuantizedSentenceEncoder: num_threads, buckets, min_cosine, calibration_texts
+        from Modules.quantized_encoder import QuantizedSentenceEncoder
+        return QuantizedSentenceEncoder(path, **options)
+
     def load_sklearn_model(self, path: str):
         return self.__load_model(path)
 
-    def load_vectorizer(self, name: str, model_type: str):
+    def load_vectorizer(self, name: str, model_type: str, **options):
         if model_type == 'sentence_transformer':
             return self.load_sentence_transformer(vectorizers_path + name)
+        elif model_type == 'quantized_sentence_transformer':
+            return self.load_quantized_sentence_transformer(vectorizers_path + name, **options)
         elif model_type == 'sklearn':
             return self.load_sklearn_model(vectorizers_path + name)
         else:
@@ -54,3 +101,71 @@ class model_loader:
             return self.load_sklearn_model(encoders_path + name)
         else:
             raise ValueError('Invalid encoder type:', model_type)
+
+
+class model_registry:
+    """
+    Process-wide cache of loaded models.
+    Each model is loaded once, on first use, and the same instance is handed
+    to every embedder asking for it.
+    """
+
+    # name: (loader method, file name, model type)
+    models = {
+        'title_vectorizer': ('load_vectorizer', 'MiniLM', 'sentence_transformer'),
+        'quantized_title_vectorizer': ('load_vectorizer', 'MiniLM', 'quantized_sentence_transformer'),
+        'content_vectorizer': ('load_vectorizer', 'jobs_tfidf.pkl', 'sklearn'),
+        'projected_content_vectorizer': ('load_vectorizer', 'jobs_tfidf_svd.pkl', 'sklearn'),
+        'work_type_encoder': ('load_encoder', 'work_type_onehot_enc.pkl', 'sklearn'),
+    }
+
+    # Models the embedders use by default. The others are alternatives loaded on request:
+    # the projection only exists once fitted by Modules.projection
+    base_models = ('title_vectorizer', 'content_vectorizer', 'work_type_encoder')
+
+    def __init__(self, loader: model_loader = None):
+        self.loader = loader or model_loader()
+        self.loaded = dict()
+        self.lock = threading.Lock()
+
+    def get(self, name: str):
+        """
+        Return the model registered under `name`, loading it on first use.
+        """
+        if name in self.loaded:
+            return self.loaded[name]
+
+        if name not in self.models:
+            raise ValueError(f"Unknown model: {name}. Must be one of: {', '.join(self.models)}")
+
+        with self.lock:
+            if name not in self.loaded:
+                method, file_name, model_type = self.models[name]
+                self.loaded[name] = getattr(self.loader, method)(file_name, model_type=model_type)
+
+        return self.loaded[name]
+
+    def warm_up(self, names: list[str] = None):
+        """
+        Load the given models (the base models by default) and run one
+        embedding through each, so the first request does not pay for it.
+        """
+        samples = {
+            'title_vectorizer': ['software engineer'],
+            'quantized_title_vectorizer': ['software engineer'],
+            'content_vectorizer': ['software engineer'],
+            'projected_content_vectorizer': ['software engineer'],
+            'work_type_encoder': [['FULL_TIME']],
+        }
+        for name in names or self.base_models:
+            embed(self.get(name), samples[name])
+
+    def clear(self):
+        """
+        Drop every loaded model.
+        """
+        with self.lock:
+            self.loaded = dict()
+
+
+registry = model_registry()
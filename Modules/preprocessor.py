@@ -1,5 +1,7 @@
 import re
 import numpy as np
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
 
 import nltk
 from nltk.corpus import stopwords
@@ -8,7 +10,9 @@ from nltk.stem import WordNetLemmatizer
 
 from abc import ABC, abstractmethod
 
-from Modules.model_handlers import model_loader, embed
+from Modules.model_handlers import model_loader, model_fingerprint, registry, embed
+from Modules.embedding_cache import EmbeddingCache
+from Modules import instrumentation, skills
 import Modules.consts as consts
 
 from pydantic import BaseModel
@@ -20,15 +24,59 @@ nltk.data.path.append(download_path)
 loader = model_loader()
 
 
+# Patterns compiled once and shared by every preprocessor
+URL_REGEX = re.compile(consts.URL_PATTERN)
+HTML_TAG_REGEX = re.compile(r'<.*?>')
+NON_ALPHA_REGEX = re.compile(r'[^a-z ]')
+SPACES_REGEX = re.compile(r'\s+')
+
+# Words split by NLTK's word_tokenize even when the text only contains [a-z ]
+TOKENIZER_CONTRACTIONS = {
+    'cannot': ['can', 'not'],
+    'gimme': ['gim', 'me'],
+    'gonna': ['gon', 'na'],
+    'gotta': ['got', 'ta'],
+    'lemme': ['lem', 'me'],
+    'wanna': ['wan', 'na'],
+}
+
+
 class text_preprocessor:
-    def __init__(self):
+    def __init__(self, fast: bool = True, lemma_cache_size: int = 65536):
+        """
+        Args:
+            fast: Tokenize with str.split instead of NLTK's word_tokenize and memoize
+                lemmas. Produces the same output as the NLTK path.
+            lemma_cache_size: Maximum number of memoized lemmas in the fast path
+        """
         self.stop_words = set(stopwords.words('english'))
         self.lemmatizer = WordNetLemmatizer()
+        self.fast = fast
+        self.lemma_cache_size = lemma_cache_size
+
+        # Job text vocabulary is very repetitive, so most lemmas come from the cache
+        self.lemmatize_word = lru_cache(maxsize=lemma_cache_size)(self._lemmatize_word)
+
+    def _lemmatize_word(self, word):
+        return self.lemmatizer.lemmatize(word, pos='v')
 
     def lemmatize_words(self, text):
         lemmas = [self.lemmatizer.lemmatize(word, pos='v') for word in text]
         return lemmas
 
+    def tokenize(self, txt):
+        """
+        Tokenizer for text already reduced to lowercase letters and spaces.
+        Matches word_tokenize on such text, including the contractions it splits.
+        """
+        tokens = []
+        for word in txt.split():
+            if word in TOKENIZER_CONTRACTIONS:
+                tokens.extend(TOKENIZER_CONTRACTIONS[word])
+            else:
+                tokens.append(word)
+        return tokens
+
     def preprocess(self, txt):
 
         if not txt:
@@ -36,14 +84,23 @@ class text_preprocessor:
 
         txt = txt.lower()
 
-        txt = re.sub(consts.URL_PATTERN, '', txt)  # to remove links
+        # Every link match contains a dot and every tag a '<', skip the scans otherwise
+        if '.' in txt:
+            txt = URL_REGEX.sub('', txt)  # to remove links
 
-        txt = re.sub(r'<.*?>', '', txt)  # to remove html tags </>
+        if '<' in txt:
+            txt = HTML_TAG_REGEX.sub('', txt)  # to remove html tags </>
 
-        txt = re.sub(r'[^a-z ]', '', txt)  # remove non-alpha character
+        txt = NON_ALPHA_REGEX.sub('', txt)  # remove non-alpha character
+
+        if self.fast:
+            return [
+                self.lemmatize_word(word) for word in self.tokenize(txt)
+                if len(word) > 1 and word not in self.stop_words
+            ]
 
         # replace multiple spaces with single space
-        txt = re.sub(r'\s+', ' ', txt)
+        txt = SPACES_REGEX.sub(' ', txt)
 
         tokenized_txt = word_tokenize(txt)
         words = [word for word in tokenized_txt if (
@@ -55,12 +112,27 @@ class text_preprocessor:
 
     def clean(self, txt):
 
-        tokenized_txt = self.preprocess(txt)  # remove stop words
-        txt = ' '.join(tokenized_txt)
+        with instrumentation.stage('preprocess.clean'):
+            tokenized_txt = self.preprocess(txt)  # remove stop words
+            txt = ' '.join(tokenized_txt)
 
+        instrumentation.count('preprocess.texts_cleaned')
         return txt
 
 
+# Preprocessor of each clean_batch worker process
+_worker_preprocessor = None
+
+
+def _init_clean_worker(fast: bool, lemma_cache_size: int):
+    global _worker_preprocessor
+    _worker_preprocessor = text_preprocessor(fast=fast, lemma_cache_size=lemma_cache_size)
+
+
+def _clean_texts(texts: list[str]) -> list[str]:
+    return [_worker_preprocessor.clean(txt) for txt in texts]
+
+
 class obj_preprocessor(text_preprocessor):
     """
     Preprocesses objects.
@@ -76,12 +148,30 @@ class obj_preprocessor(text_preprocessor):
             cleaned_value = self.clean(value)
             setattr(obj, attribute, cleaned_value)
 
-    def clean_batch(self, obj_list: list[user | job], attrs: list[str]):
+    def clean_batch(self, obj_list: list[user | job], attrs: list[str],
+                    n_workers: int = 1, chunk_size: int = 256):
         """
         Cleans batch of objects.
+        With n_workers > 1 the texts are cleaned in a process pool, in chunks of
+        chunk_size texts. The output is the same as cleaning serially.
         """
+        if n_workers <= 1:
+            for obj in obj_list:
+                self.clean_obj(obj, attrs)
+
+            return obj_list
+
+        texts = [getattr(obj, attribute) for obj in obj_list for attribute in attrs]
+        chunks = [texts[i:i + chunk_size] for i in range(0, len(texts), chunk_size)]
+
+        with ProcessPoolExecutor(max_workers=n_workers,
+                                 initializer=_init_clean_worker,
+                                 initargs=(self.fast, self.lemma_cache_size)) as pool:
+            cleaned = iter([txt for chunk in pool.map(_clean_texts, chunks) for txt in chunk])
+
         for obj in obj_list:
-            self.clean_obj(obj, attrs)
+            for attribute in attrs:
+                setattr(obj, attribute, next(cleaned))
 
         return obj_list
 
@@ -130,9 +220,22 @@ class ModelEmbedder(embedder):
     def __init__(self,
                  vectorizers: dict = None,
                  encoders: dict = None,
-                 preprocessor= None):
+                 preprocessor= None,
+                 sparse: bool = False,
+                 cache: EmbeddingCache = None,
+                 projected: bool = False):
         super().__init__(vectorizers, encoders, preprocessor)
 
+        # Keep TF-IDF embeddings as scipy CSR rows instead of dense arrays
+        self.sparse = sparse
+
+        # Encode content with the fitted TF-IDF projection (see Modules.projection)
+        self.projected = projected
+
+        # Optional cache of text embeddings, only misses are encoded
+        self.cache = cache
+        self._fingerprints = dict()
+
         if not self.model_class:
             raise ValueError("model_class must be set by child classes")
 
@@ -150,65 +253,144 @@ class ModelEmbedder(embedder):
         """Define which models to load for vectorizers and encoders"""
         pass
 
+    def _content_vectorizer(self):
+        return registry.get('projected_content_vectorizer' if self.projected else 'content_vectorizer')
+
     def embed(self, obj: BaseModel):
         """
         Embeds a single model instance.
         """
-        obj = self.preprocess(obj)
-        
-        for feature in self.model_class.model_fields.keys():
-            value = getattr(obj, feature)
+        return self.embed_batch([obj])[0]
+
+    def embed_batch(self, objs: list[BaseModel], batch_size: int = 64):
+        """
+        Embeds batch of objects.
+        All objects are preprocessed first, then every feature is encoded with
+        one model call per chunk of `batch_size` objects.
+        Embeddings are returned in the same order as the input objects.
+        """
+        with instrumentation.stage('embed.preprocess'):
+            objs = [self.preprocess(obj) for obj in objs]
+        return self.encode_batch(objs, batch_size)
 
-            if feature in self.vectorizers:
-                obj_embd = embed(self.vectorizers[feature], [value])
-                setattr(obj, feature, obj_embd)
+    def encode_batch(self, objs: list[BaseModel], batch_size: int = 64):
+        """
+        Encodes batch of already preprocessed objects, see embed_batch.
+        """
+        if batch_size < 1:
+            raise ValueError(f"batch_size must be positive, got {batch_size}")
 
-            elif feature in self.encoders:
-                obj_embd = embed(self.encoders[feature], value)
+        for start in range(0, len(objs), batch_size):
+            chunk = objs[start:start + batch_size]
 
-                if len(obj_embd) > 1:
-                    obj_embd = np.sum(obj_embd, axis=0, keepdims=True)
-                
-                setattr(obj, feature, obj_embd)
-        
-        return obj
+            for feature in self.model_class.model_fields.keys():
+                values = [getattr(obj, feature) for obj in chunk]
+
+                if feature in self.vectorizers:
+                    chunk_embd = self._vectorize(feature, values, batch_size)
+
+                elif feature in self.encoders:
+                    chunk_embd = self._encode(feature, values)
+
+                else:
+                    continue
 
-    def embed_batch(self, objs: list[BaseModel]):
+                for obj, obj_embd in zip(chunk, chunk_embd):
+                    setattr(obj, feature, obj_embd)
+
+        return objs
+
+    def _vectorize(self, feature: str, values: list, batch_size: int):
         """
-        Embeds batch of objects.
+        Vectorizes a chunk of texts with a single model call.
+        Returns one (1, dim) array per text, or a (1, dim) CSR matrix in sparse mode.
         """
-        embeddings = []
-        for obj in objs:
-            obj_embd = self.embed(obj)
-            embeddings.append(obj_embd)
+        model = self.vectorizers[feature]
+
+        def encode(texts):
+            with instrumentation.stage(f'embed.encode.{feature}'):
+                embeddings = embed(model, texts, batch_size=batch_size, sparse=self.sparse)
+            instrumentation.count('embed.texts_encoded', len(texts))
+            return embeddings
 
-        return embeddings
+        if self.cache is None:
+            embeddings = encode(values)
+            return [embeddings[i:i + 1] for i in range(len(values))]
+
+        fingerprint = self._fingerprint(feature)
+        keys = [EmbeddingCache.key(fingerprint, value) for value in values]
+        return self.cache.get_or_encode(encode, keys, values)
+
+    def _fingerprint(self, feature: str) -> str:
+        """
+        Cache fingerprint of a feature's vectorizer, computed once.
+        """
+        if feature not in self._fingerprints:
+            output = 'sparse' if self.sparse else 'dense'
+            self._fingerprints[feature] = f"{model_fingerprint(self.vectorizers[feature])}-{output}"
+        return self._fingerprints[feature]
+
+    def _encode(self, feature: str, values: list):
+        """
+        Encodes a chunk of categorical values with a single model call.
+        Each value is a list of rows; rows belonging to the same object are summed
+        into a single (1, n_categories) array.
+        """
+        counts = np.array([len(value) for value in values])
+        rows = [row for value in values for row in value]
+
+        if not rows:
+            n_categories = sum(len(c) for c in self.encoders[feature].categories_)
+            return [np.zeros((1, n_categories), dtype=np.int32) for _ in values]
+
+        with instrumentation.stage(f'embed.encode.{feature}'):
+            embeddings = embed(self.encoders[feature], rows)
+
+        # Sum the rows of each object, objects without rows get a zero vector.
+        # Only non-empty segments are reduced: reduceat sums each offset up to the next one
+        offsets = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        non_empty = counts > 0
+        summed = np.zeros((len(values), embeddings.shape[1]), dtype=embeddings.dtype)
+        summed[non_empty] = np.add.reduceat(embeddings, offsets[non_empty], axis=0, dtype=embeddings.dtype)
+
+        return [summed[i:i + 1] for i in range(len(values))]
 
 
 class job_embedder(ModelEmbedder):
     model_class = job
 
+    def __init__(self, *args, skill_vocabulary: skills.skill_vocabulary = None, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        # Optional known skills, also taken from the content of the jobs mentioning them
+        self.skill_vocabulary = skill_vocabulary
+
     def _load_models(self):
         # Load Title Vectorizer
         if not ('title' in self.vectorizers and self.vectorizers['title']):
-            self.vectorizers['title'] = loader.load_vectorizer('MiniLM', model_type='sentence_transformer')
+            self.vectorizers['title'] = registry.get('title_vectorizer')
 
         # Load Content Vectorizer
         if not ('content' in self.vectorizers and self.vectorizers['content']):
-            self.vectorizers['content'] = loader.load_vectorizer('jobs_tfidf.pkl', model_type='sklearn')
+            self.vectorizers['content'] = self._content_vectorizer()
 
         # Load Encoders
         if not ('work_type' in self.encoders and self.encoders['work_type']):
-            self.encoders['work_type'] = loader.load_encoder('work_type_onehot_enc.pkl', model_type='sklearn')
+            self.encoders['work_type'] = registry.get('work_type_encoder')
     
     def preprocess(self, obj: job):
+        # Skills are matched as phrases of the raw text, see Modules.skills
+        listed = [skills.phrase(skill) for skill in obj.skills or []]
+        found = self.skill_vocabulary.extract(obj.content) if self.skill_vocabulary is not None else []
+        obj.skills = [skill for skill in dict.fromkeys(listed + found) if skill]
+
         # Clean the title and content
         obj.title = self.preprocessor.clean(obj.title)
         obj.content = self.preprocessor.clean(obj.content)
         
         # Put work type in a list for being compatible with the encoder
         obj.work_type = [[obj.work_type]]
-        
+
         return obj
 
 
@@ -218,15 +400,15 @@ class user_embedder(ModelEmbedder):
     def _load_models(self):
         # Load Title Vectorizer
         if not ('title' in self.vectorizers and self.vectorizers['title']):
-            self.vectorizers['title'] = loader.load_vectorizer('MiniLM', model_type='sentence_transformer')
+            self.vectorizers['title'] = registry.get('title_vectorizer')
 
         # Load About Vectorizer
         if not ('about' in self.vectorizers and self.vectorizers['about']):
-            self.vectorizers['about'] = loader.load_vectorizer('jobs_tfidf.pkl', model_type='sklearn')
+            self.vectorizers['about'] = self._content_vectorizer()
 
         # Load Preferred Work Types Encoder
         if not ('preferred_work_types' in self.encoders and self.encoders['preferred_work_types']):
-            self.encoders['preferred_work_types'] = loader.load_encoder('work_type_onehot_enc.pkl', model_type='sklearn')
+            self.encoders['preferred_work_types'] = registry.get('work_type_encoder')
 
     def preprocess(self, obj: user):
         # Clean the title and about
@@ -235,6 +417,10 @@ class user_embedder(ModelEmbedder):
         
         # Refactor the work types as a list of lists
         obj.preferred_work_types = [[work_type] for work_type in obj.preferred_work_types]
+
+        # Skills as the phrases they are matched on
+        if obj.skills is not None:
+            obj.skills = [skill for skill in map(skills.phrase, obj.skills) if skill]
         
         
         return obj
@@ -0,0 +1,134 @@
+"""
+Fit a TruncatedSVD projection of the stored TF-IDF content embeddings and
+rebuild the jobs content and users about columns with it.
+
+The projection is saved, chained after the TF-IDF vectorizer, as the
+'projected_content_vectorizer' of the model registry, so embedders created
+with projected=True encode new texts the same way. Services holding an open
+EmbeddingDB must be restarted after a rebuild.
+
+Usage:
+    python -m Modules.projection --db Data/embeddings.db --components 256
+"""
+import argparse
+import os
+import pickle
+import random
+
+import numpy as np
+from scipy import sparse
+
+from Modules import quantization
+from Modules.database import EmbeddingDB
+from Modules.model_handlers import model_registry, registry, vectorizers_path
+
+DEFAULT_COMPONENTS = 256
+
+# Columns holding TF-IDF embeddings of the content vectorizer
+CONTENT_COLUMNS = {'jobs': 'content', 'users': 'about'}
+
+
+def stored_content(db: EmbeddingDB, max_rows: int = None, seed: int = 0) -> sparse.csr_matrix:
+    """
+    Stored jobs content embeddings, a random sample of max_rows jobs when given.
+    """
+    job_ids = db.get_job_ids()
+    if max_rows is not None and len(job_ids) > max_rows:
+        job_ids = sorted(random.Random(seed).sample(job_ids, max_rows))
+    vectors = db.get_jobs_column_embeddings(job_ids, CONTENT_COLUMNS['jobs'])
+
+    # Reduced-precision columns are fitted in float32
+    if isinstance(vectors, quantization.int8_matrix):
+        vectors = vectors.dequantize()
+    elif quantization.is_reduced(vectors):
+        vectors = vectors.astype(np.float32)
+    return sparse.csr_matrix(vectors)
+
+
+def fit_projection(vectors, n_components: int = DEFAULT_COMPONENTS, seed: int = 0):
+    """
+    Fit a TruncatedSVD of TF-IDF vectors.
+
+    Args:
+        vectors: (n, vocabulary size) TF-IDF matrix
+        n_components: Dimension of the projected embeddings
+        seed: Random state of the randomized SVD
+
+    Returns:
+        The fitted sklearn TruncatedSVD
+    """
+    from sklearn.decomposition import TruncatedSVD
+
+    n_components = min(n_components, min(vectors.shape) - 1)
+    return TruncatedSVD(n_components=n_components, algorithm='randomized', random_state=seed).fit(vectors)
+
+
+def projected_vectorizer(vectorizer, projection):
+    """
+    Pipeline applying the projection to the output of the TF-IDF vectorizer.
+    """
+    from sklearn.pipeline import Pipeline
+    return Pipeline([('tfidf', vectorizer), ('svd', projection)])
+
+
+def save_projected_vectorizer(pipeline, path: str = None):
+    """
+    Pickle the pipeline where the model registry loads 'projected_content_vectorizer' from.
+    """
+    path = path or vectorizers_path + model_registry.models['projected_content_vectorizer'][1]
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(pipeline, f)
+    os.replace(tmp_path, path)
+    return path
+
+
+def rebuild(db: EmbeddingDB, projection, chunk_size: int = 1000) -> dict[str, int]:
+    """
+    Project the stored TF-IDF embeddings of every content column in place.
+
+    Returns:
+        Number of rows rewritten per table
+    """
+    def transform(matrix):
+        return projection.transform(matrix).astype(np.float32)
+
+    return {table: db.rewrite_column(table, column, transform, chunk_size=chunk_size)
+            for table, column in CONTENT_COLUMNS.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--db', default='Data/embeddings.db', help='Path of the embeddings database')
+    parser.add_argument('--components', type=int, default=DEFAULT_COMPONENTS, help='Projected dimension')
+    parser.add_argument('--max-rows', type=int, default=None, help='Jobs sampled to fit the projection (all by default)')
+    parser.add_argument('--chunk-size', type=int, default=1000, help='Rows projected at once')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--fit-only', action='store_true', help='Save the projection without rebuilding the database')
+    args = parser.parse_args()
+
+    db = EmbeddingDB(args.db)
+    vectorizer = registry.get('content_vectorizer')
+
+    vectors = stored_content(db, args.max_rows, args.seed)
+    if vectors.shape[1] != len(vectorizer.vocabulary_):
+        parser.error(f"Stored content embeddings have dimension {vectors.shape[1]}, "
+                     f"not the TF-IDF vocabulary size {len(vectorizer.vocabulary_)}; already projected?")
+
+    projection = fit_projection(vectors, args.components, args.seed)
+    path = save_projected_vectorizer(projected_vectorizer(vectorizer, projection))
+    print(f"Fitted {projection.n_components} components on {vectors.shape[0]} jobs, "
+          f"explained variance {projection.explained_variance_ratio_.sum():.3f}, saved to {path}")
+
+    if args.fit_only:
+        return
+
+    rewritten = rebuild(db, projection, args.chunk_size)
+    print(f"Projected {rewritten['jobs']} jobs and {rewritten['users']} users")
+
+    # Reclaim the space freed by the smaller blobs
+    db.vacuum()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+import numpy as np
+
+# Storage dtype of each reduced-precision mode
+QUANTIZED_DTYPES = {
+    'float16': np.dtype('<f2'),
+    'int8': np.dtype('i1'),
+}
+
+# int8 rows are stored as a float32 scale followed by the int8 codes
+INT8_SCALE_DTYPE = np.dtype('<f4')
+
+# Candidate rows converted to float32 at once while scoring
+SCORE_CHUNK_ROWS = 4096
+
+
+def quantize_int8(rows: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Symmetric per-vector int8 quantization.
+
+    Returns:
+        Tuple of (codes, scales) with rows ~= codes * scales[:, None]
+    """
+    rows = np.atleast_2d(np.asarray(rows, dtype=np.float32))
+    scales = np.abs(rows).max(axis=1) / 127
+    with np.errstate(invalid='ignore', divide='ignore'):
+        codes = np.where(scales[:, None] > 0, np.rint(rows / scales[:, None]), 0)
+    return codes.astype(np.int8), scales.astype(INT8_SCALE_DTYPE)
+
+
+def int8_to_bytes(row: np.ndarray) -> bytes:
+    codes, scales = quantize_int8(row)
+    return scales.tobytes() + codes.tobytes()
+
+
+def int8_nbytes(dim: int) -> int:
+    return INT8_SCALE_DTYPE.itemsize + dim
+
+
+def int8_from_bytes(blob: bytes) -> tuple[np.ndarray, float]:
+    """
+    Codes and scale of one int8 row.
+    """
+    scale = np.frombuffer(blob, dtype=INT8_SCALE_DTYPE, count=1)[0]
+    return np.frombuffer(blob, dtype=np.int8, offset=INT8_SCALE_DTYPE.itemsize), scale
+
+
+class int8_matrix:
+    """
+    Rows stored as int8 codes with one float32 scale per row.
+    Scored in chunks without materializing the float32 matrix.
+    """
+
+    def __init__(self, codes: np.ndarray, scales: np.ndarray):
+        self.codes = codes
+        self.scales = scales
+
+    @property
+    def shape(self):
+        return self.codes.shape
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes + self.scales.nbytes
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, rows):
+        return int8_matrix(self.codes[rows], self.scales[rows])
+
+    def dequantize(self) -> np.ndarray:
+        return self.codes.astype(np.float32) * self.scales[:, None]
+
+    def chunk(self, start: int, stop: int) -> np.ndarray:
+        return self.codes[start:stop].astype(np.float32) * self.scales[start:stop, None]
+
+
+def is_reduced(options) -> bool:
+    """
+    Whether candidate rows are stored with reduced precision.
+    """
+    return isinstance(options, int8_matrix) or (isinstance(options, np.ndarray) and options.dtype == np.float16)
+
+
+def scores(bases: np.ndarray, options, chunk_rows: int = SCORE_CHUNK_ROWS) -> np.ndarray:
+    """
+    Dot products of every base with every reduced-precision option, accumulated in float32.
+
+    Args:
+        bases: (n_bases, dim) dense or sparse matrix
+        options: int8_matrix or float16 (n_options, dim) array
+        chunk_rows: Options converted to float32 at once
+
+    Returns:
+        (n_bases, n_options) float32 array
+    """
+    if hasattr(bases, 'toarray'):
+        bases = bases.toarray()
+    bases_t = np.asarray(bases, dtype=np.float32).reshape(-1, options.shape[1]).T
+
+    # The int8 scale is applied after the product, one multiply per score
+    int8 = isinstance(options, int8_matrix)
+    result = np.empty((len(options), bases_t.shape[1]), dtype=np.float32)
+    for start in range(0, len(options), chunk_rows):
+        stop = start + chunk_rows
+        if int8:
+            block = options.codes[start:stop].astype(np.float32) @ bases_t
+            block *= options.scales[start:stop, None]
+        else:
+            block = options[start:stop].astype(np.float32) @ bases_t
+        result[start:stop] = block
+
+    return result.T
@@ -0,0 +1,124 @@
+"""
+CPU title encoder running a SentenceTransformer with dynamically quantized int8 Linear layers.
+
+Loaded through model_loader.load_vectorizer(..., model_type='quantized_sentence_transformer')
+and used by embed() like the fp32 SentenceTransformer.
+"""
+import numpy as np
+import torch
+from sentence_transformers import SentenceTransformer
+
+from Modules.model_handlers import model_fingerprint
+
+# Padded sequence lengths, texts are padded to the smallest bucket that fits them
+DEFAULT_BUCKETS = (16, 32, 64, 128, 256)
+
+# Titles checked against the fp32 model when the encoder is loaded
+CALIBRATION_TITLES = [
+    'software engineer',
+    'senior data scientist',
+    'registered nurse night shift',
+    'warehouse associate',
+    'marketing coordinator part time',
+    'full stack developer react node',
+    'customer service representative',
+    'project manager construction',
+    'accountant cpa',
+    'mechanical engineering intern',
+    'truck driver cdl class a',
+    'executive assistant to the ceo',
+]
+
+
+class QuantizedSentenceEncoder:
+    """
+    Dynamically quantized copy of a SentenceTransformer for CPU inference.
+
+    Texts are sorted by length and padded to fixed length buckets, so batches
+    carry little padding and the model only sees a handful of input shapes.
+    """
+
+    def __init__(self, path: str, num_threads: int = None, buckets: tuple[int, ...] = DEFAULT_BUCKETS,
+                 min_cosine: float = 0.99, calibration_texts: list[str] = None):
+        """
+        Args:
+            path: SentenceTransformer directory
+            num_threads: Intra-op threads used by torch (process-wide), torch's default when None
+            buckets: Padded sequence lengths, capped by the model's max_seq_length
+            min_cosine: Minimum cosine similarity between the quantized and fp32 embeddings
+                of the calibration texts, checked at load time
+            calibration_texts: Texts of the tolerance check (CALIBRATION_TITLES by default)
+        """
+        if num_threads is not None:
+            torch.set_num_threads(num_threads)
+
+        fp32 = SentenceTransformer(path, device='cpu')
+        fp32.eval()
+
+        self.max_seq_length = fp32.max_seq_length
+        self.buckets = tuple(sorted({min(b, self.max_seq_length) for b in buckets} | {self.max_seq_length}))
+        self.tokenizer = fp32.tokenizer
+        self.min_cosine = min_cosine
+        self.source_fingerprint = model_fingerprint(fp32)
+
+        self.model = torch.quantization.quantize_dynamic(fp32, {torch.nn.Linear}, dtype=torch.qint8)
+        self.model.eval()
+
+        self.cosine = self.check_tolerance(fp32, calibration_texts or CALIBRATION_TITLES)
+
+    def encode(self, texts: list[str] | str, batch_size: int = 32) -> np.ndarray:
+        """
+        Embed texts, returned as a float32 (n, dim) array in input order.
+        """
+        single = isinstance(texts, str)
+        texts = [texts] if single else list(texts)
+        if not texts:
+            return np.empty((0, self.model.get_sentence_embedding_dimension()), dtype=np.float32)
+
+        # Group texts of similar length so each batch is padded to a small bucket
+        lengths = [len(ids) for ids in self.tokenizer(texts, add_special_tokens=True, truncation=True,
+                                                       max_length=self.max_seq_length)['input_ids']]
+        order = np.argsort(lengths, kind='stable')
+
+        embeddings = None
+        for start in range(0, len(texts), batch_size):
+            batch = order[start:start + batch_size]
+            bucket = self._bucket(max(lengths[i] for i in batch))
+            features = self.tokenizer([texts[i] for i in batch], padding='max_length', truncation=True,
+                                      max_length=bucket, return_tensors='pt')
+
+            with torch.inference_mode():
+                output = self.model(dict(features))['sentence_embedding'].numpy()
+
+            if embeddings is None:
+                embeddings = np.empty((len(texts), output.shape[1]), dtype=np.float32)
+            embeddings[batch] = output
+
+        return embeddings[0] if single else embeddings
+
+    def check_tolerance(self, fp32: SentenceTransformer, texts: list[str]) -> float:
+        """
+        Minimum cosine similarity between the quantized and fp32 embeddings of `texts`.
+        Raises ValueError when it is below min_cosine.
+        """
+        expected = fp32.encode(texts, convert_to_numpy=True)
+        actual = self.encode(texts)
+
+        norms = np.linalg.norm(expected, axis=1) * np.linalg.norm(actual, axis=1)
+        cosine = float(np.min(np.sum(expected * actual, axis=1) / np.maximum(norms, 1e-12)))
+
+        if cosine < self.min_cosine:
+            raise ValueError(f"Quantized encoder cosine similarity {cosine:.4f} is below the tolerance {self.min_cosine}")
+        return cosine
+
+    def fingerprint(self) -> str:
+        """
+        Identifies the source weights and the quantization, see model_fingerprint.
+        """
+        return f"{self.source_fingerprint}-qint8-{self.max_seq_length}"
+
+    def _bucket(self, length: int) -> int:
+        for bucket in self.buckets:
+            if length <= bucket:
+                return bucket
+        return self.max_seq_length
@@ -1,84 +1,404 @@
+import time
 import numpy as np
 from abc import ABC
 
-from Modules.model_handlers import model_loader, embed
+from Modules.model_handlers import model_loader, embed, registry
 from Modules import utils
-from Models.models import weights
+from Models.models import weights, job_filter
 from Modules.database import EmbeddingDB
+from Modules.job_index import JobIndex
+from Modules.ann_index import IVFIndex
+from Modules.result_cache import ResultCache
+from Modules.skill_index import SkillIndex
 from Modules import consts
+from Modules import instrumentation
+from Modules import quantization
+from Modules import skills
+from Modules.categorical import to_mask, mask_of
 loader = model_loader()
 class content_based_recommender(ABC):
     def __init__(self, db: EmbeddingDB):
         self.db = db
 
     
-    def _recommend(self, base: dict, options: dict, recommender_weights: weights):    
+    def _recommend(self, base: dict, options: dict, recommender_weights: weights,
+                   top_k: int = None, threshold: float = None):
+        """
+        Score every option against the base and select the best ones.
+
+        Returns:
+            Tuple of (option indices, scores) as NumPy arrays sorted by descending score.
+        """
         similarity = dict()
 
         # Calculate options similarity for each feature
-        for feature in consts.job_recommendation_features:
-            # Add feature similarity to similarity dictionary
-            similarity[feature] = np.dot(base[feature], options[feature].T).squeeze()
+        with instrumentation.stage('recommend.similarity'):
+            for feature in self._features(recommender_weights):
+                # Add feature similarity to similarity dictionary
+                similarity[feature] = utils.similarity(base[feature], options[feature])
         
         # Get the number of options
         temp_feature = list(similarity.keys())[0]
         n_options = len(similarity[temp_feature])
         
         # Initialize option scores array of zeros
-        option_scores = np.zeros((n_options, ), dtype= np.float64)
+        option_scores = np.zeros((n_options, ), dtype=self._score_dtype(options))
         
         # Accumulate scores
-        for feature, scores in similarity.items():
-            feature_weight = getattr(recommender_weights, feature)
-            option_scores += feature_weight * utils.normalize(scores)
+        with instrumentation.stage('recommend.normalize'):
+            for feature, scores in similarity.items():
+                feature_weight = getattr(recommender_weights, feature)
+                option_scores += feature_weight * utils.normalize(scores)
+
+        # Select the best options without sorting every candidate
+        with instrumentation.stage('recommend.select'):
+            selected = utils.top_k(option_scores, top_k, threshold)
+
+        instrumentation.count('recommend.candidates_scored', n_options)
+        return selected, option_scores[selected]
+
+    def _recommend_batch(self, bases: dict, options: dict, recommender_weights: weights, top_k: int = None):
+        """
+        Score every option against many bases at once, one matrix product per feature.
+        Scores are min-max normalized per base, like _recommend.
+
+        Returns:
+            Tuple of (option indices, scores) NumPy arrays of shape (n_bases, k),
+            each row sorted by descending score.
+        """
+        option_scores = None
+
+        for feature in self._features(recommender_weights):
+            with instrumentation.stage('recommend.similarity'):
+                similarity = utils.similarity_matrix(bases[feature], options[feature])
+
+            with instrumentation.stage('recommend.normalize'):
+                weighted = getattr(recommender_weights, feature) * utils.normalize_rows(similarity)
+
+                if option_scores is None:
+                    option_scores = np.zeros(similarity.shape, dtype=self._score_dtype(options))
+                option_scores += weighted
 
-        # Sort options by score
-        sorted_options = sorted(enumerate(option_scores), key= lambda x: x[1], reverse= True)
-        return sorted_options
+        with instrumentation.stage('recommend.select'):
+            selected = utils.top_k_rows(option_scores, top_k)
+
+        instrumentation.count('recommend.candidates_scored', option_scores.size)
+        return selected, np.take_along_axis(option_scores, selected, axis=1)
+
+    @staticmethod
+    def _features(recommender_weights: weights) -> list[str]:
+        # Skill overlap is only scored when weighted, it needs a skill index
+        if recommender_weights.skills:
+            return consts.job_recommendation_features + ['skills']
+        return consts.job_recommendation_features
+
+    @staticmethod
+    def _score_dtype(options: dict):
+        # Reduced-precision candidates are scored and accumulated in float32
+        if any(quantization.is_reduced(options[feature]) for feature in consts.job_recommendation_features):
+            return np.float32
+        return np.float64
     
 class job_recommender(content_based_recommender):
-    
-    def job_recommend(self, base_job_id: int, jobs_ids: list[int], recommender_weights: weights):
-        
-        # Get embeddings from database
-        base_job = self.db.get_job_embeddings(base_job_id)
-        jobs = self._fetch_jobs(jobs_ids)
+    # Users table column compared with each job feature
+    user_features = {'title': 'title', 'content': 'about', 'work_type': 'preferred_work_types'}
 
-        # Get recommendations
-        recommendations = self._recommend(base_job, jobs, recommender_weights)
-        
-        # Get recommendations ids
-        recommendations = self._get_recommendations_ids(jobs_ids, recommendations)
-        return recommendations
+    def __init__(self, db: EmbeddingDB, index: JobIndex = None, ann_index: IVFIndex = None,
+                 cache: ResultCache = None, users=None, skill_index: SkillIndex = None):
+        super().__init__(db)
+        # Optional resident copy of the jobs table (JobIndex or SnapshotIndex), used instead of SQLite when set
+        self.index = index
+        # Optional read-only copy of the users table (SnapshotIndex), SQLite serves the users it lacks
+        self.users = users
+        # Optional approximate nearest-neighbour index used to retrieve candidates
+        self.ann_index = ann_index
+        # Optional cache of job_recommend / user_job_recommend results
+        self.cache = cache
+        # Optional inverted index of the jobs skills, for skill candidates, filters and scores
+        self.skill_index = skill_index
+
+    @instrumentation.traced('job_recommend')
+    def job_recommend(self, base_job_id: int, jobs_ids: list[int] | None, recommender_weights: weights,
+                      top_k: int = None, threshold: float = None, n_candidates: int = 200,
+                      filters: job_filter = None):
+        """
+        Rank jobs by similarity to a base job.
+
+        Args:
+            base_job_id: ID of the job to compare against
+            jobs_ids: Candidate job IDs, or None to retrieve candidates from the whole
+                catalogue with the ANN index
+            recommender_weights: Feature weights
+            top_k: Maximum number of jobs to return (all candidates when None)
+            threshold: Minimum score of returned jobs (optional)
+            n_candidates: Size of the ANN shortlist re-ranked when jobs_ids is None
+            filters: Metadata conditions of the candidates, evaluated in SQL before any
+                embedding is fetched. Without jobs_ids and ANN index, every job meeting
+                them is a candidate
+
+        Returns:
+            Tuple of (job ids, scores) NumPy arrays sorted by descending score.
+        """
+        options = {'top_k': top_k, 'threshold': threshold, 'n_candidates': n_candidates, 'filters': filters}
+        return self._cached('job', base_job_id, jobs_ids, recommender_weights, options, self._job_recommend)
+
+    def _job_recommend(self, base_job_id: int, jobs_ids: list[int] | None, recommender_weights: weights,
+                       top_k: int = None, threshold: float = None, n_candidates: int = 200,
+                       filters: job_filter = None):
+        # Get embeddings from the index or the database
+        base_job = self._fetch_job(base_job_id)
+        if recommender_weights.skills:
+            # Candidates are scored by the share of the base job's skills they hold
+            base_job['skills'] = self._skill_index().job_terms(base_job_id)
+
+        jobs_ids = self._candidates(base_job, jobs_ids, n_candidates, filters, exclude=base_job_id)
+        if not len(jobs_ids):
+            return self._no_recommendations()
+
+        return self._rank(base_job, jobs_ids, recommender_weights, top_k, threshold)
     
     
-    def user_job_recommend(self, user_id: int, jobs_ids: list[int], recommender_weights: weights):
-        # Get user embeddings from database
-        user = self.db.get_user_embeddings(user_id)
+    @instrumentation.traced('user_job_recommend')
+    def user_job_recommend(self, user_id: int, jobs_ids: list[int] | None, recommender_weights: weights,
+                           top_k: int = None, threshold: float = None, n_candidates: int = 200,
+                           work_type_prefilter: bool = False, filters: job_filter = None,
+                           skill_candidates: bool = False):
+        """
+        Rank jobs by similarity to a user profile.
+        Arguments and return value are the same as job_recommend, plus:
+
+        Args:
+            work_type_prefilter: Only rank jobs sharing a work type with the user's
+                preferred ones, filtered in SQL before any embedding is fetched
+            skill_candidates: Without jobs_ids, rank the jobs matching any of the
+                user's skills, from the skill index
+        """
+        options = {'top_k': top_k, 'threshold': threshold, 'n_candidates': n_candidates,
+                   'work_type_prefilter': work_type_prefilter, 'filters': filters,
+                   'skill_candidates': skill_candidates}
+        return self._cached('user', user_id, jobs_ids, recommender_weights, options, self._user_job_recommend)
+
+    def _user_job_recommend(self, user_id: int, jobs_ids: list[int] | None, recommender_weights: weights,
+                            top_k: int = None, threshold: float = None, n_candidates: int = 200,
+                            work_type_prefilter: bool = False, filters: job_filter = None,
+                            skill_candidates: bool = False):
+        # Get user embeddings from database, skills only when they are used
+        with_skills = bool(recommender_weights.skills) or (jobs_ids is None and skill_candidates)
+        user = self._fetch_user(user_id, with_skills)
         
         # Map user keys to job keys 
         user = self._user_job_map(user)
-        
-        
-        # Get jobs embeddings from database
+
+        if jobs_ids is None and skill_candidates:
+            # Jobs matching any of the user's skills
+            jobs_ids = self._skill_index().candidates(user['skills']).tolist()
+
+        jobs_ids = self._candidates(user, jobs_ids, n_candidates, filters)
+
+        if work_type_prefilter:
+            jobs_ids = self._prefilter_work_type(user, jobs_ids)
+        if not len(jobs_ids):
+            return self._no_recommendations()
+
+        return self._rank(user, jobs_ids, recommender_weights, top_k, threshold)
+
+    @instrumentation.traced('users_job_recommend')
+    def users_job_recommend(self, user_ids: list[int], jobs_ids: list[int], recommender_weights: weights,
+                            top_k: int = None, chunk_size: int = 64):
+        """
+        Rank the same candidate jobs for many users.
+        Candidate embeddings are fetched once and each chunk of users is scored with
+        one matrix product per feature, so memory is bounded by chunk_size x len(jobs_ids).
+
+        Args:
+            user_ids: IDs of the users to recommend jobs to
+            jobs_ids: Candidate job IDs
+            recommender_weights: Feature weights
+            top_k: Number of jobs per user (all candidates when None)
+            chunk_size: Number of users scored together
+
+        Returns:
+            Tuple of (job ids, scores) NumPy arrays of shape (len(user_ids), k),
+            row i holding the ranking of user_ids[i].
+        """
         jobs = self._fetch_jobs(jobs_ids)
-        
+        jobs_ids = np.asarray(jobs_ids)
+        k = len(jobs_ids) if top_k is None else min(top_k, len(jobs_ids))
+
+        ranked_ids = [np.empty((0, k), dtype=jobs_ids.dtype)]
+        ranked_scores = [np.empty((0, k), dtype=np.float64)]
+
+        if recommender_weights.skills:
+            jobs['skills'] = self._skill_sets(jobs_ids)
+
+        for chunk in utils.chunked(user_ids, chunk_size):
+            users = self._fetch_users(chunk)
+            if recommender_weights.skills:
+                users['skills'] = [skills.term_ids(user_skills) for user_skills in self.db.get_users_skills(chunk)]
+            indices, scores = self._recommend_batch(users, jobs, recommender_weights, top_k)
+            ranked_ids.append(jobs_ids[indices])
+            ranked_scores.append(scores)
+
+        return np.concatenate(ranked_ids), np.concatenate(ranked_scores)
+
+    def _cached(self, kind: str, base_id: int, jobs_ids: list[int] | None, recommender_weights: weights,
+                options: dict, recommend):
+        # Serve repeated requests from the result cache when one is set
+        def compute():
+            return recommend(base_id, jobs_ids, recommender_weights, **options)
+
+        if self.cache is None:
+            return compute()
+        return self.cache.get_or_compute(kind, base_id, jobs_ids, recommender_weights, options, compute)
+
+    @instrumentation.timed('recommend.fetch')
+    def _fetch_user(self, user_id: int, with_skills: bool = False):
+        user = self.users.get_user_embeddings(user_id) if self.users is not None else None
+        if user is None:
+            return self.db.get_user_embeddings(user_id)
+
+        # Skills are raw values, not part of snapshots: read from SQLite only when they are scored or matched
+        if with_skills:
+            user['skills'] = self.db.get_users_skills([user_id])[0]
+        return user
+
+    @instrumentation.timed('recommend.fetch')
+    def _fetch_users(self, user_ids: list[int]):
+        # Users feature matrices under the job feature names
+        users = dict()
+        for feature in consts.job_recommendation_features:
+            column = self.user_features[feature]
+            embeddings = self.users.get_users_column_embeddings(user_ids, column) if self.users is not None else None
+            users[feature] = embeddings if embeddings is not None else self.db.get_users_column_embeddings(user_ids, column)
+        return users
+
+    def _candidates(self, base: dict, jobs_ids: list[int] | None, n_candidates: int,
+                    filters: job_filter | None, exclude: int = None) -> list[int]:
+        """
+        Candidate job ids: the given ones or an ANN shortlist, restricted to the filters.
+        """
+        if jobs_ids is None:
+            if filters is not None and self.ann_index is None:
+                # Every job meeting the filters, straight from SQL
+                return [job_id for job_id in self._filter_candidates(filters, None) if job_id != exclude]
+
+            # Retrieve a shortlist when no candidates are given
+            jobs_ids = self._retrieve(base, n_candidates, exclude=exclude)
+
+        if filters is not None:
+            jobs_ids = self._filter_candidates(filters, jobs_ids)
+        return jobs_ids
+
+    @instrumentation.timed('recommend.prefilter')
+    def _filter_candidates(self, filters: job_filter, jobs_ids: list[int] | None) -> list[int]:
+        # Skills are matched on the posting lists of the skill index
+        if filters.skills is not None:
+            matched = self._skill_index().candidates(skills.term_ids(filters.skills), filters.all_skills)
+            if jobs_ids is None:
+                jobs_ids = matched.tolist()
+            else:
+                jobs_ids = np.asarray(jobs_ids)[skills.contains(matched, jobs_ids)].tolist()
+            if not jobs_ids:
+                return []
+
+        # Resolve the filters to conditions on the indexed metadata columns
+        conditions = {'locations': filters.locations, 'remote_allowed': filters.remote_allowed}
+
+        if filters.work_types is not None:
+            categories = registry.get('work_type_encoder').categories_[0].tolist()
+            conditions['work_type_mask'] = mask_of(filters.work_types, categories)
+
+        posted_after = filters.posted_after.timestamp() if filters.posted_after is not None else None
+        if filters.posted_within_days is not None:
+            recent = time.time() - filters.posted_within_days * 86400
+            posted_after = recent if posted_after is None else max(posted_after, recent)
+        conditions['posted_after'] = posted_after
+
+        if filters.active:
+            conditions['active_at'] = time.time()
+
+        return self._filter_jobs(jobs_ids, **conditions)
+
+    @instrumentation.timed('recommend.prefilter')
+    def _prefilter_work_type(self, user: dict, jobs_ids: list[int]) -> list[int]:
+        # Users without a preferred work type keep every candidate
+        mask = to_mask(np.asarray(user['work_type']) > 0)
+        if not mask:
+            return jobs_ids
+        return self._filter_jobs(jobs_ids, work_type_mask=mask)
+
+    def _filter_jobs(self, jobs_ids: list[int] | None, **conditions) -> list[int]:
+        return self.db.filter_jobs(jobs_ids, **conditions)
+
+    @staticmethod
+    def _no_recommendations():
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+
+    def _rank(self, base: dict, jobs_ids: list[int], recommender_weights: weights,
+              top_k: int = None, threshold: float = None):
+        """
+        Score the candidate jobs against the base and return the best (job ids, scores).
+        """
+        # Get jobs embeddings from the index or the database
+        jobs = self._fetch_jobs(jobs_ids)
+        if recommender_weights.skills:
+            jobs['skills'] = self._skill_sets(jobs_ids)
+
         # Get recommendations
-        recommendations = self._recommend(user, jobs, recommender_weights)
-        
+        recommendations = self._recommend(base, jobs, recommender_weights, top_k, threshold)
+
         # Get recommendations ids
-        recommendations = self._get_recommendations_ids(jobs_ids, recommendations)
-        
-        return recommendations
+        return self._get_recommendations_ids(jobs_ids, recommendations)
+
+    def _skill_index(self) -> SkillIndex:
+        if self.skill_index is None:
+            raise ValueError("Matching skills requires a recommender with a skill_index")
+        return self.skill_index
+
+    def _skill_sets(self, jobs_ids: list[int]) -> skills.skill_sets:
+        return self._skill_index().skill_sets(jobs_ids)
 
-    def _get_recommendations_ids(self, jobs_ids: list[int], recommendations: list[tuple[int, float]]):
-        return [(jobs_ids[i], score) for i, score in recommendations]
+    def _get_recommendations_ids(self, jobs_ids: list[int], recommendations: tuple[np.ndarray, np.ndarray]):
+        indices, scores = recommendations
+        return np.asarray(jobs_ids)[indices], scores
     
+    @instrumentation.timed('recommend.retrieve')
+    def _retrieve(self, base: dict, n_candidates: int, exclude: int = None) -> list[int]:
+        """
+        Shortlist candidate job ids from the ANN index, re-ranked afterwards by _recommend.
+        """
+        if self.ann_index is None:
+            raise ValueError("jobs_ids is required when the recommender has no ann_index")
+
+        candidates, _ = self.ann_index.search(base[self.ann_index.feature], n_candidates, exclude=exclude)
+        return candidates.tolist()
+
+    @instrumentation.timed('recommend.fetch')
+    def _fetch_job(self, job_id: int):
+        if self.index is not None and job_id in self.index:
+            return self.index.get_job(job_id)
+        return self.db.get_job_embeddings(job_id)
+
+    @instrumentation.timed('recommend.fetch')
     def _fetch_jobs(self, jobs_ids: list[int]):
+        # Slice candidate rows from the resident index when available,
+        # a snapshot lacking some of the jobs returns None
+        if self.index is not None:
+            jobs = self.index.get_jobs(jobs_ids)
+            if jobs is not None:
+                return jobs
+
         # Define jobs dictionary to store each job's feature embeddings
         jobs = dict()
         
         for feature in consts.job_recommendation_features:
+            # Work types are scored from their bitmasks when every candidate has one
+            if feature == 'work_type':
+                masks = self.db.get_jobs_work_type_masks(jobs_ids)
+                if masks is not None:
+                    jobs[feature] = masks
+                    continue
+
             # Get jobs feature embeddings column from database
             embeddings = self.db.get_jobs_column_embeddings(jobs_ids, feature)
             jobs[feature] = embeddings
@@ -99,5 +419,8 @@ class job_recommender(content_based_recommender):
         # Map user keys to job keys
         for key, value in user_map.items():
             utils.rename_key(user_data, key, value)
+
+        # Skills as the term ids they are matched on
+        user_data['skills'] = skills.term_ids(user_data.get('skills'))
         
         return user_data
\ No newline at end of file
@@ -0,0 +1,314 @@
+import time
+import pickle
+import hashlib
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+import numpy as np
+
+from Modules.database import EmbeddingDB, db_listener
+from Modules import instrumentation
+
+# Dependency of results computed over the whole catalogue (ANN retrieval)
+ALL_JOBS = 'jobs:*'
+
+
+def job_dependency(job_id: int) -> str:
+    return f'job:{job_id}'
+
+
+def user_dependency(user_id: int) -> str:
+    return f'user:{user_id}'
+
+
+class ResultCacheBackend(ABC):
+    """
+    Storage of cached recommendations.
+
+    Entries expire after their TTL. Each entry is linked to the jobs and users
+    it was computed from, so writes to those rows can drop it.
+    """
+
+    @abstractmethod
+    def get(self, key: str):
+        """Value of a live entry, None when missing or expired"""
+        pass
+
+    @abstractmethod
+    def set(self, key: str, value, ttl: float, dependencies: list[str]):
+        """Store an entry linked to its dependencies"""
+        pass
+
+    @abstractmethod
+    def invalidate(self, dependencies: list[str]) -> int:
+        """Drop every entry linked to one of the dependencies, returns the number dropped"""
+        pass
+
+    @abstractmethod
+    def clear(self):
+        pass
+
+    @abstractmethod
+    def __len__(self):
+        pass
+
+
+class MemoryBackend(ResultCacheBackend):
+    """
+    In-process backend, bounded to max_entries with least recently used eviction.
+    """
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()   # key: (expires_at, value, dependencies)
+        self.linked = dict()           # dependency: set of keys
+        self.lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key: str):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                self._drop(key)
+                return None
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key: str, value, ttl: float, dependencies: list[str]):
+        with self.lock:
+            if key in self.entries:
+                self._drop(key)
+
+            self.entries[key] = (time.monotonic() + ttl, value, dependencies)
+            for dependency in dependencies:
+                self.linked.setdefault(dependency, set()).add(key)
+
+            # Evict least recently used entries until the cache fits
+            while len(self.entries) > self.max_entries:
+                self._drop(next(iter(self.entries)))
+                self.evictions += 1
+
+    def invalidate(self, dependencies: list[str]) -> int:
+        with self.lock:
+            keys = set()
+            for dependency in dependencies:
+                keys.update(self.linked.get(dependency, ()))
+            for key in keys:
+                self._drop(key)
+            return len(keys)
+
+    def clear(self):
+        with self.lock:
+            self.entries = OrderedDict()
+            self.linked = dict()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _drop(self, key: str):
+        _, _, dependencies = self.entries.pop(key)
+        for dependency in dependencies:
+            keys = self.linked.get(dependency)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.linked[dependency]
+
+
+class RedisBackend(ResultCacheBackend):
+    """
+    Backend shared by every process using the same Redis server.
+
+    Entries are pickled under `prefix` with a Redis expiry, and each dependency
+    is a Redis set of the keys linked to it. Bounding the memory is left to the
+    server's maxmemory-policy (e.g. allkeys-lru).
+    """
+
+    def __init__(self, client, prefix: str = 'recommendations:'):
+        """
+        Args:
+            client: redis.Redis client (or any client with the same API)
+            prefix: Namespace of the cache keys
+        """
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key: str):
+        blob = self.client.get(self.prefix + 'entry:' + key)
+        return None if blob is None else pickle.loads(blob)
+
+    def set(self, key: str, value, ttl: float, dependencies: list[str]):
+        ttl_ms = max(int(ttl * 1000), 1)
+        pipeline = self.client.pipeline()
+        pipeline.set(self.prefix + 'entry:' + key, pickle.dumps(value), px=ttl_ms)
+        for dependency in dependencies:
+            # Every entry has the same TTL, so links outlive the entries they point to
+            pipeline.sadd(self.prefix + 'linked:' + dependency, key)
+            pipeline.pexpire(self.prefix + 'linked:' + dependency, ttl_ms)
+        pipeline.execute()
+
+    def invalidate(self, dependencies: list[str]) -> int:
+        pipeline = self.client.pipeline()
+        for dependency in dependencies:
+            pipeline.smembers(self.prefix + 'linked:' + dependency)
+            pipeline.delete(self.prefix + 'linked:' + dependency)
+        keys = set().union(*pipeline.execute()[::2]) if dependencies else set()
+
+        if not keys:
+            return 0
+        # Members are bytes, or str when the client decodes responses
+        return self.client.delete(*(self.prefix + 'entry:' + (key.decode() if isinstance(key, bytes) else key)
+                                    for key in keys))
+
+    def clear(self):
+        keys = list(self.client.scan_iter(match=self.prefix + '*'))
+        if keys:
+            self.client.delete(*keys)
+
+    def __len__(self):
+        return sum(1 for _ in self.client.scan_iter(match=self.prefix + 'entry:*'))
+
+
+class ResultCache(db_listener):
+    """
+    Cache of job_recommender results.
+
+    Keyed by the base user or job, a fingerprint of the candidate ids, the
+    weights and the ranking options. Follows the writes made through the
+    EmbeddingDB it is attached to and drops the results depending on any
+    stored or deleted row, so a hit always equals a fresh computation
+    (up to writes made through other EmbeddingDB instances, bounded by the TTL).
+    """
+
+    def __init__(self, db: EmbeddingDB, backend: ResultCacheBackend = None, ttl: float = 300.0):
+        """
+        Args:
+            db: Database whose writes invalidate cached results
+            backend: Storage of the results, a MemoryBackend by default
+            ttl: Seconds a result stays valid
+        """
+        self.db = db
+        self.backend = backend if backend is not None else MemoryBackend()
+        self.ttl = ttl
+        self.lock = threading.Lock()
+
+        # Bumped by every invalidation, results computed across one are not stored
+        self.generation = 0
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+        db.add_listener(self)
+
+    @staticmethod
+    def key(kind: str, base_id: int, jobs_ids: list[int] | None, recommender_weights, options: dict) -> str:
+        digest = hashlib.sha256(f"{kind}\0{base_id}\0{sorted(recommender_weights.model_dump().items())}"
+                                f"\0{sorted(options.items())}\0".encode())
+        if jobs_ids is None:
+            digest.update(b'ann')
+        else:
+            digest.update(np.asarray(jobs_ids, dtype=np.int64).tobytes())
+        return digest.hexdigest()
+
+    def get_or_compute(self, kind: str, base_id: int, jobs_ids: list[int] | None, recommender_weights,
+                       options: dict, compute):
+        """
+        Cached result of compute(), computed and stored on a miss.
+
+        Args:
+            kind: 'user' or 'job', the type of base_id
+            base_id: Id of the user or job the jobs are ranked for
+            jobs_ids: Candidate job ids, None when retrieved from the whole catalogue
+            recommender_weights: Feature weights
+            options: Other arguments changing the result (top_k, threshold, ...)
+            compute: Function returning the (job ids, scores) result
+
+        Returns:
+            Tuple of (job ids, scores) read-only NumPy arrays
+        """
+        key = self.key(kind, base_id, jobs_ids, recommender_weights, options)
+
+        result = self.backend.get(key)
+        if result is not None:
+            with self.lock:
+                self.hits += 1
+            instrumentation.count('recommend.cache_hits')
+            return result
+
+        with self.lock:
+            self.misses += 1
+            generation = self.generation
+        instrumentation.count('recommend.cache_misses')
+
+        ids, scores = compute()
+        for array in (ids, scores):
+            array.setflags(write=False)
+
+        dependencies = [user_dependency(base_id) if kind == 'user' else job_dependency(base_id)]
+        if jobs_ids is None:
+            dependencies.append(ALL_JOBS)
+        else:
+            dependencies.extend(job_dependency(job_id) for job_id in set(jobs_ids))
+
+        with self.lock:
+            if generation == self.generation:
+                self.backend.set(key, (ids, scores), self.ttl, dependencies)
+        return ids, scores
+
+    def on_job_stored(self, job_id: int, embeddings):
+        self.invalidate([job_dependency(job_id), ALL_JOBS])
+
+    def on_job_deleted(self, job_id: int):
+        self.invalidate([job_dependency(job_id), ALL_JOBS])
+
+    def on_user_stored(self, user_id: int, embeddings):
+        self.invalidate([user_dependency(user_id)])
+
+    def on_column_rewritten(self, table: str, column: str):
+        # Every cached result may depend on the column
+        self.clear()
+
+    def invalidate(self, dependencies: list[str]):
+        """
+        Drop the results depending on any of the given rows.
+        """
+        with self.lock:
+            self.generation += 1
+            dropped = self.backend.invalidate(dependencies)
+            self.invalidations += dropped
+        instrumentation.count('recommend.cache_invalidations', dropped)
+
+    def close(self):
+        """
+        Stop following database writes.
+        """
+        self.db.remove_listener(self)
+
+    def clear(self):
+        with self.lock:
+            self.generation += 1
+            self.backend.clear()
+
+    def stats(self) -> dict:
+        """
+        Hit / miss counters of this process.
+        """
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'invalidations': self.invalidations,
+                'evictions': getattr(self.backend, 'evictions', None),
+                'entries': len(self.backend),
+            }
+
+    def reset_stats(self):
+        with self.lock:
+            self.hits = self.misses = self.invalidations = 0
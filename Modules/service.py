@@ -0,0 +1,426 @@
+"""
+Asyncio HTTP service around the embedders and job_recommender.
+
+Concurrent embedding requests are coalesced into micro-batches, and embedding
+and scoring run in thread pools so the event loop only parses requests. A
+bound on in-flight requests gives backpressure (503) and every request has a
+deadline (504).
+
+Endpoints (JSON bodies):
+    POST /jobs                store the embeddings of a job (Models.models.job)
+    POST /users               store the embeddings of a user (Models.models.user)
+    POST /recommend/job       jobs similar to a stored job (job_recommendation_request)
+    POST /recommend/user      jobs matching a stored user (user_recommendation_request)
+    GET  /health
+    GET  /metrics             Prometheus metrics when a PrometheusSink is installed
+
+Usage:
+    python -m Modules.service --db Data/embeddings.db --port 8080
+"""
+import json
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+
+import numpy as np
+from pydantic import BaseModel, ValidationError
+
+from Models.models import job, user, job_recommendation_request, user_recommendation_request
+from Modules import instrumentation
+from Modules.database import EmbeddingDB
+from Modules.recommender import job_recommender
+from Modules.result_cache import ResultCache, MemoryBackend
+from Modules.snapshot import SnapshotIndex
+from Modules.skill_index import SkillIndex
+from Modules.skills import skill_vocabulary
+
+# Largest accepted request body
+MAX_BODY_BYTES = 1 << 20
+
+
+class http_error(Exception):
+    def __init__(self, status: HTTPStatus, message: str = None, headers: dict = None):
+        super().__init__(message or status.phrase)
+        self.status = status
+        self.headers = headers or dict()
+
+
+class micro_batcher:
+    """
+    Collects items submitted concurrently and processes them together.
+
+    A batch is dispatched as soon as it holds `max_batch_size` items or when
+    `max_wait` seconds have passed since its first item arrived. `process`
+    runs in `executor` and must return one result per item, in order.
+    """
+
+    def __init__(self, process, executor: ThreadPoolExecutor, max_batch_size: int = 32,
+                 max_wait: float = 0.005, max_pending: int = 1024):
+        self.process = process
+        self.executor = executor
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.queue: asyncio.Queue = asyncio.Queue(max_pending)
+        self.task = None
+
+    def start(self):
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+
+    async def submit(self, item):
+        """
+        Process an item with the next batch and return its result.
+        Raises http_error(503) when too many items are already waiting.
+        """
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self.queue.put_nowait((item, future))
+        except asyncio.QueueFull:
+            raise http_error(HTTPStatus.SERVICE_UNAVAILABLE, 'Too many pending requests', {'Retry-After': '1'})
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            # Requests that timed out while waiting are dropped
+            batch = [(item, future) for item, future in batch if not future.done()]
+            if not batch:
+                continue
+
+            instrumentation.count('service.batches')
+            instrumentation.count('service.batched_items', len(batch))
+            try:
+                results = await loop.run_in_executor(self.executor, self.process, [item for item, _ in batch])
+            except Exception as error:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(error)
+                continue
+
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+
+class RecommendationService:
+    def __init__(self,
+                 db: EmbeddingDB,
+                 recommender: job_recommender = None,
+                 jobs_embedder=None,
+                 users_embedder=None,
+                 max_batch_size: int = 32,
+                 max_wait: float = 0.005,
+                 max_in_flight: int = 256,
+                 timeout: float = 5.0,
+                 workers: int = 4):
+        """
+        Args:
+            db: Database the embeddings are stored in and read from
+            recommender: Recommender over `db` (a plain job_recommender by default)
+            jobs_embedder: job_embedder used by POST /jobs (created on first use)
+            users_embedder: user_embedder used by POST /users (created on first use)
+            max_batch_size: Maximum number of objects embedded together
+            max_wait: Seconds a micro-batch waits for more objects after its first one
+            max_in_flight: Requests handled at once, further requests get 503
+            timeout: Seconds before a request is answered with 504
+            workers: Threads scoring recommendations
+        """
+        self.db = db
+        self.recommender = recommender or job_recommender(db)
+        self.embedders = {'jobs': jobs_embedder, 'users': users_embedder}
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout
+
+        # A single embedding thread: the models parallelize internally
+        self.embed_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='embed')
+        self.score_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='score')
+
+        self.routes = {
+            ('POST', '/jobs'): self.store_job,
+            ('POST', '/users'): self.store_user,
+            ('POST', '/recommend/job'): self.recommend_job,
+            ('POST', '/recommend/user'): self.recommend_user,
+            ('GET', '/health'): self.health,
+            ('GET', '/metrics'): self.metrics,
+        }
+        self.in_flight = 0
+        self.batchers = dict()
+        self.server = None
+
+    async def start(self, host: str = '127.0.0.1', port: int = 8080):
+        self.batchers = {
+            'jobs': micro_batcher(self._store_jobs, self.embed_executor, self.max_batch_size, self.max_wait),
+            'users': micro_batcher(self._store_users, self.embed_executor, self.max_batch_size, self.max_wait),
+        }
+        for batcher in self.batchers.values():
+            batcher.start()
+
+        self.server = await asyncio.start_server(self._serve_connection, host, port)
+        return self.server
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        for batcher in self.batchers.values():
+            await batcher.stop()
+        self.embed_executor.shutdown(wait=False)
+        self.score_executor.shutdown(wait=False)
+
+    # Handlers
+
+    async def store_job(self, body: dict):
+        obj = self._parse(job, body)
+        await self.batchers['jobs'].submit(obj)
+        return {'job_id': obj.job_id}
+
+    async def store_user(self, body: dict):
+        obj = self._parse(user, body)
+        await self.batchers['users'].submit(obj)
+        return {'user_id': obj.user_id}
+
+    async def recommend_job(self, body: dict):
+        request = self._parse(job_recommendation_request, body)
+        return await self._score(self.recommender.job_recommend, request.job_id, request)
+
+    async def recommend_user(self, body: dict):
+        request = self._parse(user_recommendation_request, body)
+        return await self._score(self.recommender.user_job_recommend, request.user_id, request,
+                                 skill_candidates=request.skill_candidates)
+
+    async def health(self, body: dict):
+        health = {'status': 'ok', 'in_flight': self.in_flight}
+        # Counting the entries of a shared backend scans it, so only in-process caches report here
+        cache = getattr(self.recommender, 'cache', None)
+        if cache is not None and isinstance(cache.backend, MemoryBackend):
+            health['cache'] = cache.stats()
+        index = getattr(self.recommender, 'index', None)
+        if isinstance(index, SnapshotIndex):
+            health['snapshot'] = index.version
+        return health
+
+    async def metrics(self, body: dict):
+        sink = instrumentation.get_sink()
+        if not hasattr(sink, 'render'):
+            raise http_error(HTTPStatus.NOT_FOUND, 'No metrics sink installed')
+        return sink.render()
+
+    # Work run in the executors
+
+    def _store_jobs(self, objs: list[job]) -> list[None]:
+        embeddings = self._embedder('jobs').embed_batch(objs, batch_size=self.max_batch_size)
+        self.db.store_job_embeddings_batch((obj.job_id, obj) for obj in embeddings)
+        return [None] * len(objs)
+
+    def _store_users(self, objs: list[user]) -> list[None]:
+        embeddings = self._embedder('users').embed_batch(objs, batch_size=self.max_batch_size)
+        self.db.store_user_embeddings_batch((obj.user_id, obj) for obj in embeddings)
+        return [None] * len(objs)
+
+    def _embedder(self, kind: str):
+        # Deferred so the service starts without loading the models
+        if self.embedders[kind] is None:
+            from Modules.preprocessor import job_embedder, user_embedder
+            self.embedders[kind] = job_embedder() if kind == 'jobs' else user_embedder()
+        return self.embedders[kind]
+
+    async def _score(self, recommend, base_id: int, request, **options):
+        def run():
+            return recommend(base_id, request.jobs_ids, request.recommender_weights,
+                             top_k=request.top_k, threshold=request.threshold, filters=request.filters, **options)
+
+        try:
+            ids, scores = await asyncio.get_running_loop().run_in_executor(self.score_executor, run)
+        except KeyError as error:
+            raise http_error(HTTPStatus.NOT_FOUND, str(error))
+        except (TypeError, ValueError) as error:
+            raise http_error(HTTPStatus.BAD_REQUEST, str(error))
+
+        return {'jobs_ids': np.asarray(ids).tolist(), 'scores': np.asarray(scores).tolist()}
+
+    @staticmethod
+    def _parse(model: type[BaseModel], body: dict):
+        try:
+            return model.model_validate(body)
+        except ValidationError as error:
+            raise http_error(HTTPStatus.UNPROCESSABLE_ENTITY, str(error))
+
+    # HTTP
+
+    async def _serve_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request = await self._read_request(reader)
+                if request is None:
+                    break
+                method, path, body, keep_alive = request
+
+                status, payload, headers = await self._dispatch(method, path, body)
+                await self._write_response(writer, status, payload, headers, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            # Client went away or sent a malformed request
+            pass
+        finally:
+            writer.close()
+
+    async def _dispatch(self, method: str, path: str, body: bytes):
+        route = path.split('?', 1)[0]
+        handler = self.routes.get((method, route))
+        try:
+            if handler is None:
+                raise http_error(HTTPStatus.NOT_FOUND)
+
+            if self.in_flight >= self.max_in_flight:
+                raise http_error(HTTPStatus.SERVICE_UNAVAILABLE, 'Server overloaded', {'Retry-After': '1'})
+
+            try:
+                data = json.loads(body) if body else dict()
+            except ValueError:
+                raise http_error(HTTPStatus.BAD_REQUEST, 'Invalid JSON body')
+
+            self.in_flight += 1
+            try:
+                with instrumentation.stage(f'service.{route}'):
+                    payload = await asyncio.wait_for(handler(data), self.timeout)
+            except asyncio.TimeoutError:
+                raise http_error(HTTPStatus.GATEWAY_TIMEOUT, f'Request exceeded {self.timeout}s')
+            finally:
+                self.in_flight -= 1
+
+            status, headers = HTTPStatus.OK, dict()
+
+        except http_error as error:
+            status, payload, headers = error.status, {'error': str(error)}, error.headers
+
+        except Exception as error:
+            status, payload, headers = HTTPStatus.INTERNAL_SERVER_ERROR, {'error': repr(error)}, dict()
+
+        instrumentation.count(f'service.responses.{status.value}')
+        return status, payload, headers
+
+    @staticmethod
+    async def _read_request(reader: asyncio.StreamReader):
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+
+        method, path, version = request_line.decode('latin-1').split()
+        headers = dict()
+        while (line := await reader.readline()) not in (b'\r\n', b'\n', b''):
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        length = int(headers.get('content-length', 0))
+        if length > MAX_BODY_BYTES:
+            raise ConnectionError(f'Request body of {length} bytes exceeds {MAX_BODY_BYTES}')
+        body = await reader.readexactly(length) if length else b''
+
+        connection = headers.get('connection', '').lower()
+        keep_alive = connection != 'close' if version == 'HTTP/1.1' else connection == 'keep-alive'
+        return method, path, body, keep_alive
+
+    @staticmethod
+    async def _write_response(writer: asyncio.StreamWriter, status: HTTPStatus, payload,
+                              headers: dict, keep_alive: bool):
+        if isinstance(payload, str):
+            body, content_type = payload.encode(), 'text/plain; version=0.0.4'
+        else:
+            body, content_type = json.dumps(payload).encode(), 'application/json'
+
+        head = [
+            f'HTTP/1.1 {status.value} {status.phrase}',
+            f'Content-Type: {content_type}',
+            f'Content-Length: {len(body)}',
+            f'Connection: {"keep-alive" if keep_alive else "close"}',
+        ] + [f'{name}: {value}' for name, value in headers.items()]
+
+        writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + body)
+        await writer.drain()
+
+
+async def serve(service: RecommendationService, host: str, port: int):
+    server = await service.start(host, port)
+    print(f"Serving on http://{host}:{port}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Job recommendation HTTP service')
+    parser.add_argument('--db', default='Data/embeddings.db', help='Path of the embeddings database')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--max-batch-size', type=int, default=32)
+    parser.add_argument('--max-wait-ms', type=float, default=5.0)
+    parser.add_argument('--max-in-flight', type=int, default=256)
+    parser.add_argument('--timeout', type=float, default=5.0, help='Request deadline in seconds')
+    parser.add_argument('--workers', type=int, default=4, help='Scoring threads')
+    parser.add_argument('--metrics', action='store_true', help='Expose Prometheus metrics on /metrics')
+    parser.add_argument('--cache-entries', type=int, default=0, help='Cached recommendation results (0 disables)')
+    parser.add_argument('--cache-ttl', type=float, default=300.0, help='Seconds a cached result stays valid')
+    parser.add_argument('--snapshot', help='Snapshot root written by Modules.snapshot, ranked from instead of SQLite')
+    parser.add_argument('--skill-index', action='store_true',
+                        help='Load the skill index for skill candidates, filters and the skills weight')
+    parser.add_argument('--skill-vocabulary',
+                        help='Text file of known skills, one per line, also taken from the content of posted jobs')
+    args = parser.parse_args()
+
+    if args.metrics:
+        instrumentation.set_sink(instrumentation.PrometheusSink())
+
+    db = EmbeddingDB(args.db, pooled=True)
+    cache = None
+    if args.cache_entries > 0:
+        cache = ResultCache(db, MemoryBackend(args.cache_entries), ttl=args.cache_ttl)
+
+    snapshot = SnapshotIndex(args.snapshot, db=db) if args.snapshot else None
+    skill_index = SkillIndex(db) if args.skill_index else None
+
+    # The jobs embedder is otherwise created on the first POST /jobs
+    jobs_embedder = None
+    if args.skill_vocabulary:
+        from Modules.preprocessor import job_embedder
+        jobs_embedder = job_embedder(skill_vocabulary=skill_vocabulary.from_file(args.skill_vocabulary))
+
+    service = RecommendationService(
+        db,
+        recommender=job_recommender(db, index=snapshot, cache=cache, users=snapshot, skill_index=skill_index),
+        jobs_embedder=jobs_embedder,
+        max_batch_size=args.max_batch_size,
+        max_wait=args.max_wait_ms / 1000,
+        max_in_flight=args.max_in_flight,
+        timeout=args.timeout,
+        workers=args.workers,
+    )
+    try:
+        asyncio.run(serve(service, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,309 @@
+"""
+Jobs table hash-partitioned across several SQLite files, ranked with a
+parallel scatter-gather that returns the same ranking as one database.
+
+_recommend min-max normalizes every feature over all candidates, so ranking
+runs in two phases: each shard computes its raw feature similarities and their
+range, then normalizes with the global range and keeps its local top-k, and the
+local top-ks are merged.
+"""
+import os
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+from scipy import sparse
+
+from Models.models import weights
+from Modules import consts, instrumentation, utils
+from Modules.categorical import category_masks
+from Modules.database import EmbeddingDB, db_listener
+from Modules.job_index import JobIndex
+from Modules.quantization import int8_matrix
+from Modules.recommender import job_recommender
+from Modules.skill_index import SkillIndex
+
+# Fibonacci hashing constant, spreads consecutive ids evenly across shards
+HASH_MULTIPLIER = 0x9E3779B97F4A7C15
+
+
+def shard_of(job_id: int, n_shards: int) -> int:
+    """
+    Shard holding a job.
+    """
+    return ((int(job_id) * HASH_MULTIPLIER) & 0xFFFFFFFFFFFFFFFF) % n_shards
+
+
+class ShardedJobStore:
+    """
+    Jobs embeddings hash-partitioned across several EmbeddingDB files.
+    Only the jobs table is sharded, users stay in their own database.
+    """
+
+    def __init__(self, paths: list[str], resident: bool = False, **options):
+        """
+        Args:
+            paths: Database file of each shard, the order defines the partitioning
+            resident: Keep an in-memory JobIndex of every shard and rank from it
+            options: EmbeddingDB options of every shard (pooled, quantize, ...)
+        """
+        options.setdefault('pooled', True)
+        self.paths = list(paths)
+        self.shards = [EmbeddingDB(path, **options) for path in self.paths]
+        self.indexes = [JobIndex(shard) for shard in self.shards] if resident else None
+
+    @classmethod
+    def in_directory(cls, directory: str, n_shards: int, **options) -> 'ShardedJobStore':
+        """
+        Store of n_shards files named jobs-<i>.db in a directory.
+        """
+        return cls([os.path.join(directory, f'jobs-{i:03d}.db') for i in range(n_shards)], **options)
+
+    def __len__(self):
+        return len(self.shards)
+
+    def shard(self, job_id: int) -> EmbeddingDB:
+        return self.shards[shard_of(job_id, len(self.shards))]
+
+    def partition(self, job_ids: list[int]) -> list[np.ndarray]:
+        """
+        Positions in job_ids of the jobs of every shard.
+        """
+        shards = np.fromiter((shard_of(job_id, len(self.shards)) for job_id in job_ids),
+                             dtype=np.int64, count=len(job_ids))
+        order = np.argsort(shards, kind='stable')
+        bounds = np.searchsorted(shards[order], np.arange(len(self.shards) + 1))
+        return [order[bounds[i]:bounds[i + 1]] for i in range(len(self.shards))]
+
+    def store_job_embeddings(self, job_id: int, embeddings):
+        self.shard(job_id).store_job_embeddings(job_id, embeddings)
+
+    def store_job_embeddings_batch(self, jobs, chunk_size: int = 1000) -> int:
+        """
+        Route (job_id, embeddings) pairs to their shards, chunk_size jobs at a time.
+        """
+        written = 0
+        for chunk in utils.chunked(jobs, chunk_size):
+            for shard, positions in zip(self.shards, self.partition([job_id for job_id, _ in chunk])):
+                if len(positions):
+                    written += shard.store_job_embeddings_batch([chunk[i] for i in positions], chunk_size)
+        return written
+
+    def delete_job_embeddings(self, job_id: int):
+        self.shard(job_id).delete_job_embeddings(job_id)
+
+    def get_job_embeddings(self, job_id: int) -> dict:
+        return self.shard(job_id).get_job_embeddings(job_id)
+
+    def get_job_ids(self) -> list[int]:
+        return sorted(job_id for shard in self.shards for job_id in shard.get_job_ids())
+
+    def filter_jobs(self, job_ids: list[int] = None, **conditions) -> list[int]:
+        """
+        EmbeddingDB.filter_jobs over every shard, in the order of job_ids when given.
+        """
+        if job_ids is None:
+            return sorted(job_id for shard in self.shards for job_id in shard.filter_jobs(None, **conditions))
+
+        matching = set()
+        for shard, positions in zip(self.shards, self.partition(job_ids)):
+            if len(positions):
+                matching.update(shard.filter_jobs([job_ids[i] for i in positions], **conditions))
+        return [job_id for job_id in job_ids if job_id in matching]
+
+    def filter_jobs_by_work_type(self, mask: int, job_ids: list[int] = None) -> list[int]:
+        return self.filter_jobs(job_ids, work_type_mask=mask)
+
+    def iter_job_skill_terms(self):
+        for shard in self.shards:
+            yield from shard.iter_job_skill_terms()
+
+    def add_listener(self, listener: db_listener):
+        for shard in self.shards:
+            shard.add_listener(listener)
+
+    def remove_listener(self, listener: db_listener):
+        for shard in self.shards:
+            shard.remove_listener(listener)
+
+    def close(self):
+        for shard in self.shards:
+            shard.close()
+
+
+# Recommenders of the shards opened by each process pool worker
+_worker_shards = dict()
+_worker_lock = threading.Lock()
+
+
+def _shard_recommender(shard) -> job_recommender:
+    """
+    Recommender of a shard, given directly (thread pools) or by its path (process pools).
+    """
+    if isinstance(shard, job_recommender):
+        return shard
+
+    with _worker_lock:
+        if shard not in _worker_shards:
+            _worker_shards[shard] = job_recommender(EmbeddingDB(shard, pooled=True))
+        return _worker_shards[shard]
+
+
+def _shard_similarities(shard, base: dict, job_ids: list[int]) -> tuple[dict, type]:
+    """
+    Phase 1: raw similarity of the base to every job of the shard, per feature.
+    """
+    recommender = _shard_recommender(shard)
+    jobs = recommender._fetch_jobs(job_ids)
+
+    similarities = {
+        feature: np.atleast_1d(utils.similarity(base[feature], jobs[feature]))
+        for feature in consts.job_recommendation_features
+    }
+    return similarities, recommender._score_dtype(jobs)
+
+
+def _shard_select(similarities: dict, ranges: dict, recommender_weights: weights, dtype,
+                  top_k: int = None, threshold: float = None) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Phase 2: scores of the shard normalized with the global ranges, and its local top-k.
+    Same arithmetic as content_based_recommender._recommend.
+    """
+    n_options = len(next(iter(similarities.values())))
+    option_scores = np.zeros((n_options, ), dtype=dtype)
+
+    for feature, scores in similarities.items():
+        low, high = ranges[feature]
+        option_scores += getattr(recommender_weights, feature) * utils.normalize_range(scores, low, high)
+
+    selected = utils.top_k(option_scores, top_k, threshold)
+    return selected, option_scores[selected]
+
+
+def _concatenate(parts: list):
+    """
+    Stack the candidate matrices fetched from several shards.
+    """
+    if isinstance(parts[0], category_masks):
+        return category_masks(np.concatenate([part.masks for part in parts]), parts[0].n_categories)
+    if isinstance(parts[0], int8_matrix):
+        return int8_matrix(np.concatenate([part.codes for part in parts]), np.concatenate([part.scales for part in parts]))
+    if any(sparse.issparse(part) for part in parts):
+        return sparse.vstack([sparse.csr_matrix(part) for part in parts], format='csr')
+    return np.concatenate(parts)
+
+
+class sharded_job_recommender(job_recommender):
+    """
+    job_recommender over a ShardedJobStore.
+
+    job_recommend and user_job_recommend fan out to one task per shard holding
+    candidates and return the ranking of an unsharded database with the same
+    jobs, ties broken by position in jobs_ids. Dense dot products of a shard may
+    be summed in another order by BLAS, so scores can differ in the last bits.
+    """
+
+    def __init__(self, users_db: EmbeddingDB, store: ShardedJobStore, executor: Executor = None,
+                 workers: int = None, skill_index: SkillIndex = None):
+        """
+        Args:
+            users_db: Database of the users
+            store: Sharded jobs
+            executor: Pool running the shard tasks. A ProcessPoolExecutor opens the shard
+                files in every worker. By default a process pool of `workers` processes, or a
+                thread pool when the store is resident
+            workers: Workers of the default pool (one per shard when None)
+            skill_index: SkillIndex of the store, skill overlap is scored once for all shards
+        """
+        super().__init__(users_db, skill_index=skill_index)
+        self.store = store
+        self.owns_executor = executor is None
+        if executor is None:
+            # Fetching and decoding SQLite rows holds the GIL, so shards only run in parallel as
+            # processes. Resident shards are ranked from in-memory matrices by NumPy / BLAS, which
+            # releases the GIL, and threads keep following the writes of the store
+            if store.indexes is not None:
+                executor = ThreadPoolExecutor(max_workers=workers or len(store), thread_name_prefix='shard')
+            else:
+                executor = ProcessPoolExecutor(max_workers=workers or len(store))
+        self.executor = executor
+
+        # Thread pools share the shard objects, process pools reopen them by path
+        if isinstance(self.executor, ThreadPoolExecutor):
+            indexes = store.indexes or [None] * len(store)
+            self.shards = [job_recommender(shard, index=index) for shard, index in zip(store.shards, indexes)]
+        else:
+            self.shards = store.paths
+
+    def close(self):
+        # Pools given by the caller are left running
+        if self.owns_executor:
+            self.executor.shutdown()
+
+    def _fetch_job(self, job_id: int):
+        return self.store.get_job_embeddings(job_id)
+
+    def _fetch_jobs(self, jobs_ids: list[int]):
+        # Gather the candidate rows of every shard back into the order of jobs_ids
+        parts, positions = [], []
+        for shard, shard_positions in zip(self.shards, self.store.partition(jobs_ids)):
+            if len(shard_positions):
+                parts.append(_shard_recommender(shard)._fetch_jobs([jobs_ids[i] for i in shard_positions]))
+                positions.append(shard_positions)
+
+        order = np.argsort(np.concatenate(positions), kind='stable')
+        return {feature: _concatenate([part[feature] for part in parts])[order]
+                for feature in consts.job_recommendation_features}
+
+    def _filter_jobs(self, jobs_ids: list[int] | None, **conditions) -> list[int]:
+        # Filters are evaluated by every shard
+        return self.store.filter_jobs(jobs_ids, **conditions)
+
+    def _rank(self, base: dict, jobs_ids: list[int], recommender_weights: weights,
+              top_k: int = None, threshold: float = None):
+        jobs_ids = np.asarray(jobs_ids)
+        tasks = [(shard, positions) for shard, positions in zip(self.shards, self.store.partition(jobs_ids))
+                 if len(positions)]
+        if not tasks:
+            return jobs_ids[:0], np.empty(0, dtype=np.float64)
+
+        # Phase 1: raw feature similarities of every shard
+        with instrumentation.stage('recommend.similarity'):
+            phase1 = [self.executor.submit(_shard_similarities, shard, base, jobs_ids[positions].tolist())
+                      for shard, positions in tasks]
+            results = [future.result() for future in phase1]
+
+            # Skill postings cover every shard, matched once and split by shard
+            if recommender_weights.skills:
+                matched = utils.similarity(base['skills'], self._skill_sets(jobs_ids))
+                for (_, positions), (similarities, _) in zip(tasks, results):
+                    similarities['skills'] = matched[positions]
+
+        # Global range of every feature, as _recommend sees it over all candidates
+        ranges = {
+            feature: (min(similarities[feature].min() for similarities, _ in results),
+                      max(similarities[feature].max() for similarities, _ in results))
+            for feature in self._features(recommender_weights)
+        }
+
+        # Phase 2: globally normalized scores and local top-k of every shard. Process workers would get
+        # the similarities shipped back, which costs more than selecting here
+        with instrumentation.stage('recommend.normalize'):
+            if isinstance(self.executor, ThreadPoolExecutor):
+                phase2 = [self.executor.submit(_shard_select, similarities, ranges, recommender_weights, dtype,
+                                               top_k, threshold)
+                          for similarities, dtype in results]
+                selections = [future.result() for future in phase2]
+            else:
+                selections = [_shard_select(similarities, ranges, recommender_weights, dtype, top_k, threshold)
+                              for similarities, dtype in results]
+
+        # Merge the local top-ks, ties in candidate order like utils.top_k
+        with instrumentation.stage('recommend.select'):
+            positions = np.concatenate([task_positions[selected]
+                                        for (_, task_positions), (selected, _) in zip(tasks, selections)])
+            scores = np.concatenate([shard_scores for _, shard_scores in selections])
+            order = np.lexsort((positions, -scores))[:top_k]
+
+        instrumentation.count('recommend.candidates_scored', len(jobs_ids))
+        return jobs_ids[positions[order]], scores[order]
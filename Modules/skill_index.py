@@ -0,0 +1,151 @@
+import threading
+import numpy as np
+
+from Modules import skills, instrumentation
+from Modules.database import EmbeddingDB, db_listener
+from Modules.skills import ID_DTYPE, TERM_DTYPE
+
+
+class SkillIndex(db_listener):
+    """
+    Inverted index of the skill terms of the jobs: term id -> sorted job ids.
+
+    Every (term, job) pair is kept in two parallel arrays sorted by term then
+    job, so the posting list of a term is one contiguous slice found by binary
+    search, and in a second ordering by job, so are the terms of a job. Loaded
+    once from the skill_terms column, then follows the writes made through the
+    EmbeddingDB it is attached to: changed jobs are kept in a small overlay,
+    merged into the arrays every `merge_every` changes.
+    """
+
+    def __init__(self, db: EmbeddingDB, merge_every: int = 1024):
+        """
+        Args:
+            db: Database (or ShardedJobStore) of the jobs
+            merge_every: Changed jobs kept in the overlay before it is merged
+        """
+        self.db = db
+        self.merge_every = merge_every
+        self.terms = np.empty(0, dtype=TERM_DTYPE)
+        self.jobs = np.empty(0, dtype=ID_DTYPE)
+        self.terms_by_job = np.empty(0, dtype=TERM_DTYPE)
+        self.jobs_by_job = np.empty(0, dtype=ID_DTYPE)
+        self.changed: dict[int, np.ndarray | None] = dict()   # job_id: terms, None when deleted
+        self.changed_ids = np.empty(0, dtype=ID_DTYPE)
+        self.lock = threading.RLock()
+
+        self.load()
+        db.add_listener(self)
+
+    def __len__(self):
+        """Number of (term, job) postings"""
+        return len(self.terms) + sum(len(terms) for terms in self.changed.values() if terms is not None)
+
+    def load(self):
+        """
+        (Re)load the skill terms of every job from the database.
+        """
+        job_ids, terms = [], []
+        for job_id, job_terms in self.db.iter_job_skill_terms():
+            job_ids.append(np.full(len(job_terms), job_id, dtype=ID_DTYPE))
+            terms.append(job_terms)
+
+        with self.lock:
+            self.changed = dict()
+            self.changed_ids = np.empty(0, dtype=ID_DTYPE)
+            self._build(np.concatenate(terms) if terms else np.empty(0, dtype=TERM_DTYPE),
+                        np.concatenate(job_ids) if job_ids else np.empty(0, dtype=ID_DTYPE))
+
+    def close(self):
+        """
+        Stop following database writes.
+        """
+        self.db.remove_listener(self)
+
+    def on_job_stored(self, job_id: int, embeddings):
+        job_skills = getattr(embeddings, 'skills', None)
+        self.update(job_id, skills.term_ids(job_skills) if job_skills is not None else None)
+
+    def on_job_deleted(self, job_id: int):
+        self.update(job_id, None)
+
+    def update(self, job_id: int, terms: np.ndarray | None):
+        """
+        Replace the terms of a job, None removes it from the index.
+        """
+        with self.lock:
+            self.changed[int(job_id)] = terms
+            self.changed_ids = np.array(sorted(self.changed), dtype=ID_DTYPE)
+            if len(self.changed) >= self.merge_every:
+                self._merge()
+
+    def postings(self, term: int) -> np.ndarray:
+        """
+        Sorted ids of the jobs holding a term.
+        """
+        with self.lock:
+            start = np.searchsorted(self.terms, term, 'left')
+            stop = np.searchsorted(self.terms, term, 'right')
+            posting = self.jobs[start:stop]
+            if not self.changed:
+                return posting
+
+            # Changed jobs are answered by the overlay
+            posting = posting[~skills.contains(self.changed_ids, posting)]
+            added = [job_id for job_id, terms in self.changed.items()
+                     if terms is not None and skills.contains(terms, [term])[0]]
+            return np.union1d(posting, np.array(added, dtype=ID_DTYPE)) if added else posting
+
+    def job_terms(self, job_id: int) -> np.ndarray:
+        """
+        Sorted term ids of a job, empty when it is not indexed.
+        """
+        with self.lock:
+            if job_id in self.changed:
+                terms = self.changed[job_id]
+                return terms if terms is not None else np.empty(0, dtype=TERM_DTYPE)
+            start = np.searchsorted(self.jobs_by_job, job_id, 'left')
+            stop = np.searchsorted(self.jobs_by_job, job_id, 'right')
+            return self.terms_by_job[start:stop]
+
+    @instrumentation.timed('recommend.skill_candidates')
+    def candidates(self, terms: np.ndarray, match_all: bool = False) -> np.ndarray:
+        """
+        Jobs holding any (or all) of the skills.
+
+        Args:
+            terms: Term ids of the skills, see skills.term_ids
+            match_all: Jobs holding every skill instead of any of them
+
+        Returns:
+            Sorted job ids
+        """
+        postings = [self.postings(int(term)) for term in terms]
+        return skills.intersect(postings) if match_all else skills.union(postings)
+
+    def skill_sets(self, job_ids) -> skills.skill_sets:
+        """
+        Skill terms of candidate jobs, scored against user skills by utils.similarity.
+        """
+        return skills.skill_sets(job_ids, self.postings)
+
+    def _merge(self):
+        # Drop the pairs of the changed jobs and insert their new terms
+        kept = ~skills.contains(self.changed_ids, self.jobs)
+        added = [(terms, np.full(len(terms), job_id, dtype=ID_DTYPE))
+                 for job_id, terms in self.changed.items() if terms is not None]
+        terms = np.concatenate([self.terms[kept]] + [terms for terms, _ in added])
+        jobs = np.concatenate([self.jobs[kept]] + [jobs for _, jobs in added])
+
+        self.changed = dict()
+        self.changed_ids = np.empty(0, dtype=ID_DTYPE)
+        self._build(terms, jobs)
+
+    def _build(self, terms: np.ndarray, jobs: np.ndarray):
+        order = np.lexsort((jobs, terms))
+        self.terms = terms[order]
+        self.jobs = jobs[order]
+
+        order = np.lexsort((terms, jobs))
+        self.terms_by_job = terms[order]
+        self.jobs_by_job = jobs[order]
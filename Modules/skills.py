@@ -0,0 +1,194 @@
+"""
+Skill terms of jobs and users, and the posting-list operations of the skill index.
+
+A skill is matched as a whole phrase: its words, lowercased and reduced to
+letters, joined by single spaces ("Machine-Learning" and "machine learning" are
+the same skill, "learning" alone is another one). A job holds the phrases of its
+listed skills, plus those of a skill vocabulary found in its content (see
+skill_vocabulary). Phrases are stored as 64-bit term ids, so shards and
+processes agree on them without sharing the vocabulary.
+"""
+import re
+import hashlib
+from functools import lru_cache
+
+import numpy as np
+
+TERM_DTYPE = np.dtype('<i8')
+
+# Job ids of posting lists
+ID_DTYPE = np.int64
+
+NON_ALPHA_REGEX = re.compile(r'[^a-z ]')
+
+
+@lru_cache(maxsize=65536)
+def term_id(phrase: str) -> int:
+    """
+    Stable 64-bit id of a skill phrase. Memoized, jobs share most of their skills.
+    """
+    return int.from_bytes(hashlib.blake2b(phrase.encode(), digest_size=8).digest(), 'little', signed=True)
+
+
+def words(text: str) -> list[str]:
+    """
+    Words of a text, lowercased and reduced to letters.
+    """
+    return NON_ALPHA_REGEX.sub(' ', str(text).lower()).split()
+
+
+def phrase(skill: str) -> str:
+    """
+    Normalized phrase of a skill, empty when it has no words.
+    """
+    return ' '.join(words(skill))
+
+
+def term_ids(job_skills) -> np.ndarray:
+    """
+    Sorted unique term ids of some skills, skills without words are dropped.
+    """
+    if job_skills is None:
+        return np.empty(0, dtype=TERM_DTYPE)
+    phrases = {phrase(skill) for skill in np.asarray(job_skills).reshape(-1)}
+    return np.array(sorted(term_id(p) for p in phrases if p), dtype=TERM_DTYPE)
+
+
+class skill_vocabulary:
+    """
+    Known skill phrases, looked up in job texts as n-grams of their words.
+    """
+
+    def __init__(self, known_skills):
+        self.phrases = frozenset(p for p in map(phrase, known_skills) if p)
+        self.max_words = max((len(p.split()) for p in self.phrases), default=0)
+
+    @classmethod
+    def from_file(cls, path: str) -> 'skill_vocabulary':
+        """
+        Vocabulary of a text file holding one skill per line.
+        """
+        with open(path) as f:
+            return cls(f)
+
+    def __len__(self):
+        return len(self.phrases)
+
+    def extract(self, text: str) -> list[str]:
+        """
+        Phrases of the vocabulary appearing in a text, in order of appearance.
+        """
+        text_words = words(text)
+        found = dict()
+        for start in range(len(text_words)):
+            for n_words in range(1, min(self.max_words, len(text_words) - start) + 1):
+                candidate = ' '.join(text_words[start:start + n_words])
+                if candidate in self.phrases:
+                    found[candidate] = None
+        return list(found)
+
+
+def to_blob(terms: np.ndarray | None) -> bytes | None:
+    if terms is None:
+        return None
+    return np.asarray(terms, dtype=TERM_DTYPE).tobytes()
+
+
+def from_blob(blob: bytes | None) -> np.ndarray | None:
+    if blob is None:
+        return None
+    return np.frombuffer(blob, dtype=TERM_DTYPE)
+
+
+def contains(sorted_ids: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """
+    Whether every value is in a sorted array, by binary search.
+    """
+    values = np.asarray(values)
+    if len(sorted_ids) == 0:
+        return np.zeros(len(values), dtype=bool)
+    positions = np.minimum(np.searchsorted(sorted_ids, values), len(sorted_ids) - 1)
+    return sorted_ids[positions] == values
+
+
+def intersect(postings: list[np.ndarray]) -> np.ndarray:
+    """
+    Ids in every sorted posting list, shortest lists first.
+    """
+    if not postings:
+        return np.empty(0, dtype=ID_DTYPE)
+
+    postings = sorted(postings, key=len)
+    result = postings[0]
+    for posting in postings[1:]:
+        if not len(result):
+            break
+        result = result[contains(posting, result)]
+    return result
+
+
+def union(postings: list[np.ndarray]) -> np.ndarray:
+    """
+    Ids in any of the sorted posting lists, sorted.
+    """
+    if not postings:
+        return np.empty(0, dtype=ID_DTYPE)
+    return np.unique(np.concatenate(postings))
+
+
+class skill_sets:
+    """
+    Skill terms of candidate jobs, read from the posting lists of a skill index
+    instead of being materialized per job.
+    """
+
+    def __init__(self, job_ids, postings):
+        """
+        Args:
+            job_ids: Candidate job ids, one option per id
+            postings: Function returning the sorted job ids of a term id
+        """
+        self.job_ids = np.asarray(job_ids, dtype=ID_DTYPE)
+        self.postings = postings
+
+    @property
+    def shape(self):
+        return (len(self.job_ids), 0)
+
+    def __len__(self):
+        return len(self.job_ids)
+
+    def __getitem__(self, rows):
+        return skill_sets(self.job_ids[rows], self.postings)
+
+    def matches(self, term: int) -> np.ndarray:
+        """
+        Whether every candidate holds a skill.
+        """
+        return contains(self.postings(int(term)), self.job_ids)
+
+
+def scores(bases: list[np.ndarray], options: skill_sets) -> np.ndarray:
+    """
+    Share of the skills of every base each option holds, one vectorized
+    membership test per distinct skill.
+
+    Args:
+        bases: Term ids of the skills of every base (see term_ids)
+        options: Candidate jobs
+
+    Returns:
+        (n_bases, n_options) float32 array in [0, 1], zero for bases without skills
+    """
+    result = np.zeros((len(bases), len(options)), dtype=np.float32)
+
+    # Bases often share skills, each distinct skill is tested once
+    matched = dict()
+    for row, base in enumerate(bases):
+        for term in base:
+            if term not in matched:
+                matched[term] = options.matches(term)
+            result[row] += matched[term]
+        if len(base):
+            result[row] /= len(base)
+    return result
@@ -0,0 +1,633 @@
+"""
+Columnar snapshots of the EmbeddingDB tables, memory-mapped read-only by workers.
+
+A snapshot root holds numbered versions and a CURRENT file naming the live one:
+
+    root/
+        CURRENT                  name of the live version
+        v000001/
+            manifest.json        format of every column
+            jobs/ids.npy         sorted ids, row i holds ids[i]
+            jobs/title.npy       dense (n, dim) matrix
+            jobs/content.*.npy   CSR parts (data, indices, indptr) or int8 parts (codes, scales)
+            users/...
+
+Versions are written under a temporary name and renamed into place, then
+CURRENT is replaced atomically, so readers never see a partial snapshot.
+Every worker maps the same files with np.load(mmap_mode='r'): pages are shared
+through the page cache, nothing is decoded at startup, and SnapshotIndex picks
+up a new version on its next check without a restart.
+"""
+import argparse
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+
+import numpy as np
+from scipy import sparse
+
+from Modules import consts, instrumentation
+from Modules.categorical import MASK_DTYPE, category_masks
+from Modules.database import EmbeddingDB, db_listener
+from Modules.quantization import INT8_SCALE_DTYPE, int8_matrix
+
+CURRENT = 'CURRENT'
+MANIFEST = 'manifest.json'
+FORMAT_VERSION = 1
+
+# Version directories are v000001, v000002, ...
+VERSION_PATTERN = re.compile(r'^v(\d{6,})$')
+
+# Tables a snapshot can hold
+TABLES = ('jobs', 'users')
+
+# Rows read from SQLite at once while exporting
+EXPORT_CHUNK_ROWS = 10000
+
+
+def _fsync(path: str):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _save(directory: str, name: str, array: np.ndarray) -> str:
+    path = os.path.join(directory, name)
+    np.save(path, np.ascontiguousarray(array), allow_pickle=False)
+    _fsync(path)
+    return name
+
+
+class _npy_appender:
+    """
+    1-D .npy file written chunk by chunk, for arrays whose length is only known at the end.
+    The header is written for an empty array and rewritten in place with the final length:
+    both are padded to the same size.
+    """
+
+    def __init__(self, path: str, dtype):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.length = 0
+        self.file = open(path, 'wb')
+        self._header()
+        self.offset = self.file.tell()
+        self.file.seek(0, os.SEEK_END)
+
+    def _header(self):
+        self.file.seek(0)
+        np.lib.format.write_array_header_1_0(self.file, {
+            'descr': np.lib.format.dtype_to_descr(self.dtype), 'fortran_order': False, 'shape': (self.length,)})
+
+    def append(self, values: np.ndarray):
+        self.file.write(np.ascontiguousarray(values, dtype=self.dtype).tobytes())
+        self.length += len(values)
+
+    def close(self):
+        self._header()
+        if self.file.tell() != self.offset:
+            raise ValueError(f"Header of {self.path} changed size")
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+
+
+class _wider_format(Exception):
+    """A chunk of a column does not fit the format or dtype it is being written in"""
+
+    def __init__(self, column_format: str, dtype):
+        self.column_format = column_format
+        self.dtype = dtype
+
+
+def _chunk_format(part) -> str:
+    if sparse.issparse(part):
+        return 'sparse'
+    if isinstance(part, int8_matrix):
+        return 'int8'
+    return 'dense'
+
+
+def _chunk_dtype(part) -> np.dtype:
+    """Dtype of the values of a chunk, int8 chunks are written dequantized outside of int8 columns"""
+    if sparse.issparse(part):
+        return part.data.dtype
+    if isinstance(part, int8_matrix):
+        return np.dtype(np.float32)
+    return part.dtype
+
+
+# Formats of a column, a format holds the chunks of the ones before it
+FORMATS = ('int8', 'dense', 'sparse')
+
+
+def _write_column(parts, directory: str, column: str, n_rows: int, column_format: str, dtype, dim: int) -> dict:
+    """
+    Stream the chunks of a column into its files, preallocated when their size is known.
+    Raises _wider_format when a chunk needs a more general format or dtype than the given ones.
+    """
+    def check(part):
+        part_format = max(column_format, _chunk_format(part), key=FORMATS.index)
+        part_dtype = dtype if part_format == 'int8' else np.result_type(dtype, _chunk_dtype(part))
+        if part_format != column_format or part_dtype != dtype:
+            raise _wider_format(part_format, part_dtype)
+
+    if column_format == 'sparse':
+        # Index arrays share one dtype, so mapping them does not make scipy copy them
+        index_dtype = np.int32 if n_rows * dim <= np.iinfo(np.int32).max else np.int64
+        data = _npy_appender(os.path.join(directory, f'{column}.data.npy'), dtype)
+        indices = _npy_appender(os.path.join(directory, f'{column}.indices.npy'), index_dtype)
+        indptr = [np.zeros(1, dtype=np.int64)]
+        try:
+            for part in parts:
+                check(part)
+                part = sparse.csr_matrix(part.dequantize() if isinstance(part, int8_matrix) else part)
+                part.sum_duplicates()
+                data.append(part.data)
+                indices.append(part.indices)
+                indptr.append(part.indptr[1:] + indptr[-1][-1])
+        finally:
+            data.close()
+            indices.close()
+        return {'format': 'sparse', 'shape': [n_rows, dim], 'data': f'{column}.data.npy',
+                'indices': f'{column}.indices.npy',
+                'indptr': _save(directory, f'{column}.indptr.npy', np.concatenate(indptr).astype(index_dtype))}
+
+    if column_format == 'int8':
+        codes = np.lib.format.open_memmap(os.path.join(directory, f'{column}.codes.npy'), mode='w+',
+                                          dtype=np.int8, shape=(n_rows, dim))
+        scales = np.lib.format.open_memmap(os.path.join(directory, f'{column}.scales.npy'), mode='w+',
+                                           dtype=INT8_SCALE_DTYPE, shape=(n_rows,))
+        row = 0
+        for part in parts:
+            check(part)
+            codes[row:row + len(part.codes)] = part.codes
+            scales[row:row + len(part.codes)] = part.scales
+            row += len(part.codes)
+        _flush(directory, f'{column}.codes.npy', codes)
+        _flush(directory, f'{column}.scales.npy', scales)
+        return {'format': 'int8', 'codes': f'{column}.codes.npy', 'scales': f'{column}.scales.npy'}
+
+    matrix = np.lib.format.open_memmap(os.path.join(directory, f'{column}.npy'), mode='w+',
+                                       dtype=dtype, shape=(n_rows, dim))
+    row = 0
+    for part in parts:
+        check(part)
+        part = part.dequantize() if isinstance(part, int8_matrix) else part
+        matrix[row:row + len(part)] = part
+        row += len(part)
+    _flush(directory, f'{column}.npy', matrix)
+    return {'format': 'dense', 'matrix': f'{column}.npy'}
+
+
+def _flush(directory: str, name: str, mapped: np.memmap):
+    mapped.flush()
+    _fsync(os.path.join(directory, name))
+
+
+def _is_embedding(value) -> bool:
+    return sparse.issparse(value) or (isinstance(value, np.ndarray) and value.ndim == 2 and value.dtype.kind in 'biuf')
+
+
+def _export_table(db: EmbeddingDB, table: str, directory: str, chunk_size: int) -> dict:
+    os.makedirs(directory)
+    ids = np.asarray(db.get_job_ids() if table == 'jobs' else db.get_user_ids(), dtype=np.int64)
+    chunks = [ids[start:start + chunk_size].tolist() for start in range(0, len(ids), chunk_size)]
+    read = db.get_jobs_column_embeddings if table == 'jobs' else db.get_users_column_embeddings
+
+    meta = {'rows': len(ids), 'ids': _save(directory, 'ids.npy', ids), 'columns': dict(),
+            'all_columns': sorted(db.job_columns if table == 'jobs' else db.user_columns)}
+
+    # A snapshot has no representation of missing rows, partially set columns are left out,
+    # as well as columns of raw values (e.g. users skills) instead of embeddings
+    first = (db.get_job_embeddings if table == 'jobs' else db.get_user_embeddings)(int(ids[0])) if len(ids) else {}
+    for column in db.get_complete_columns(table) if len(ids) else []:
+        if not _is_embedding(first.get(column)):
+            continue
+
+        # Chunks are written as they are read, only one is held in memory at a time
+        head = read(chunks[0], column)
+        column_format = _chunk_format(head)
+        column_meta = db.column_meta.get((table, column))
+        dim = column_meta[1] if column_meta else head.shape[1]
+        dtype = _chunk_dtype(head)
+
+        while True:
+            parts = (head if i == 0 else read(chunk, column) for i, chunk in enumerate(chunks))
+            try:
+                meta['columns'][column] = _write_column(parts, directory, column, len(ids), column_format, dtype, dim)
+                break
+            except _wider_format as wider:
+                # Rows stored in several formats, restart in the more general one
+                for name in os.listdir(directory):
+                    if name.startswith(f'{column}.'):
+                        os.remove(os.path.join(directory, name))
+                column_format, dtype = wider.column_format, wider.dtype
+
+    # Work types are also kept as bitmasks, scored like EmbeddingDB.get_jobs_work_type_masks
+    if table == 'jobs' and 'work_type' in meta['columns']:
+        masks = np.lib.format.open_memmap(os.path.join(directory, 'work_type.masks.npy'), mode='w+',
+                                          dtype=MASK_DTYPE, shape=(len(ids),))
+        n_categories, row = None, 0
+        for chunk in chunks:
+            part = db.get_jobs_work_type_masks(chunk)
+            if part is None:
+                break
+            masks[row:row + len(chunk)] = part.masks
+            n_categories, row = part.n_categories, row + len(chunk)
+
+        if row == len(ids):
+            _flush(directory, 'work_type.masks.npy', masks)
+            meta['columns']['work_type']['masks'] = 'work_type.masks.npy'
+            meta['columns']['work_type']['n_categories'] = n_categories
+        else:
+            del masks
+            os.remove(os.path.join(directory, 'work_type.masks.npy'))
+
+    return meta
+
+
+def versions(root: str) -> list[str]:
+    """
+    Version directories of a snapshot root, oldest first.
+    """
+    if not os.path.isdir(root):
+        return []
+    return sorted((name for name in os.listdir(root) if VERSION_PATTERN.match(name)),
+                  key=lambda name: int(VERSION_PATTERN.match(name).group(1)))
+
+
+def current_version(root: str) -> str | None:
+    """
+    Name of the live version, None before the first export.
+    """
+    try:
+        with open(os.path.join(root, CURRENT)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def export_snapshot(db: EmbeddingDB, root: str, tables: list[str] = None,
+                    chunk_size: int = EXPORT_CHUNK_ROWS) -> str:
+    """
+    Write the tables as a new snapshot version and make it the live one.
+
+    Args:
+        db: Database to export
+        root: Snapshot root directory, created when missing
+        tables: Tables to export ('jobs', 'users'), both by default
+        chunk_size: Rows read from SQLite at once
+
+    Returns:
+        Name of the new version
+    """
+    tables = list(tables or TABLES)
+    invalid = set(tables) - set(TABLES)
+    if invalid:
+        raise ValueError(f"Invalid tables: {invalid}. Must be among: {', '.join(TABLES)}")
+
+    os.makedirs(root, exist_ok=True)
+    staging = os.path.join(root, f'.staging-{uuid.uuid4().hex}')
+    os.makedirs(staging)
+
+    try:
+        with instrumentation.stage('snapshot.export'):
+            manifest = {'format': FORMAT_VERSION, 'created_at': time.time(), 'tables': {
+                table: _export_table(db, table, os.path.join(staging, table), chunk_size) for table in tables
+            }}
+        with open(os.path.join(staging, MANIFEST), 'w') as f:
+            json.dump(manifest, f, indent=2)
+        _fsync(os.path.join(staging, MANIFEST))
+
+        # Claim the next version number, renaming onto an existing version fails
+        while True:
+            existing = versions(root)
+            number = int(VERSION_PATTERN.match(existing[-1]).group(1)) + 1 if existing else 1
+            version = f'v{number:06d}'
+            try:
+                os.rename(staging, os.path.join(root, version))
+                break
+            except OSError:
+                if not os.path.exists(os.path.join(root, version)):
+                    raise
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    # Readers see either the previous or the new CURRENT
+    pointer = os.path.join(root, f'.{CURRENT}-{uuid.uuid4().hex}')
+    with open(pointer, 'w') as f:
+        f.write(version)
+    _fsync(pointer)
+    os.replace(pointer, os.path.join(root, CURRENT))
+    return version
+
+
+def prune(root: str, keep: int = 2) -> list[str]:
+    """
+    Delete all but the `keep` newest versions, never the live one.
+    Workers still mapping a deleted version keep reading it until they refresh.
+
+    Returns:
+        Names of the deleted versions
+    """
+    live = current_version(root)
+    existing = versions(root)
+    deleted = [version for version in existing[:max(len(existing) - keep, 0)] if version != live]
+    for version in deleted:
+        shutil.rmtree(os.path.join(root, version))
+    return deleted
+
+
+class snapshot_table:
+    """
+    Memory-mapped columns of one table of a snapshot version.
+    """
+
+    def __init__(self, directory: str, meta: dict):
+        def load(name):
+            return np.load(os.path.join(directory, name), mmap_mode='r')
+
+        self.ids = load(meta['ids'])
+        self.all_columns = meta['all_columns']
+        self.columns = dict()
+        self.masks = dict()
+
+        for column, column_meta in meta['columns'].items():
+            if column_meta['format'] == 'sparse':
+                self.columns[column] = sparse.csr_matrix(
+                    (load(column_meta['data']), load(column_meta['indices']), load(column_meta['indptr'])),
+                    shape=tuple(column_meta['shape']))
+            elif column_meta['format'] == 'int8':
+                self.columns[column] = int8_matrix(load(column_meta['codes']), load(column_meta['scales']))
+            else:
+                self.columns[column] = load(column_meta['matrix'])
+
+            if 'masks' in column_meta:
+                self.masks[column] = (load(column_meta['masks']), column_meta['n_categories'])
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, row_id: int):
+        row = np.searchsorted(self.ids, row_id)
+        return row < len(self.ids) and self.ids[row] == row_id
+
+    def rows(self, ids: list[int]) -> np.ndarray | None:
+        """
+        Row of every id, None when any of them is not in the snapshot.
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        if len(self.ids) == 0:
+            return None if len(ids) else ids
+
+        rows = np.minimum(np.searchsorted(self.ids, ids), len(self.ids) - 1)
+        if not np.array_equal(self.ids[rows], ids):
+            return None
+        return rows
+
+    def get(self, row_id: int) -> dict | None:
+        """
+        Every column of one row as (1, dim) matrices, like EmbeddingDB.get_job_embeddings.
+        int8 rows are dequantized and columns missing from the snapshot are None.
+        """
+        rows = self.rows([row_id])
+        if rows is None:
+            return None
+
+        row = dict.fromkeys(self.all_columns)
+        for column in self.columns:
+            value = self.take([row_id], column)
+            row[column] = value.dequantize() if isinstance(value, int8_matrix) else value
+        return row
+
+    def take(self, ids: list[int], column: str, masks: bool = False):
+        """
+        Candidate matrix of one column in the order of ids, None when any id is missing.
+        Only the selected rows are copied out of the mapping.
+        """
+        rows = self.rows(ids)
+        if rows is None:
+            return None
+        if masks and column in self.masks:
+            values, n_categories = self.masks[column]
+            return category_masks(np.asarray(values[rows]), n_categories)
+
+        matrix = self.columns[column]
+        if isinstance(matrix, int8_matrix):
+            return int8_matrix(np.asarray(matrix.codes[rows]), np.asarray(matrix.scales[rows]))
+        if sparse.issparse(matrix):
+            return matrix[rows]
+        return np.asarray(matrix[rows])
+
+
+class ColumnarSnapshot:
+    """
+    One version of a snapshot root.
+    """
+
+    def __init__(self, path: str):
+        with open(os.path.join(path, MANIFEST)) as f:
+            self.manifest = json.load(f)
+        if self.manifest['format'] != FORMAT_VERSION:
+            raise ValueError(f"Unsupported snapshot format {self.manifest['format']} in {path}")
+
+        self.path = path
+        self.version = os.path.basename(os.path.normpath(path))
+        self.tables = {table: snapshot_table(os.path.join(path, table), meta)
+                       for table, meta in self.manifest['tables'].items()}
+
+
+class SnapshotIndex(db_listener):
+    """
+    Read-only view of the live snapshot version, with the read API of JobIndex
+    for jobs and of EmbeddingDB for users, so it can back a job_recommender.
+
+    The CURRENT file is checked at most every check_interval seconds and a new
+    version is mapped as soon as it appears; calls already running keep the
+    version they started with. Rows written to the database after the export
+    are not in the snapshot: lookups of missing ids return None so callers fall
+    back to the database. With a db, the ids it stores or deletes after the
+    export are treated as missing too, until a version exported after the
+    write is mapped.
+    """
+
+    def __init__(self, root: str, check_interval: float = 1.0, db: EmbeddingDB = None):
+        """
+        Args:
+            root: Snapshot root directory written by export_snapshot
+            check_interval: Seconds between two checks of the live version
+            db: Database the snapshot was exported from, whose writes are followed
+        """
+        self.root = root
+        self.check_interval = check_interval
+        self.snapshot: ColumnarSnapshot | None = None
+        self.checked_at = float('-inf')
+        self.lock = threading.Lock()
+
+        # Ids written or deleted through db, with the time of the write, per table,
+        # and the time of the last rewrite of a whole column of a table
+        self.db = db
+        self.written: dict[str, dict[int, float]] = {table: dict() for table in TABLES}
+        self.rewritten: dict[str, float] = dict()
+
+        self.refresh()
+
+        if self.snapshot is None:
+            raise FileNotFoundError(f"No snapshot in {root}")
+        if db is not None:
+            db.add_listener(self)
+
+    @property
+    def version(self) -> str:
+        return self.snapshot.version
+
+    def close(self):
+        """
+        Stop following database writes.
+        """
+        if self.db is not None:
+            self.db.remove_listener(self)
+
+    def refresh(self) -> bool:
+        """
+        Map the live version if it changed.
+
+        Returns:
+            Whether a new version was mapped
+        """
+        with self.lock:
+            self.checked_at = time.monotonic()
+            version = current_version(self.root)
+            if version is None or (self.snapshot is not None and version == self.snapshot.version):
+                return False
+
+            with instrumentation.stage('snapshot.load'):
+                try:
+                    snapshot = ColumnarSnapshot(os.path.join(self.root, version))
+                except FileNotFoundError:
+                    # The version was pruned after a newer one went live, map that one
+                    if current_version(self.root) == version:
+                        raise
+                    snapshot = ColumnarSnapshot(os.path.join(self.root, current_version(self.root)))
+                self.snapshot = snapshot
+
+                # Writes committed before the export started are in the new version
+                created_at = snapshot.manifest['created_at']
+                for table, written in self.written.items():
+                    self.written[table] = {row_id: at for row_id, at in written.items() if at >= created_at}
+                self.rewritten = {table: at for table, at in self.rewritten.items() if at >= created_at}
+        instrumentation.count('snapshot.swaps')
+        return True
+
+    def _table(self, table: str) -> snapshot_table | None:
+        if time.monotonic() - self.checked_at >= self.check_interval:
+            self.refresh()
+        return self.snapshot.tables.get(table)
+
+    def _stale(self, table: str, ids) -> bool:
+        if table in self.rewritten:
+            return True
+        written = self.written[table]
+        return bool(written) and any(row_id in written for row_id in ids)
+
+    # db_listener API
+
+    def _written(self, table: str, row_id: int):
+        with self.lock:
+            self.written[table][row_id] = time.time()
+
+    def on_job_stored(self, job_id: int, embeddings):
+        self._written('jobs', job_id)
+
+    def on_job_deleted(self, job_id: int):
+        self._written('jobs', job_id)
+
+    def on_user_stored(self, user_id: int, embeddings):
+        self._written('users', user_id)
+
+    def on_column_rewritten(self, table: str, column: str):
+        with self.lock:
+            self.rewritten[table] = time.time()
+
+    # JobIndex API
+
+    def __len__(self):
+        jobs = self._table('jobs')
+        return len(jobs) if jobs is not None else 0
+
+    def __contains__(self, job_id: int):
+        jobs = self._table('jobs')
+        return jobs is not None and job_id in jobs and not self._stale('jobs', [job_id])
+
+    def get_job(self, job_id: int) -> dict | None:
+        jobs = self._table('jobs')
+        if jobs is None or self._stale('jobs', [job_id]):
+            return None
+        return jobs.get(job_id)
+
+    def get_jobs(self, job_ids: list[int], features: list[str] = None) -> dict | None:
+        """
+        Candidate matrices for the given jobs, work types as bitmasks when exported.
+        None when any job or feature is not in the snapshot.
+        """
+        jobs = self._table('jobs')
+        if jobs is None or self._stale('jobs', job_ids):
+            return None
+
+        result = dict()
+        for feature in features or consts.job_recommendation_features:
+            if feature not in jobs.columns:
+                return None
+            matrix = jobs.take(job_ids, feature, masks=True)
+            if matrix is None:
+                return None
+            result[feature] = matrix
+        return result
+
+    # EmbeddingDB users API
+
+    def get_user_embeddings(self, user_id: int) -> dict | None:
+        users = self._table('users')
+        if users is None or self._stale('users', [user_id]):
+            return None
+        return users.get(user_id)
+
+    def get_users_column_embeddings(self, user_ids: list[int], column_name: str):
+        """
+        Same as EmbeddingDB.get_users_column_embeddings, None when any user or the column is missing.
+        """
+        users = self._table('users')
+        if users is None or column_name not in users.columns or self._stale('users', user_ids):
+            return None
+        return users.take(user_ids, column_name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--db', default='Data/embeddings.db', help='Path of the embeddings database')
+    parser.add_argument('--root', default='Data/snapshots', help='Snapshot root directory')
+    parser.add_argument('--tables', nargs='+', choices=list(TABLES), default=list(TABLES))
+    parser.add_argument('--keep', type=int, default=2, help='Versions kept, older ones are deleted')
+    parser.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_ROWS)
+    args = parser.parse_args()
+
+    db = EmbeddingDB(args.db)
+    start = time.perf_counter()
+    version = export_snapshot(db, args.root, args.tables, args.chunk_size)
+    print(f"Exported {version} to {args.root} in {time.perf_counter() - start:.1f}s")
+
+    deleted = prune(args.root, args.keep)
+    if deleted:
+        print(f"Deleted {', '.join(deleted)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,25 @@
 import numpy as np
-from typing import List, Tuple, Optional
+from itertools import islice
+from scipy import sparse
+from typing import Iterable, Iterator, List, Tuple, Optional
+
+from Modules import categorical, quantization, skills
 
 def rename_key(dictionary, old_key, new_key):
     if old_key in dictionary:
         dictionary[new_key] = dictionary.pop(old_key)
 
+def chunked(iterable: Iterable, size: int) -> Iterator[list]:
+    '''
+    Split an iterable into lists of at most `size` items without materializing it.
+    '''
+    if size < 1:
+        raise ValueError(f"size must be positive, got {size}")
+
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
 def normalize(array: np.array):
     '''
     Normalize a numpy array to the range [0, 1].
@@ -16,17 +31,135 @@ def normalize(array: np.array):
     else:
         return np.zeros_like(array)
 
-def filter_recommendations(recommendations: List[Tuple[int, float]], max_recommendations: int, threshold: Optional[float] = None) -> List[int]:
+def normalize_range(array: np.ndarray, low, high) -> np.ndarray:
+    '''
+    Normalize a numpy array with a given minimum and maximum, e.g. taken over a
+    larger array it is a part of. Same values as `normalize` of that array.
+    '''
+    if low != high:
+        return (array - low) / (high - low)
+    return np.zeros_like(array)
+
+def similarity(base, options) -> np.ndarray:
+    '''
+    Dot product of a base embedding with every option embedding.
+    Accepts dense arrays or scipy sparse matrices and returns a dense 1-D array.
+    Reduced-precision options are scored in float32 chunks, category masks bitwise,
+    skill sets by the share of the base's skills they hold.
+    '''
+    if isinstance(options, categorical.category_masks):
+        return categorical.scores(base, options).ravel()
+
+    if isinstance(options, skills.skill_sets):
+        return skills.scores([base], options).ravel()
+
+    if quantization.is_reduced(options):
+        return quantization.scores(base, options).ravel()
+
+    if sparse.issparse(base) or sparse.issparse(options):
+        scores = options @ base.T
+        if sparse.issparse(scores):
+            scores = scores.toarray()
+        return np.asarray(scores).ravel()
+
+    return np.dot(base, options.T).ravel()
+
+def similarity_matrix(bases, options) -> np.ndarray:
+    '''
+    Dot products of every base embedding with every option embedding.
+    Accepts dense arrays or scipy sparse matrices and returns a dense (n_bases, n_options) array.
+    Reduced-precision options are scored in float32 chunks, category masks bitwise,
+    skill sets by the share of each base's skills they hold.
+    '''
+    if isinstance(options, categorical.category_masks):
+        return categorical.scores(bases, options)
+
+    if isinstance(options, skills.skill_sets):
+        return skills.scores(bases, options)
+
+    if quantization.is_reduced(options):
+        return quantization.scores(bases, options)
+
+    if sparse.issparse(options) and not sparse.issparse(bases):
+        # Sparse-dense product with the sparse matrix on the left
+        return np.asarray(options @ np.asarray(bases).T).T
+
+    scores = bases @ options.T
+    if sparse.issparse(scores):
+        scores = scores.toarray()
+    return np.asarray(scores)
+
+def normalize_rows(array: np.ndarray) -> np.ndarray:
+    '''
+    Normalize every row of a 2-D array to the range [0, 1], same as `normalize` applied per row.
+    '''
+    low = array.min(axis=1, keepdims=True)
+    span = array.max(axis=1, keepdims=True) - low
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(span > 0, (array - low) / span, 0)
+
+def top_k(scores: np.ndarray, k: Optional[int] = None, threshold: Optional[float] = None) -> np.ndarray:
+    '''
+    Indices of the `k` highest scores, sorted by descending score.
+    Only scores >= `threshold` are kept when a threshold is given.
+    Uses a partial partition so selecting a page of results is O(n), ties keep input order.
+    '''
+    if threshold is not None:
+        candidates = np.flatnonzero(scores >= threshold)
+    else:
+        candidates = np.arange(len(scores))
+
+    if k is not None and k < len(candidates):
+        if k <= 0:
+            return candidates[:0]
+        # Scores above the k-th best, then the first of the candidates tied with it
+        values = scores[candidates]
+        kth = -np.partition(-values, k - 1)[k - 1]
+        above = np.flatnonzero(values > kth)
+        tied = np.flatnonzero(values == kth)[:k - len(above)]
+        candidates = candidates[np.sort(np.concatenate((above, tied)))]
+
+    order = np.argsort(-scores[candidates], kind='stable')
+    return candidates[order]
+
+def top_k_rows(scores: np.ndarray, k: Optional[int] = None) -> np.ndarray:
+    '''
+    Column indices of the `k` highest scores of every row, sorted by descending score.
+    Row-wise equivalent of `top_k` without a threshold, ties keep input order.
+    '''
+    n_rows, n = scores.shape
+    if k is None or k >= n:
+        candidates = np.broadcast_to(np.arange(n), scores.shape)
+    elif k <= 0:
+        candidates = np.empty((n_rows, 0), dtype=np.intp)
+    else:
+        # Same selection as top_k: scores above the k-th best of the row,
+        # then the first of the columns tied with it
+        kth = -np.partition(-scores, k - 1, axis=1)[:, k - 1:k]
+        above = scores > kth
+        tied = scores == kth
+        needed = k - above.sum(axis=1, keepdims=True)
+        selected = above | (tied & (np.cumsum(tied, axis=1) <= needed))
+        candidates = np.nonzero(selected)[1].reshape(n_rows, k)
+
+    order = np.argsort(-np.take_along_axis(scores, candidates, axis=1), axis=1, kind='stable')
+    return np.take_along_axis(candidates, order, axis=1)
+
+def filter_recommendations(recommendations: List[Tuple[int, float]] | Tuple[np.ndarray, np.ndarray], max_recommendations: int, threshold: Optional[float] = None) -> List[int]:
     """Filter job recommendations based on score threshold and maximum count.
     
     Args:
-        recommendations: List of tuples containing (job_id, score)
+        recommendations: List of tuples containing (job_id, score),
+            or a tuple of (job ids, scores) arrays as returned by job_recommender
         max_recommendations: Maximum number of recommendations to return
         threshold: Minimum score threshold (optional)
     
     Returns:
         List of filtered job IDs
     """
+    if isinstance(recommendations, tuple):
+        recommendations = list(zip(*recommendations))
+
     if not recommendations:
         return []
         
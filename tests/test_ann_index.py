@@ -0,0 +1,22 @@
+import numpy as np
+
+from Benchmarks.common import synthetic_jobs
+from Modules.ann_index import IVFIndex
+from Modules.database import EmbeddingDB
+from Modules.model_handlers import registry
+from Modules.preprocessor import job_embedder
+
+
+def test_stored_jobs_have_the_precision_of_the_column(tmp_path):
+    # TF-IDF titles, so the test does not need the MiniLM weights
+    jobs = job_embedder(vectorizers={'title': registry.get('content_vectorizer')}, sparse=False) \
+        .embed_batch(synthetic_jobs(21, 0))
+    db = EmbeddingDB(str(tmp_path / 'embeddings.db'), quantize={'title': 'float16'})
+    db.store_job_embeddings_batch((job.job_id, job) for job in jobs[:-1])
+
+    index = IVFIndex.build(db, feature='title', n_lists=2)
+    db.store_job_embeddings(jobs[-1].job_id, jobs[-1])
+
+    stored = np.asarray(db.get_job_embeddings(jobs[-1].job_id)['title'], dtype=np.float32).reshape(-1)
+    list_no, position = index.positions[jobs[-1].job_id]
+    np.testing.assert_array_equal(index.lists[list_no].vectors.data[position], stored)
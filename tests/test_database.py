@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+
+from Benchmarks.common import synthetic_jobs
+from Modules.ann_index import IVFIndex
+from Modules.database import EmbeddingDB
+from Modules.job_index import JobIndex
+from Modules.model_handlers import registry
+from Modules.preprocessor import job_embedder
+
+
+@pytest.fixture
+def db(tmp_path):
+    # TF-IDF titles, so the test does not need the MiniLM weights
+    jobs = job_embedder(vectorizers={'title': registry.get('content_vectorizer')}, sparse=False) \
+        .embed_batch(synthetic_jobs(30, 0))
+    db = EmbeddingDB(str(tmp_path / 'embeddings.db'))
+    db.store_job_embeddings_batch((job.job_id, job) for job in jobs)
+    return db
+
+
+def test_rewrite_column_reloads_listeners(db):
+    index = JobIndex(db)
+    ann_index = IVFIndex.build(db, feature='title', n_lists=2)
+    job_ids = db.get_job_ids()
+
+    projection = np.random.default_rng(0).standard_normal((db.get_jobs_column_embeddings(job_ids, 'title').shape[1], 8))
+    assert db.rewrite_column('jobs', 'title', lambda matrix: (matrix @ projection).astype(np.float32),
+                             chunk_size=7) == len(job_ids)
+
+    stored = db.get_jobs_column_embeddings(job_ids, 'title')
+    assert stored.shape == (len(job_ids), 8)
+    np.testing.assert_array_equal(index.get_jobs(job_ids)['title'], stored)
+
+    assert ann_index.dim == 8 and len(ann_index) == len(job_ids)
+    found, _ = ann_index.search(stored[0], k=len(job_ids), n_probe=2)
+    assert sorted(found.tolist()) == sorted(job_ids)
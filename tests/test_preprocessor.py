@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from Models.models import user
+from Modules.model_handlers import registry
+from Modules import preprocessor
+from Modules.preprocessor import obj_preprocessor, user_embedder
+
+
+@pytest.fixture(scope='module')
+def embedder():
+    # TF-IDF titles, so the test does not need the MiniLM weights
+    return user_embedder(vectorizers={'title': registry.get('content_vectorizer')})
+
+
+def make_user(user_id: int, work_types: list[str]) -> user:
+    return user(user_id=user_id, title='data engineer', about='builds data pipelines',
+                preferred_work_types=work_types, experience_level=None, expected_salary=None, skills=None)
+
+
+def test_batched_work_types_match_single_embedding(embedder):
+    # Objects without rows at the end of the batch used to truncate the sum of the last non-empty one
+    work_types = [['FULL_TIME', 'CONTRACT'], [], ['PART_TIME'], [], []]
+    batched = embedder.embed_batch([make_user(i, types) for i, types in enumerate(work_types)])
+
+    for i, types in enumerate(work_types):
+        single = embedder.embed(make_user(i, types))
+        np.testing.assert_array_equal(batched[i].preferred_work_types, single.preferred_work_types)
+
+    categories = registry.get('work_type_encoder').categories_[0].tolist()
+    expected = np.zeros(len(categories))
+    expected[[categories.index('FULL_TIME'), categories.index('CONTRACT')]] = 1
+    np.testing.assert_array_equal(batched[0].preferred_work_types.ravel(), expected)
+
+
+def test_clean_workers_keep_the_lemma_cache_size(monkeypatch):
+    # Workers are created by the pool initializer with the arguments of clean_batch
+    monkeypatch.setattr(preprocessor, '_worker_preprocessor', None)
+    cleaner = obj_preprocessor(lemma_cache_size=128)
+    preprocessor._init_clean_worker(cleaner.fast, cleaner.lemma_cache_size)
+    assert preprocessor._worker_preprocessor.lemmatize_word.cache_info().maxsize == 128
+
+    parallel = cleaner.clean_batch([make_user(i, []) for i in range(3)], ['title', 'about'], n_workers=2, chunk_size=2)
+    serial = cleaner.clean_batch([make_user(i, []) for i in range(3)], ['title', 'about'])
+    assert [(u.title, u.about) for u in parallel] == [(u.title, u.about) for u in serial]
@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+
+from Benchmarks.common import synthetic_jobs, synthetic_users
+from Models.models import weights
+from Modules.database import EmbeddingDB
+from Modules.model_handlers import registry
+from Modules.preprocessor import job_embedder, user_embedder
+from Modules.recommender import job_recommender
+
+
+@pytest.fixture
+def db(tmp_path):
+    # TF-IDF titles, so the test does not need the MiniLM weights
+    vectorizers = {'title': registry.get('content_vectorizer')}
+    jobs = job_embedder(vectorizers=dict(vectorizers)).embed_batch(synthetic_jobs(5, 0))
+    users = user_embedder(vectorizers=dict(vectorizers)).embed_batch(synthetic_users(4, 0))
+
+    db = EmbeddingDB(str(tmp_path / 'embeddings.db'))
+    # Every job stored under 4 ids, so their scores tie exactly
+    db.store_job_embeddings_batch((copy * 100 + i, job) for copy in range(4) for i, job in enumerate(jobs))
+    db.store_user_embeddings_batch((user.user_id, user) for user in users)
+    return db
+
+
+@pytest.mark.parametrize('top_k', [1, 3, 6, 10, None])
+def test_batch_and_single_rankings_agree_on_ties(db, top_k):
+    recommender = job_recommender(db)
+    user_ids = db.get_user_ids()
+    jobs_ids = np.random.default_rng(0).permutation(db.get_job_ids()).tolist()
+
+    batch_ids, batch_scores = recommender.users_job_recommend(user_ids, jobs_ids, weights(), top_k=top_k)
+    for row, user_id in enumerate(user_ids):
+        ids, scores = recommender.user_job_recommend(user_id, jobs_ids, weights(), top_k=top_k)
+        np.testing.assert_array_equal(batch_ids[row], ids)
+        np.testing.assert_allclose(batch_scores[row], scores, rtol=1e-6)
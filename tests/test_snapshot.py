@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from Benchmarks.common import synthetic_jobs, synthetic_users
+from Modules import snapshot
+from Modules.database import EmbeddingDB
+from Modules.model_handlers import registry
+from Modules.preprocessor import job_embedder, user_embedder
+
+
+@pytest.fixture
+def embedded():
+    # TF-IDF titles, so the test does not need the MiniLM weights
+    vectorizers = {'title': registry.get('content_vectorizer')}
+    jobs = job_embedder(vectorizers=dict(vectorizers)).embed_batch(synthetic_jobs(20, 0))
+    users = user_embedder(vectorizers=dict(vectorizers)).embed_batch(synthetic_users(3, 0))
+    return jobs, users
+
+
+@pytest.fixture
+def db(tmp_path, embedded):
+    jobs, users = embedded
+    db = EmbeddingDB(str(tmp_path / 'embeddings.db'))
+    db.store_job_embeddings_batch((job.job_id, job) for job in jobs)
+    db.store_user_embeddings_batch((user.user_id, user) for user in users)
+    return db
+
+
+def test_writes_after_export_are_not_served(db, embedded, tmp_path):
+    jobs, users = embedded
+    job_ids = [job.job_id for job in jobs]
+    user_ids = [user.user_id for user in users]
+
+    root = str(tmp_path / 'snapshots')
+    snapshot.export_snapshot(db, root)
+    index = snapshot.SnapshotIndex(root, check_interval=float('inf'), db=db)
+    assert index.get_jobs(job_ids) is not None
+
+    # Stored again, the snapshot row is outdated
+    db.store_job_embeddings(job_ids[0], jobs[1])
+    assert job_ids[0] not in index
+    assert index.get_job(job_ids[0]) is None
+    assert index.get_jobs(job_ids) is None
+    assert index.get_jobs(job_ids[1:]) is not None
+
+    db.store_user_embeddings(user_ids[0], users[1])
+    assert index.get_user_embeddings(user_ids[0]) is None
+    assert index.get_users_column_embeddings(user_ids, 'title') is None
+    assert index.get_users_column_embeddings(user_ids[1:], 'title') is not None
+
+    # Deleted, the snapshot still holds the row
+    db.delete_job_embeddings(job_ids[1])
+    assert index.get_job(job_ids[1]) is None
+
+    # A version exported after the writes serves them again
+    snapshot.export_snapshot(db, root)
+    assert index.refresh()
+    assert index.get_jobs(job_ids[2:]) is not None
+    np.testing.assert_array_equal(index.get_job(job_ids[0])['title'], db.get_job_embeddings(job_ids[0])['title'])
+    assert index.get_user_embeddings(user_ids[0]) is not None
+    assert job_ids[1] not in index
+
+    index.close()
+    db.delete_job_embeddings(job_ids[2])
+    assert index.get_job(job_ids[2]) is not None